@@ -1,12 +1,24 @@
 from django.contrib import admin
-from .models import Chat, Message
+from .models import Chat, Message, ChatReadState, ChatDeletionJob
 
 
 @admin.register(Chat)
 class ChatAdmin(admin.ModelAdmin):
     list_display = ('type', 'created_at')
+    readonly_fields = ('last_message_sequence', 'deleted_at')
 
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('chat', 'sender', 'timestamp')
+    ordering = ('-id',)
+
+
+@admin.register(ChatReadState)
+class ChatReadStateAdmin(admin.ModelAdmin):
+    list_display = ('chat', 'user', 'last_read_message_id')
+
+
+@admin.register(ChatDeletionJob)
+class ChatDeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'status', 'deleted_messages', 'total_messages', 'created_at', 'finished_at')
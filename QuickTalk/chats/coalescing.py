@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+from django.conf import settings
+
+
+class GroupEventCoalescer:
+    """
+    Batches the events of busy large groups within one process and sends
+    them as a single `chat_batch` group event, which consumers deliver as
+    one array frame per socket.
+
+    The batching window adapts to the traffic of each group: it grows
+    towards `max_window` as the recent event rate of the group approaches
+    `full_rate` events per second and is zero for a quiet group, whose
+    events are sent at once. The rate decays by half every
+    `rate_half_life` seconds without events. Every `PRUNE_HALF_LIVES`
+    half-lives, groups whose rate has decayed below `MIN_RATE` are
+    forgotten, so the rates of groups that went quiet do not pile up.
+    """
+    PRUNE_HALF_LIVES = 10
+    MIN_RATE = 0.01
+
+    def __init__(self, max_window, full_rate, rate_half_life=1.0):
+        self.max_window = max_window
+        self.full_rate = full_rate
+        self.rate_half_life = rate_half_life
+        self._batches = {}
+        self._in_flight = set()
+        self._rates = {}
+        self._pruned_at = None
+        self._flush_tasks = set()
+        self.events_sent = 0
+        self.batches_sent = 0
+
+    async def send(self, channel_layer, group, event):
+        """
+        Sends the event to the group at once or adds it to the group's
+        pending batch.
+        """
+        loop = asyncio.get_running_loop()
+        window = self.window(group, loop.time())
+        batch = self._batches.get(group)
+        if batch is not None:
+            batch.append(event)
+            return
+        if group in self._in_flight:
+            # Отправится сразу после текущей пачки, чтобы не обогнать её
+            self._batches[group] = [event]
+            return
+        if window <= 0:
+            await self._group_send(channel_layer, group, [event])
+            return
+        self._batches[group] = [event]
+        loop.call_later(window, self._start_flush, channel_layer, group)
+
+    def window(self, group, now):
+        """
+        Records an event of the group and returns the batching window for it.
+        """
+        if self._pruned_at is None:
+            self._pruned_at = now
+        elif now - self._pruned_at >= self.rate_half_life * self.PRUNE_HALF_LIVES:
+            self._prune_rates(now)
+        rate, updated_at = self._rates.get(group, (0.0, now))
+        rate *= 0.5 ** ((now - updated_at) / self.rate_half_life)
+        self._rates[group] = (rate + 1, now)
+        window = self.max_window * min(1.0, rate / self.full_rate)
+        return window if window >= 0.001 else 0.0
+
+    def _prune_rates(self, now):
+        self._pruned_at = now
+        for group, (rate, updated_at) in list(self._rates.items()):
+            if rate * 0.5 ** ((now - updated_at) / self.rate_half_life) < self.MIN_RATE:
+                del self._rates[group]
+
+    async def flush(self, channel_layer, group):
+        """
+        Sends the pending batch of the group, then any events that arrived
+        while it was being sent.
+        """
+        while group not in self._in_flight:
+            events = self._batches.pop(group, None)
+            if not events:
+                return
+            self._in_flight.add(group)
+            try:
+                await self._group_send(channel_layer, group, events)
+            finally:
+                self._in_flight.discard(group)
+
+    async def _group_send(self, channel_layer, group, events):
+        if len(events) == 1:
+            await channel_layer.group_send(group, events[0])
+        else:
+            await channel_layer.group_send(group, {
+                'type': 'chat_batch',
+                'event_id': uuid.uuid4().hex,
+                'events': events,
+            })
+        self.events_sent += len(events)
+        self.batches_sent += 1
+
+    def _start_flush(self, channel_layer, group):
+        task = asyncio.get_running_loop().create_task(self.flush(channel_layer, group))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def stats(self):
+        return {
+            'events_sent': self.events_sent,
+            'batches_sent': self.batches_sent,
+            'pending_groups': len(self._batches),
+            'tracked_groups': len(self._rates),
+        }
+
+
+_coalescer = None
+
+
+def get_group_event_coalescer():
+    """
+    Returns the per-process group event coalescer, creating it on first use.
+    """
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = GroupEventCoalescer(
+            max_window=settings.CHAT_COALESCE_MAX_WINDOW,
+            full_rate=settings.CHAT_COALESCE_FULL_RATE,
+        )
+    return _coalescer
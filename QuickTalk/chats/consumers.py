@@ -1,10 +1,539 @@
-import json
+import asyncio
+import logging
+import uuid
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
 from .models import Message, Chat
+from .persistence import get_message_buffer
+from .coalescing import get_group_event_coalescer
+from .throttling import throttle_inbound_frame, websocket_counters
+from .encoding import (
+    SUBPROTOCOL_WIRE_FORMATS,
+    WIRE_FORMAT_JSON,
+    select_subprotocol,
+    encode_frame,
+    decode_frame,
+    encoded_frame_cache,
+)
 from channels.db import database_sync_to_async
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+logger = logging.getLogger(__name__)
+
+
+def get_client_message_id(frame):
+    """
+    Returns the client-supplied idempotency key of an incoming frame, if valid.
+    """
+    client_message_id = frame.get('client_message_id')
+    if isinstance(client_message_id, str) and 0 < len(client_message_id) <= 64:
+        return client_message_id
+    return None
+
+
+# Код закрытия соединения, не успевающего читать кадры
+OUTBOUND_OVERFLOW_CLOSE_CODE = 4008
+
+_OVERFLOW = object()
+_CLOSE = object()
+
+
+def chat_group_name(chat_id):
+    """
+    Returns the channel layer group name for a chat.
+    """
+    return f'chat_{chat_id}'
+
+
+class BaseChatConsumer(AsyncWebsocketConsumer):
+    """
+    Base WebSocket consumer with the message handling shared by chat consumers:
+    storing messages, broadcasting them to chat groups and forwarding
+    group events to the socket.
+    """
+
+    wire_format = WIRE_FORMAT_JSON
+    outbound = None
+    outbound_writer = None
+
+    async def accept_with_negotiated_format(self):
+        """
+        Accepts the connection with the first supported subprotocol offered by
+        the client (msgpack or compact JSON), falling back to plain JSON frames,
+        and starts writing outgoing frames from the outbound queue.
+        """
+
+        subprotocol = select_subprotocol(self.scope.get('subprotocols', []))
+        self.wire_format = SUBPROTOCOL_WIRE_FORMATS.get(subprotocol, WIRE_FORMAT_JSON)
+        await self.accept(subprotocol=subprotocol)
+        self.outbound = asyncio.Queue()
+        self.outbound_overflowed = False
+        self.resume_cursor = {}
+        self.outbound_writer = asyncio.ensure_future(self.write_outbound())
+
+    async def send_frame(self, frame, cache_key=None):
+        """
+        Encodes a frame in the connection's wire format and queues it for
+        the socket. Frames with a `cache_key` (the group event ID) are
+        encoded once per process and format.
+        """
+
+        if cache_key is None:
+            encoded = encode_frame(frame, self.wire_format)
+        else:
+            encoded = encoded_frame_cache.encode(cache_key, frame, self.wire_format)
+        if self.outbound is None:
+            await self.send_encoded(encoded)
+        else:
+            self.enqueue_frame(encoded, frame)
+
+    async def send_encoded(self, encoded):
+        if isinstance(encoded, bytes):
+            await self.send(bytes_data=encoded)
+        else:
+            await self.send(text_data=encoded)
+
+    def enqueue_frame(self, encoded, frame):
+        """
+        Queues an encoded frame. When the client reads slower than frames
+        arrive and CHAT_OUTBOUND_QUEUE_SIZE frames are waiting, either the
+        oldest frame is dropped or, with the `disconnect` policy, the queue
+        is discarded and the connection is closed with a resume cursor.
+        """
+
+        if self.outbound_overflowed:
+            websocket_counters['dropped_frames'] += 1
+            return
+        if self.outbound.qsize() >= settings.CHAT_OUTBOUND_QUEUE_SIZE:
+            if settings.CHAT_OUTBOUND_OVERFLOW_POLICY == 'disconnect':
+                self.overflow_outbound()
+                return
+            self.outbound.get_nowait()
+            websocket_counters['dropped_frames'] += 1
+        self.outbound.put_nowait((encoded, frame))
+
+    def overflow_outbound(self):
+        dropped = 1
+        while not self.outbound.empty():
+            self.outbound.get_nowait()
+            dropped += 1
+        websocket_counters['dropped_frames'] += dropped
+        websocket_counters['overflow_disconnects'] += 1
+        self.outbound_overflowed = True
+        self.outbound.put_nowait((_OVERFLOW, None))
+
+    async def write_outbound(self):
+        """
+        Sends queued frames to the socket one at a time and remembers the
+        last message ID delivered in each chat.
+        """
+
+        while True:
+            encoded, frame = await self.outbound.get()
+            if encoded is _CLOSE:
+                await super().close(*frame)
+                return
+            if encoded is _OVERFLOW:
+                # Клиент переподключится с since и получит пропущенное
+                await self.send_encoded(encode_frame({
+                    'type': 'overflow',
+                    'resume': [{'chat_id': chat_id, 'since': since} for chat_id, since in self.resume_cursor.items()],
+                }, self.wire_format))
+                await super().close(OUTBOUND_OVERFLOW_CLOSE_CODE)
+                return
+            await self.send_encoded(encoded)
+            for item in frame if isinstance(frame, list) else [frame]:
+                if item.get('id') is not None and 'chat_id' in item:
+                    self.resume_cursor[item['chat_id']] = max(item['id'], self.resume_cursor.get(item['chat_id'], 0))
+
+    async def close(self, code=None, reason=None):
+        """
+        Closes the socket after the frames already queued for it.
+        """
+
+        if self.outbound_writer is None or self.outbound_writer.done():
+            await super().close(code, reason)
+        else:
+            self.outbound.put_nowait((_CLOSE, (code, reason)))
+
+    async def websocket_disconnect(self, message):
+        if self.outbound_writer is not None:
+            self.outbound_writer.cancel()
+        await super().websocket_disconnect(message)
+
+    async def throttle(self, chat_id=None, control=False):
+        """
+        Charges an inbound frame to the rate limits of the user and, for
+        frames that post to a chat, of the chat; control frames go to the
+        user's control limit instead. Sends an error frame with
+        `retry_after` and returns True when the frame must be dropped.
+        """
+
+        retry_after = throttle_inbound_frame(self.scope['user'].id, chat_id, control)
+        if not retry_after:
+            return False
+        await self.send_frame({
+            'type': 'error',
+            'chat_id': chat_id,
+            'error': 'Rate limit exceeded.',
+            'retry_after': round(retry_after, 3),
+        })
+        return True
+
+    async def send_error(self, chat_id, error):
+        """
+        Sends an error frame for the given chat to the WebSocket.
+        """
+
+        await self.send_frame({'type': 'error', 'chat_id': chat_id, 'error': error})
+
+    async def decode_inbound_frame(self, text_data=None, bytes_data=None, chat_id=None):
+        """
+        Decodes an inbound frame. Sends an error frame and returns None when
+        the frame is not a JSON or msgpack object.
+        """
+
+        try:
+            frame = decode_frame(text_data, bytes_data)
+        except ValueError:
+            frame = None
+        if not isinstance(frame, dict):
+            await self.send_error(chat_id, 'Invalid frame.')
+            return None
+        return frame
+
+    async def send_chat_message(self, chat, user, message_content, client_message_id=None):
+        """
+        Creates a message in the given chat and broadcasts it to the chat group.
+        A retried `client_message_id` broadcasts the already stored message again.
+        """
+
+        if settings.CHAT_MESSAGE_WRITE_BEHIND:
+            await self.send_chat_message_write_behind(chat, user, message_content, client_message_id)
+            return
+
+        # Создаем и сохраняем сообщение
+        try:
+            message = await self.create_message(chat, user, message_content, client_message_id)
+        except Chat.DoesNotExist:
+            await self.reject_deleted_chat(chat.id)
+            return
+
+        # Отправляем сообщение в группу чата
+        await self.send_group_event(
+            chat,
+            {
+                'type': 'chat_message',
+                'event_id': uuid.uuid4().hex,
+                'chat_id': chat.id,
+                'id': message.id,
+                'temp_id': None,
+                'sequence': message.sequence,
+                'client_message_id': message.client_message_id,
+                'message': message.content,
+                'username': message.sender.username,  # Для отображения имени отправителя
+                'user_id': message.sender.id,
+                'timestamp': str(message.timestamp),  # Форматируем временную метку
+            }
+        )
+
+    async def send_chat_message_write_behind(self, chat, user, message_content, client_message_id=None):
+        """
+        Buffers the message for a batched insert and broadcasts it at once
+        under a temporary id. The database id follows in a separate
+        `message_persisted` event once the batch has been flushed.
+        """
+
+        temp_id = uuid.uuid4().hex
+        future = await get_message_buffer().add(
+            Message(chat=chat, sender=user, content=message_content, client_message_id=client_message_id)
+        )
+        await self.send_group_event(
+            chat,
+            {
+                'type': 'chat_message',
+                'event_id': uuid.uuid4().hex,
+                'chat_id': chat.id,
+                'id': None,
+                'temp_id': temp_id,
+                'sequence': None,
+                'client_message_id': client_message_id,
+                'message': message_content,
+                'username': user.username,
+                'user_id': user.id,
+                'timestamp': str(timezone.now()),
+            }
+        )
+        task = asyncio.ensure_future(self.announce_persisted(chat, future, temp_id))
+        self.persist_tasks.add(task)
+        task.add_done_callback(self.persist_tasks.discard)
+
+    async def reject_deleted_chat(self, chat_id):
+        """
+        Reports a message sent to a chat deleted in the meantime and stops
+        delivering the chat.
+        """
+
+        await self.send_frame({'type': 'error', 'chat_id': chat_id, 'error': 'Chat has been deleted.'})
+        await self.leave_chat(chat_id)
+
+    async def send_group_event(self, chat, event):
+        """
+        Sends an event to the chat group, through the per-process coalescer
+        for groups with at least CHAT_COALESCE_MIN_MEMBERS members.
+        """
+
+        min_members = settings.CHAT_COALESCE_MIN_MEMBERS
+        if min_members is not None and getattr(chat, 'member_count', 0) >= min_members:
+            await get_group_event_coalescer().send(self.channel_layer, chat_group_name(chat.id), event)
+        else:
+            await self.channel_layer.group_send(chat_group_name(chat.id), event)
+
+    async def announce_persisted(self, chat, future, temp_id):
+        """
+        Waits for a buffered message to be saved and broadcasts its database id.
+        If the batch could not be saved, broadcasts `message_failed` so that
+        clients retract the message they were already shown.
+        """
+
+        try:
+            message = await future
+        except Chat.DoesNotExist:
+            await self.reject_deleted_chat(chat.id)
+            return
+        except Exception:
+            logger.exception('Failed to save a buffered message of chat %s', chat.id)
+            await self.send_group_event(
+                chat,
+                {
+                    'type': 'message_failed',
+                    'event_id': uuid.uuid4().hex,
+                    'chat_id': chat.id,
+                    'temp_id': temp_id,
+                }
+            )
+            return
+        await self.send_group_event(
+            chat,
+            {
+                'type': 'message_persisted',
+                'event_id': uuid.uuid4().hex,
+                'chat_id': chat.id,
+                'id': message.id,
+                'temp_id': temp_id,
+                'sequence': message.sequence,
+                'timestamp': str(message.timestamp),
+            }
+        )
+
+    async def replay_messages_since(self, chat, since):
+        """
+        Sends the messages of the chat with an ID greater than `since` in
+        bounded batches, then a `replay_done` frame with the last replayed ID.
+        Replay stops after CHAT_REPLAY_MAX_MESSAGES and reports `truncated`,
+        in which case the client should fall back to the history API.
+        """
+
+        batch_size = settings.CHAT_REPLAY_BATCH_SIZE
+        max_messages = settings.CHAT_REPLAY_MAX_MESSAGES
+        last_id = since
+        replayed = 0
+        truncated = False
+        while True:
+            limit = min(batch_size, max_messages - replayed)
+            if limit <= 0:
+                truncated = True
+                break
+            messages = await self.get_messages_after(chat, last_id, limit)
+            for message in messages:
+                await self.send_frame({
+                    'chat_id': chat.id,
+                    'id': message.id,
+                    'temp_id': None,
+                    'sequence': message.sequence,
+                    'client_message_id': message.client_message_id,
+                    'message': message.content,
+                    'username': message.sender.username,
+                    'user_id': message.sender_id,
+                    'timestamp': str(message.timestamp),
+                })
+            if messages:
+                last_id = messages[-1].id
+                replayed += len(messages)
+            if len(messages) < limit:
+                break
+
+        await self.send_frame({
+            'type': 'replay_done',
+            'chat_id': chat.id,
+            'last_id': last_id,
+            'truncated': truncated,
+        })
+
+    async def flush_pending_messages(self):
+        """
+        Saves messages this connection still has in the write-behind buffer.
+        """
+
+        if self.persist_tasks:
+            await get_message_buffer().flush()
+            await asyncio.gather(*self.persist_tasks, return_exceptions=True)
+
+    async def chat_message(self, event):
+        """
+        Called when a message is sent to the chat group.
+        Sends the message data to the WebSocket, including the chat ID, content,
+        sender's username, user ID, and timestamp.
+        """ 
+
+        # Отправляем сообщение обратно в WebSocket
+        await self.send_frame(self.chat_message_frame(event), cache_key=event['event_id'])
+
+    def chat_message_frame(self, event):
+        return {
+            'chat_id': event['chat_id'],
+            'id': event['id'],
+            'temp_id': event['temp_id'],
+            'sequence': event['sequence'],
+            'client_message_id': event['client_message_id'],
+            'message': event['message'],
+            'username': event['username'],
+            'user_id': event['user_id'],
+            'timestamp': event['timestamp'],
+        }
+
+    async def message_persisted(self, event):
+        """
+        Called when a buffered message has been saved.
+        Sends the database id assigned to the message's temporary id.
+        """
+
+        await self.send_frame(self.message_persisted_frame(event), cache_key=event['event_id'])
+
+    def message_persisted_frame(self, event):
+        return {
+            'type': 'message_persisted',
+            'chat_id': event['chat_id'],
+            'id': event['id'],
+            'temp_id': event['temp_id'],
+            'sequence': event['sequence'],
+            'timestamp': event['timestamp'],
+        }
+
+    async def message_failed(self, event):
+        """
+        Called when a buffered message could not be saved.
+        Sends the temporary id of the message to retract.
+        """
+
+        await self.send_frame(self.message_failed_frame(event), cache_key=event['event_id'])
+
+    def message_failed_frame(self, event):
+        return {
+            'type': 'message_failed',
+            'chat_id': event['chat_id'],
+            'temp_id': event['temp_id'],
+        }
+
+    async def chat_batch(self, event):
+        """
+        Called with events of a large group coalesced within a short window.
+        Sends them to the WebSocket as a single array frame.
+        """
+
+        frames = [getattr(self, f"{item['type']}_frame")(item) for item in event['events']]
+        await self.send_frame(frames, cache_key=event['event_id'])
+
+    async def members_changed(self, event):
+        """
+        Called when members were added to or removed from the chat in bulk.
+        Forwards the change to the WebSocket and stops delivering the chat
+        to a user who was removed from it.
+        """
+
+        await self.send_frame({
+            'type': 'members_changed',
+            'chat_id': event['chat_id'],
+            'added': event['added'],
+            'removed': event['removed'],
+        }, cache_key=event['event_id'])
+
+        if self.scope['user'].id in event['removed']:
+            await self.leave_chat(event['chat_id'])
+
+    async def chat_deleted(self, event):
+        """
+        Called when the chat has been deleted.
+        Forwards the deletion to the WebSocket and stops delivering the chat.
+        """
+
+        await self.send_frame({'type': 'chat_deleted', 'chat_id': event['chat_id']}, cache_key=event['event_id'])
+        await self.leave_chat(event['chat_id'])
+
+    async def leave_chat(self, chat_id):
+        """
+        Stops delivering the chat to this connection: leaves the chat group
+        and drops the chat from the subscriptions.
+        """
+
+        if self.subscriptions.pop(chat_id, None) is not None:
+            await self.channel_layer.group_discard(chat_group_name(chat_id), self.channel_name)
+
+    async def get_chat_for_member(self, chat_id, user):
+        """
+        Retrieves the chat instance by its ID if the user is a member of it,
+        otherwise returns None. With coalescing enabled, the chat carries its
+        `member_count`.
+        """
+
+        chats = Chat.objects.filter(id=chat_id, users=user)
+        if settings.CHAT_COALESCE_MIN_MEMBERS is not None:
+            member_count = (
+                Chat.users.through.objects
+                .filter(chat_id=OuterRef('pk'))
+                .values('chat_id')
+                .annotate(count=Count('*'))
+                .values('count')
+            )
+            chats = chats.annotate(member_count=Subquery(member_count))
+        if settings.CHAT_CONSUMER_ORM == 'async':
+            return await chats.afirst()
+        return await database_sync_to_async(chats.first)()
+
+    async def get_messages_after(self, chat, message_id, limit):
+        """
+        Retrieves up to `limit` messages of the chat with an ID greater than `message_id`.
+        """
+
+        messages = (
+            chat.messages
+            .filter(id__gt=message_id)
+            .select_related('sender')
+            .order_by('id')[:limit]
+        )
+        if settings.CHAT_CONSUMER_ORM == 'async':
+            return [message async for message in messages]
+        return await database_sync_to_async(list)(messages)
+
+    async def create_message(self, chat, user, content, client_message_id=None):
+        """
+        Creates a new message in the database with the specified chat, sender, and content.
+        """
+
+        if settings.CHAT_CONSUMER_ORM == 'async':
+            return await Message.objects.acreate_in_chat(chat, user, content, client_message_id)
+        return await database_sync_to_async(Message.objects.create_in_chat)(
+            chat=chat,
+            sender=user,
+            content=content,
+            client_message_id=client_message_id
+        )
+
+
+class ChatConsumer(BaseChatConsumer):
     """
     WebSocket consumer for handling chat functionality in real-time.
     Manages connecting to chat groups, sending and receiving messages,
@@ -14,21 +543,54 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """
         Called when a WebSocket connection is established.
-        Joins the user to a chat group based on the chat ID from the URL route.
-        Accepts the WebSocket connection.
+        Resolves the chat from the URL route once and checks that the user
+        is a member of it, rejecting the connection otherwise.
+        Joins the user to the chat group and accepts the WebSocket connection.
+        If the query string carries `since=<message id>`, replays the messages
+        missed after that ID before live delivery.
         """
 
         self.chat_id = self.scope['url_route']['kwargs']['chat_id']
-        self.room_group_name = f'chat_{self.chat_id}'
+        self.room_group_name = chat_group_name(self.chat_id)
+        self.chat = None
+        self.subscriptions = {}
+        self.persist_tasks = set()
+
+        # Проверяем, что пользователь авторизован и состоит в чате
+        user = self.scope['user']
+        if not user.is_authenticated or not self.chat_id.isdigit():
+            await self.close()
+            return
+        self.chat = await self.get_chat_for_member(self.chat_id, user)
+        if self.chat is None:
+            await self.close()
+            return
 
         # Присоединяемся к группе чата
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        self.subscriptions[self.chat.id] = self.chat
 
         # Принимаем соединение
-        await self.accept()
+        await self.accept_with_negotiated_format()
+
+        # Досылаем пропущенные сообщения при переподключении
+        since = self.get_since()
+        if since is not None:
+            await self.replay_messages_since(self.chat, since)
+
+    def get_since(self):
+        """
+        Reads the `since` message ID from the query string, if present and valid.
+        """
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        since = query.get('since', [None])[0]
+        if since is None or not since.isdigit():
+            return None
+        return int(since)
 
     async def disconnect(self, close_code):
         """
@@ -36,78 +598,151 @@ class ChatConsumer(AsyncWebsocketConsumer):
         Removes the user from the chat group.
         """ 
 
+        if self.chat is None:
+            return
+
+        # Сохраняем сообщения из буфера до закрытия соединения
+        await self.flush_pending_messages()
+
         # Отключаемся от группы чата
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def leave_chat(self, chat_id):
+        """
+        Leaves the chat and closes the connection, which serves only this chat.
+        """
+
+        await super().leave_chat(chat_id)
+        await self.close()
+
+    async def receive(self, text_data=None, bytes_data=None):
         """
         Called when a message is received from the WebSocket.
-        Parses the incoming message, retrieves the user and chat information,
-        creates a message in the database, and broadcasts it to the chat group.
+        Parses the incoming message, creates it in the database for the chat
+        resolved at connect time, and broadcasts it to the chat group.
         """ 
                 
-        text_data_json = json.loads(text_data)
-        message_content = text_data_json['message']
+        if await self.throttle(self.chat.id):
+            return
+        text_data_json = await self.decode_inbound_frame(text_data, bytes_data, self.chat.id)
+        if text_data_json is None:
+            return
+        message_content = text_data_json.get('message')
+        if not isinstance(message_content, str):
+            await self.send_error(self.chat.id, 'Message must be a string.')
+            return
 
         # Получаем текущего пользователя из WebSocket соединения
         user = self.scope['user']
 
-        # Получаем чат по его идентификатору
-        try:
-            chat = await self.get_chat(self.chat_id)
-        except Chat.DoesNotExist:
+        await self.send_chat_message(self.chat, user, message_content, get_client_message_id(text_data_json))
+
+
+class UserChatsConsumer(BaseChatConsumer):
+    """
+    Multiplexed WebSocket consumer: a single connection per user over which
+    the client subscribes to and unsubscribes from chats.
+    Every frame is tagged with the chat ID it belongs to.
+    """
+
+    async def connect(self):
+        """
+        Called when a WebSocket connection is established.
+        Accepts the connection for authenticated users only.
+        """
+
+        self.subscriptions = {}
+        self.persist_tasks = set()
+
+        if not self.scope['user'].is_authenticated:
+            await self.close()
             return
 
-        # Создаем и сохраняем сообщение
-        message = await self.create_message(chat, user, message_content)
+        await self.accept_with_negotiated_format()
 
-        # Отправляем сообщение в группу чата
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message.content,
-                'username': message.sender.username,  # Для отображения имени отправителя
-                'user_id': message.sender.id,
-                'timestamp': str(message.timestamp),  # Форматируем временную метку
-            }
-        )
+    async def disconnect(self, close_code):
+        """
+        Called when the WebSocket connection is closed.
+        Removes the connection from every subscribed chat group.
+        """
 
-    async def chat_message(self, event):
+        await self.flush_pending_messages()
+
+        for chat_id in self.subscriptions:
+            await self.channel_layer.group_discard(
+                chat_group_name(chat_id),
+                self.channel_name
+            )
+        self.subscriptions = {}
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Called when a frame is received from the WebSocket.
+        Dispatches `subscribe`, `unsubscribe` and `message` actions.
         """
-        Called when a message is sent to the chat group.
-        Sends the message data to the WebSocket, including the content,
-        sender's username, user ID, and timestamp.
-        """ 
-        
-        message = event['message']
-        username = event['username']
-        user_id = event['user_id']
-        timestamp = event['timestamp']
 
-        # Отправляем сообщение обратно в WebSocket
-        await self.send(text_data=json.dumps({
-            'message': message,
-            'username': username,
-            'user_id': user_id,
-            'timestamp': timestamp
-        }))
+        text_data_json = await self.decode_inbound_frame(text_data, bytes_data)
+        if text_data_json is None:
+            return
+        action = text_data_json.get('action')
+        try:
+            chat_id = int(text_data_json.get('chat_id'))
+        except (TypeError, ValueError):
+            chat_id = None
+        # Лимит чата расходуют только сообщения, подписки идут в отдельный лимит
+        if await self.throttle(chat_id if action == 'message' else None, action in ('subscribe', 'unsubscribe')):
+            return
+        if chat_id is None:
+            await self.send_error(None, 'Invalid chat ID.')
+            return
+
+        if action == 'subscribe':
+            await self.subscribe(chat_id, text_data_json.get('since'))
+        elif action == 'unsubscribe':
+            await self.unsubscribe(chat_id)
+        elif action == 'message':
+            chat = self.subscriptions.get(chat_id)
+            if chat is None:
+                await self.send_error(chat_id, 'Not subscribed to this chat.')
+                return
+            if not isinstance(text_data_json.get('message'), str):
+                await self.send_error(chat_id, 'Message must be a string.')
+                return
+            await self.send_chat_message(
+                chat,
+                self.scope['user'],
+                text_data_json['message'],
+                get_client_message_id(text_data_json)
+            )
+        else:
+            await self.send_error(chat_id, 'Unknown action.')
 
-    @database_sync_to_async
-    def get_chat(self, chat_id):
+    async def subscribe(self, chat_id, since=None):
         """
-        Retrieves the chat instance from the database based on the chat ID.
+        Joins the chat group if the user is a member of the chat.
+        With `since`, replays the messages missed after that ID.
         """
 
-        return Chat.objects.get(id=chat_id)
+        if chat_id not in self.subscriptions:
+            chat = await self.get_chat_for_member(chat_id, self.scope['user'])
+            if chat is None:
+                await self.send_error(chat_id, 'Chat does not exist or you are not a member.')
+                return
+            await self.channel_layer.group_add(chat_group_name(chat_id), self.channel_name)
+            self.subscriptions[chat_id] = chat
+
+        await self.send_frame({'type': 'subscribed', 'chat_id': chat_id})
+
+        if isinstance(since, int) and since >= 0:
+            await self.replay_messages_since(self.subscriptions[chat_id], since)
 
-    @database_sync_to_async
-    def create_message(self, chat, user, content):
+    async def unsubscribe(self, chat_id):
         """
-        Creates a new message in the database with the specified chat, sender, and content.
-        """    
-        
-        return Message.objects.create(chat=chat, sender=user, content=content)
+        Leaves the chat group.
+        """
+
+        await self.leave_chat(chat_id)
+        await self.send_frame({'type': 'unsubscribed', 'chat_id': chat_id})
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from channels.db import DatabaseSyncToAsync, database_sync_to_async
+
+
+_executor = None
+
+
+def get_database_executor():
+    """
+    Returns the per-process thread pool for database work of WebSocket
+    consumers that must stay sync, creating it on first use.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.CHAT_DB_EXECUTOR_WORKERS,
+            thread_name_prefix='chat-db',
+        )
+    return _executor
+
+
+def database_executor_sync_to_async(func):
+    """
+    Like database_sync_to_async, but runs the function on the dedicated
+    executor of CHAT_DB_EXECUTOR_WORKERS threads instead of the single
+    thread shared by all sync_to_async calls of the process.
+    With CHAT_DB_EXECUTOR_WORKERS set to None, uses the shared thread.
+    """
+    if settings.CHAT_DB_EXECUTOR_WORKERS is None:
+        return database_sync_to_async(func)
+    return DatabaseSyncToAsync(func, thread_sensitive=False, executor=get_database_executor())
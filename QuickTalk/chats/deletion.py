@@ -0,0 +1,104 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from config.response_cache import bump_response_version
+from .events import broadcast_chat_deleted
+from .models import Chat, ChatDeletionJob, ChatNameNgram, ChatReadState, Message
+
+
+logger = logging.getLogger(__name__)
+
+
+def hide_chat_and_schedule_deletion(chat, requested_by):
+    """
+    Hides the chat at once and schedules the purge of its data.
+    Members are removed right away, so the chat disappears from lists and
+    searches, and connected sockets are told to leave it; the personal pair
+    key is released so that the same users can start a new personal chat.
+    """
+    with transaction.atomic():
+        Chat.all_objects.filter(pk=chat.pk).update(
+            deleted_at=timezone.now(),
+            personal_low_user_id=None,
+            personal_high_user_id=None,
+        )
+        memberships = Chat.users.through.objects.filter(chat_id=chat.pk)
+        for user_id in memberships.values_list('customuser_id', flat=True):
+            bump_response_version('user-chats', user_id)
+        memberships.delete()
+        bump_response_version('chat', chat.pk)
+        job = ChatDeletionJob.objects.create(
+            chat_id=chat.pk,
+            requested_by=requested_by,
+            total_messages=Message.objects.filter(chat_id=chat.pk).count(),
+        )
+        # Очистка планируется первой: недоступный слой каналов не должен её отменить
+        transaction.on_commit(lambda: schedule_chat_deletion(job.pk))
+        transaction.on_commit(lambda: broadcast_chat_deleted(chat.pk), robust=True)
+    return job
+
+
+def purge_chat(job_id):
+    """
+    Deletes the messages of a hidden chat in batches of
+    CHAT_DELETION_BATCH_SIZE, each in its own short transaction so that
+    other writers are never blocked for long, then deletes the chat itself.
+    Progress is stored on the job after every batch, and a job interrupted
+    by a restart resumes where it stopped.
+    """
+    job = ChatDeletionJob.objects.get(pk=job_id)
+    if job.status == 'done':
+        return job
+    ChatDeletionJob.objects.filter(pk=job.pk).update(status='running')
+    batch_size = settings.CHAT_DELETION_BATCH_SIZE
+    try:
+        while True:
+            with transaction.atomic():
+                message_ids = list(
+                    Message.objects
+                    .filter(chat_id=job.chat_id)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not message_ids:
+                    break
+                deleted, _ = Message.objects.filter(pk__in=message_ids).delete()
+                ChatDeletionJob.objects.filter(pk=job.pk).update(deleted_messages=F('deleted_messages') + deleted)
+        with transaction.atomic():
+            ChatReadState.objects.filter(chat_id=job.chat_id).delete()
+            ChatNameNgram.objects.filter(chat_id=job.chat_id).delete()
+            Chat.all_objects.filter(pk=job.chat_id).delete()
+            ChatDeletionJob.objects.filter(pk=job.pk).update(status='done', finished_at=timezone.now())
+    except Exception:
+        ChatDeletionJob.objects.filter(pk=job.pk).update(status='failed')
+        raise
+    job.refresh_from_db()
+    return job
+
+
+def _run_purge_in_background(job_id):
+    close_old_connections()
+    try:
+        purge_chat(job_id)
+    except Exception:
+        logger.exception('Chat deletion job %s failed', job_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+
+
+def schedule_chat_deletion(job_id):
+    """
+    Runs the purge of a chat on the per-process deletion worker thread.
+    Jobs run one at a time, so deletions never compete with each other
+    for the write lock.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-deletion')
+    return _executor.submit(_run_purge_in_background, job_id)
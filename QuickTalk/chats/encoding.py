@@ -0,0 +1,120 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+import msgpack
+from django.conf import settings
+
+
+SUBPROTOCOL_MSGPACK = 'quicktalk.msgpack'
+SUBPROTOCOL_COMPACT_JSON = 'quicktalk.compact-json'
+
+WIRE_FORMAT_JSON = 'json'
+WIRE_FORMAT_COMPACT_JSON = 'compact-json'
+WIRE_FORMAT_MSGPACK = 'msgpack'
+
+SUBPROTOCOL_WIRE_FORMATS = {
+    SUBPROTOCOL_MSGPACK: WIRE_FORMAT_MSGPACK,
+    SUBPROTOCOL_COMPACT_JSON: WIRE_FORMAT_COMPACT_JSON,
+}
+
+# Короткие ключи компактных форматов
+COMPACT_KEYS = {
+    'type': 't',
+    'chat_id': 'c',
+    'id': 'i',
+    'temp_id': 'k',
+    'sequence': 'q',
+    'client_message_id': 'x',
+    'message': 'm',
+    'username': 'u',
+    'user_id': 's',
+    'timestamp': 'ts',
+    'last_id': 'l',
+    'truncated': 'tr',
+    'error': 'e',
+    'added': 'a',
+    'removed': 'r',
+    'retry_after': 'ra',
+    'resume': 'rs',
+}
+
+
+def select_subprotocol(subprotocols):
+    """
+    Picks the first subprotocol offered by the client that the server supports.
+    Returns None when the client should get the default JSON frames.
+    """
+    for subprotocol in subprotocols:
+        if subprotocol in SUBPROTOCOL_WIRE_FORMATS:
+            return subprotocol
+    return None
+
+
+def _timestamp_to_epoch_ms(timestamp):
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def _compact_frame(frame):
+    """
+    Renames frame keys to their short form, drops empty values and
+    turns timestamps into epoch milliseconds.
+    """
+    compact = {}
+    for key, value in frame.items():
+        if value is None:
+            continue
+        if key == 'timestamp':
+            value = _timestamp_to_epoch_ms(value)
+        compact[COMPACT_KEYS.get(key, key)] = value
+    return compact
+
+
+def encode_frame(frame, wire_format):
+    """
+    Encodes an outgoing frame, or a list of frames sent as one array frame:
+    JSON text for the JSON formats, bytes for msgpack.
+    """
+    if wire_format == WIRE_FORMAT_JSON:
+        return json.dumps(frame)
+    if isinstance(frame, list):
+        compact = [_compact_frame(item) for item in frame]
+    else:
+        compact = _compact_frame(frame)
+    if wire_format == WIRE_FORMAT_MSGPACK:
+        return msgpack.packb(compact)
+    return json.dumps(compact, separators=(',', ':'))
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """
+    Decodes an incoming frame sent as JSON text or as msgpack bytes.
+    """
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data)
+    return json.loads(text_data)
+
+
+class EncodedFrameCache:
+    """
+    Bounded per-process LRU cache of encoded group events, so that an event
+    delivered to many sockets of one process is encoded once per wire format.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._frames = OrderedDict()
+
+    def encode(self, key, frame, wire_format):
+        cache_key = (key, wire_format)
+        encoded = self._frames.get(cache_key)
+        if encoded is not None:
+            self._frames.move_to_end(cache_key)
+            return encoded
+        encoded = encode_frame(frame, wire_format)
+        self._frames[cache_key] = encoded
+        if len(self._frames) > self.max_size:
+            self._frames.popitem(last=False)
+        return encoded
+
+
+encoded_frame_cache = EncodedFrameCache(max_size=settings.CHAT_ENCODED_FRAME_CACHE_SIZE)
@@ -0,0 +1,36 @@
+import uuid
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .consumers import chat_group_name
+
+
+def broadcast_members_changed(chat_id, added=(), removed=()):
+    """
+    Notifies the consumers connected to a chat that members were added
+    or removed, in a single group event per bulk operation.
+    """
+    async_to_sync(get_channel_layer().group_send)(
+        chat_group_name(chat_id),
+        {
+            'type': 'members_changed',
+            'event_id': uuid.uuid4().hex,
+            'chat_id': chat_id,
+            'added': list(added),
+            'removed': list(removed),
+        }
+    )
+
+
+def broadcast_chat_deleted(chat_id):
+    """
+    Tells the consumers connected to a chat that it has been deleted, so
+    that they stop delivering it and stop accepting messages for it.
+    """
+    async_to_sync(get_channel_layer().group_send)(
+        chat_group_name(chat_id),
+        {
+            'type': 'chat_deleted',
+            'event_id': uuid.uuid4().hex,
+            'chat_id': chat_id,
+        }
+    )
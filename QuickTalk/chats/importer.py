@@ -0,0 +1,270 @@
+import csv
+import datetime
+import gzip
+import json
+import time
+import zlib
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from phonenumbers import NumberParseException
+from phonenumber_field.phonenumber import PhoneNumber
+from config.response_cache import bump_response_version
+from users.models import CustomUser
+from .models import Chat, Message
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+
+# Ошибки распаковки повреждённого или обрезанного архива
+ARCHIVE_READ_ERRORS = (EOFError, gzip.BadGzipFile, zlib.error)
+
+
+class ImportArchiveError(ValueError):
+    """
+    Raised when a line of an import archive cannot be read. `line` is the
+    1-based line number and `imported` the number of messages imported
+    before the error.
+    """
+
+    def __init__(self, reason, line):
+        super().__init__(f'Line {line}: {reason}')
+        self.reason = reason
+        self.line = line
+        self.imported = 0
+
+
+def iter_ndjson_rows(lines):
+    """
+    Yields one dict per non-empty line of an NDJSON archive.
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = loads(line)
+        except ValueError as exc:
+            raise ImportArchiveError(f'invalid JSON ({exc})', line_number)
+        if not isinstance(row, dict):
+            raise ImportArchiveError('expected a JSON object', line_number)
+        yield row
+
+
+def iter_csv_rows(lines):
+    """
+    Yields one dict per row of a CSV archive with a header line.
+    """
+    reader = csv.DictReader(lines)
+    try:
+        yield from reader
+    except csv.Error as exc:
+        raise ImportArchiveError(f'invalid CSV ({exc})', reader.line_num)
+
+
+def iter_import_rows(lines, import_format):
+    if import_format == 'csv':
+        return iter_csv_rows(lines)
+    return iter_ndjson_rows(lines)
+
+
+def detect_import_format(name):
+    """
+    Guesses the archive format from a file name such as `chat.csv.gz`.
+    """
+    name = name.lower().removesuffix('.gz')
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def iter_archive_lines(fileobj):
+    """
+    Yields the lines of a binary archive decoded as UTF-8 one at a time,
+    so that a decoding or decompression error names the line it hit.
+    """
+    line_number = 0
+    lines = iter(fileobj)
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except ARCHIVE_READ_ERRORS as exc:
+            raise ImportArchiveError(f'unreadable archive ({exc})', line_number + 1)
+        line_number += 1
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError as exc:
+            raise ImportArchiveError(f'not UTF-8 ({exc})', line_number)
+        yield text
+
+
+def open_import_archive(fileobj, name):
+    """
+    Reads a binary file as UTF-8 lines, decompressing `.gz` archives on the fly.
+    """
+    if name.lower().endswith('.gz'):
+        fileobj = gzip.open(fileobj, 'rb')
+    return iter_archive_lines(fileobj)
+
+
+class ChatHistoryImporter:
+    """
+    Loads historical messages into a chat from rows with `phone_number`,
+    `content`, `timestamp` (ISO 8601) and an optional external `id`.
+
+    Rows are inserted with bulk_create in batches, one transaction per
+    batch, bypassing Message.save(), validation and signals. Senders are
+    looked up by phone number once per batch and kept in memory for the
+    rest of the import, and become members of the chat. The external `id`
+    is stored as the client message ID, so re-running an interrupted
+    import skips the rows that were already loaded.
+    """
+
+    def __init__(self, chat, batch_size, progress=None):
+        self.chat = chat
+        self.batch_size = batch_size
+        self.progress = progress
+        self.phone_numbers = {}
+        self.sender_ids = {}
+        self.member_ids = set(Chat.users.through.objects.filter(chat_id=chat.pk).values_list('customuser_id', flat=True))
+        self.imported = 0
+        self.skipped = 0
+        self.started_at = None
+
+    def run(self, rows):
+        """
+        Imports all rows and returns the import statistics.
+        Raises ImportArchiveError for an unreadable row; the batches
+        imported before it are kept.
+        """
+        self.started_at = time.perf_counter()
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch)
+                    batch = []
+            if batch:
+                self._import_batch(batch)
+        except ImportArchiveError as exc:
+            # Уже сохранённые пачки остаются, повторный импорт их пропустит
+            exc.imported = self.imported
+            raise
+        finally:
+            bump_response_version('chat', self.chat.pk)
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.imported / elapsed) if elapsed else 0,
+        }
+
+    def _import_batch(self, rows):
+        parsed = []
+        for row in rows:
+            phone_number = self._normalize_phone_number(row.get('phone_number'))
+            timestamp = self._parse_timestamp(row.get('timestamp'))
+            content = row.get('content')
+            if phone_number is None or timestamp is None or not content:
+                self.skipped += 1
+                continue
+            external_id = row.get('id')
+            parsed.append((phone_number, str(content), timestamp, str(external_id)[:64] if external_id else None))
+
+        self._resolve_senders({phone_number for phone_number, *_ in parsed})
+        already_imported = self._get_already_imported({external_id for *_, external_id in parsed if external_id})
+        messages = []
+        for phone_number, content, timestamp, external_id in parsed:
+            sender_id = self.sender_ids.get(phone_number)
+            if sender_id is None or (sender_id, external_id) in already_imported:
+                self.skipped += 1
+                continue
+            if external_id:
+                # Повтор внутри пачки не должен занимать номер последовательности
+                already_imported.add((sender_id, external_id))
+            messages.append(Message(
+                chat_id=self.chat.pk,
+                sender_id=sender_id,
+                content=content,
+                timestamp=timestamp,
+                client_message_id=external_id,
+            ))
+
+        inserted = 0
+        with transaction.atomic():
+            if messages:
+                first_sequence = self.chat.allocate_message_sequences(len(messages))
+                for offset, message in enumerate(messages):
+                    message.sequence = first_sequence + offset
+                Message.objects.bulk_create(messages, ignore_conflicts=True)
+                # Строки, пропущенные из-за конфликта с параллельной записью, не считаем
+                inserted = Message.objects.filter(
+                    chat_id=self.chat.pk,
+                    sequence__gte=first_sequence,
+                    sequence__lt=first_sequence + len(messages),
+                ).count()
+            new_member_ids = {message.sender_id for message in messages} - self.member_ids
+            if new_member_ids:
+                Chat.users.through.objects.bulk_create(
+                    [Chat.users.through(chat_id=self.chat.pk, customuser_id=user_id) for user_id in new_member_ids],
+                    ignore_conflicts=True,
+                )
+                self.member_ids |= new_member_ids
+        self.imported += inserted
+        self.skipped += len(messages) - inserted
+        if self.progress:
+            self.progress(self.stats())
+
+    def _resolve_senders(self, phone_numbers):
+        unknown = [phone_number for phone_number in phone_numbers if phone_number not in self.sender_ids]
+        if not unknown:
+            return
+        found = {
+            phone_number.as_e164: user_id
+            for phone_number, user_id in CustomUser.objects.filter(phone_number__in=unknown).values_list('phone_number', 'id')
+        }
+        for phone_number in unknown:
+            # Неизвестные номера тоже кэшируем, чтобы не искать их повторно
+            self.sender_ids[phone_number] = found.get(phone_number)
+
+    def _get_already_imported(self, external_ids):
+        if not external_ids:
+            return set()
+        return set(
+            Message.objects
+            .filter(chat_id=self.chat.pk, client_message_id__in=external_ids)
+            .values_list('sender_id', 'client_message_id')
+        )
+
+    def _normalize_phone_number(self, value):
+        if not value:
+            return None
+        value = str(value)
+        if value not in self.phone_numbers:
+            try:
+                phone_number = PhoneNumber.from_string(value)
+            except NumberParseException:
+                phone_number = None
+            self.phone_numbers[value] = phone_number.as_e164 if phone_number and phone_number.is_valid() else None
+        return self.phone_numbers[value]
+
+    def _parse_timestamp(self, value):
+        if not value:
+            return None
+        try:
+            timestamp = parse_datetime(str(value))
+        except ValueError:
+            return None
+        if timestamp is not None and timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, datetime.timezone.utc)
+        return timestamp
@@ -0,0 +1,347 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+import uuid
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from channels_redis.core import RedisChannelLayer
+from channels_redis.utils import decode_hosts
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalFanoutChannelLayer(BaseChannelLayer):
+    """
+    Channel layer that delivers group messages to the sockets of this
+    process in memory and crosses process boundaries through an inner
+    layer (RedisChannelLayer in production) once per remote process.
+
+    Instead of every connection, the inner layer's groups hold one fanout
+    channel per process that has members in the group. `group_send`
+    hands the message straight to the local members and sends it once to
+    the fanout channel of every other process in the group, which passes
+    it on to its own members. An inner layer that cannot list the channels
+    of a group (no `group_channels` method) gets a plain inner
+    `group_send`, and the copy that comes back to this process is dropped. Channels passed to
+    `group_add` must belong to this process, as a consumer's own
+    `channel_name` always does.
+
+    The inner layer drops group memberships older than its `group_expiry`.
+    The fanout channel's membership is therefore renewed on every local
+    `group_add` and, for every group with local members, every
+    `refresh_interval` seconds (half of the inner `group_expiry` by default).
+    """
+    extensions = ['groups', 'flush']
+
+    def __init__(self, inner, expiry=60, capacity=100, channel_capacity=None, refresh_interval=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.inner = import_string(inner['BACKEND'])(**inner.get('CONFIG', {}))
+        self.refresh_interval = refresh_interval or getattr(self.inner, 'group_expiry', 86400) / 2
+        self.local_groups = {}
+        self.fanout_channel = None
+        self._fanout_task = None
+        self._refresh_task = None
+        self._fanout_lock = None
+        self.local_deliveries = 0
+        self.remote_publishes = 0
+
+    async def send(self, channel, message):
+        await self.inner.send(channel, message)
+
+    async def receive(self, channel):
+        return await self.inner.receive(channel)
+
+    async def new_channel(self, prefix='specific'):
+        return await self.inner.new_channel(prefix)
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._ensure_fanout()
+        self.local_groups.setdefault(group, set()).add(channel)
+        # Продлеваем членство канала процесса при каждом подключении
+        await self.inner.group_add(group, self.fanout_channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        members = self.local_groups.get(group)
+        if not members:
+            return
+        members.discard(channel)
+        if not members:
+            del self.local_groups[group]
+            await self.inner.group_discard(group, self.fanout_channel)
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), 'Group name not valid'
+        await self._deliver_to_local_members(group, message)
+        envelope = {
+            'type': 'fanout.group_message',
+            'origin': self.fanout_channel,
+            'group': group,
+            'message': message,
+        }
+        group_channels = getattr(self.inner, 'group_channels', None)
+        if group_channels is None:
+            await self.inner.group_send(group, envelope)
+            self.remote_publishes += 1
+            return
+        # Свой канал пропускаем: если других процессов нет, во внешний слой не ходим
+        for channel in await group_channels(group):
+            if channel == self.fanout_channel:
+                continue
+            try:
+                await self.inner.send(channel, envelope)
+            except ChannelFull:
+                logger.info('Fanout channel %s of group %s is over capacity', channel, group)
+                continue
+            self.remote_publishes += 1
+
+    async def flush(self):
+        await self.close()
+        self.local_groups = {}
+        self.fanout_channel = None
+        await self.inner.flush()
+
+    async def close(self):
+        """
+        Stops receiving messages of other processes.
+        """
+        for task in (self._fanout_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._fanout_task = None
+        self._refresh_task = None
+
+    async def _ensure_fanout(self):
+        if self._fanout_lock is None:
+            self._fanout_lock = asyncio.Lock()
+        async with self._fanout_lock:
+            if self.fanout_channel is None:
+                self.fanout_channel = await self.inner.new_channel('fanout')
+            if self._fanout_task is None or self._fanout_task.done():
+                self._fanout_task = asyncio.ensure_future(self._receive_fanout())
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.ensure_future(self._refresh_memberships())
+
+    async def _refresh_memberships(self):
+        """
+        Renews the inner membership of the fanout channel in every group
+        with local members before the inner layer expires it.
+        """
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for group in list(self.local_groups):
+                try:
+                    await self.inner.group_add(group, self.fanout_channel)
+                except Exception:
+                    logger.exception('Failed to refresh the membership of group %s', group)
+
+    async def _receive_fanout(self):
+        """
+        Passes group messages published by other processes to local members.
+        """
+        while True:
+            try:
+                envelope = await self.inner.receive(self.fanout_channel)
+                if envelope.get('origin') == self.fanout_channel:
+                    continue
+                await self._deliver_to_local_members(envelope['group'], envelope['message'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Failed to fan out a group message')
+
+    async def _deliver_to_local_members(self, group, message):
+        for channel in list(self.local_groups.get(group, ())):
+            await self._deliver_local(channel, dict(message))
+            self.local_deliveries += 1
+
+    async def _deliver_local(self, channel, message):
+        """
+        Puts the message straight into the in-process queue that
+        RedisChannelLayer.receive reads the channel's messages from. The
+        layer has no public method for this, so channels-redis is pinned
+        to 4.2.0 in requirements.txt; check `receive_buffer` before
+        upgrading it. Other inner layers get a regular `send`.
+        """
+        receive_buffer = getattr(self.inner, 'receive_buffer', None)
+        if isinstance(self.inner, RedisChannelLayer) and receive_buffer is not None:
+            receive_buffer[channel].put_nowait(message)
+        else:
+            await self.inner.send(channel, message)
+
+
+class ConsistentHashRing:
+    """
+    Hash ring with virtual nodes. Adding a node moves only the keys that
+    the new node takes over, about 1/N of them; all other keys keep their
+    node.
+    """
+
+    def __init__(self, nodes, replicas=160):
+        points = sorted(
+            (self.hash(f'{name}#{replica}'), value)
+            for name, value in nodes.items()
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._values = [value for _, value in points]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf8')).digest()[:8], 'big')
+
+    def get(self, key):
+        """
+        Returns the value of the node that owns the key.
+        """
+        index = bisect.bisect(self._hashes, self.hash(key)) % len(self._hashes)
+        return self._values[index]
+
+    def nodes(self):
+        return set(self._values)
+
+
+def shard_name(host):
+    """
+    Returns a stable name for a Redis host entry, independent of its
+    position in the hosts list.
+    """
+    if 'address' in host:
+        return host['address']
+    return f"redis://{host.get('host', 'localhost')}:{host.get('port', 6379)}/{host.get('db', 0)}"
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer that spreads groups over several Redis shards with a
+    consistent hash ring, so a group such as `chat_<id>` is placed by its
+    chat and adding a shard moves only the groups the new shard takes over.
+    Connection pools are created lazily per shard and reused, as in
+    RedisChannelLayer.
+
+    Process-specific channels carry the ID of their shard in their name,
+    so they never move while the process is alive.
+
+    Adding a shard without dropping live groups:
+
+    1. Deploy with the new shard added to `hosts` and the old list in
+       `previous_hosts`. A group that still lives on its previous shard is
+       copied to the new one the first time this process adds to or sends
+       to it, and `group_discard` removes the channel on both shards.
+    2. Run `manage.py rebalance_channel_layer` to move the remaining
+       groups and delete their old copies.
+    3. Remove `previous_hosts`.
+    """
+
+    def __init__(self, hosts=None, previous_hosts=None, replicas=160, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        names = [shard_name(host) for host in self.hosts]
+        self.ring = ConsistentHashRing({name: index for index, name in enumerate(names)}, replicas)
+        self.shard_ids = {self._shard_id(name): index for index, name in enumerate(names)}
+        self.previous_ring = None
+        if previous_hosts:
+            previous_names = [shard_name(host) for host in decode_hosts(previous_hosts)]
+            unknown = set(previous_names) - set(names)
+            if unknown:
+                raise ValueError(f'Previous hosts must also be listed in hosts: {sorted(unknown)}')
+            self.previous_ring = ConsistentHashRing({name: names.index(name) for name in previous_names}, replicas)
+        # Префикс каналов процесса указывает на его шард
+        uid = uuid.uuid4().hex
+        self.client_prefix = f'{self._shard_id(names[self.ring.get(uid)])}_{uid}'
+        self._moved_groups = set()
+
+    @staticmethod
+    def _shard_id(name):
+        return hashlib.md5(name.encode('utf8')).hexdigest()[:8]
+
+    def consistent_hash(self, value):
+        if '!' in value:
+            client_prefix = self.non_local_name(value)[:-1].rsplit('.', 1)[-1]
+            index = self.shard_ids.get(client_prefix.split('_', 1)[0])
+            if index is not None:
+                return index
+            value = self.non_local_name(value)
+        if self.ring_size == 1:
+            return 0
+        return self.ring.get(value)
+
+    def previous_shard(self, group):
+        """
+        Returns the shard that held the group before the last resharding,
+        or None when it has not moved.
+        """
+        if self.previous_ring is None:
+            return None
+        index = self.previous_ring.get(group)
+        return None if index == self.consistent_hash(group) else index
+
+    async def group_add(self, group, channel):
+        await self._move_group(group)
+        await super().group_add(group, channel)
+
+    async def group_discard(self, group, channel):
+        await super().group_discard(group, channel)
+        index = self.previous_shard(group)
+        if index is not None:
+            await self.connection(index).zrem(self._group_key(group), channel)
+
+    async def group_send(self, group, message):
+        await self._move_group(group)
+        await super().group_send(group, message)
+
+    async def group_channels(self, group):
+        """
+        Returns the channels of the group whose membership has not expired.
+        """
+        await self._move_group(group)
+        connection = self.connection(self.consistent_hash(group))
+        channels = await connection.zrangebyscore(
+            self._group_key(group), min=int(time.time()) - self.group_expiry, max='+inf'
+        )
+        return [channel.decode('utf8') for channel in channels]
+
+    async def rebalance(self):
+        """
+        Moves every group left on its previous shard to its current one
+        and returns the number of groups moved.
+        """
+        if self.previous_ring is None:
+            return 0
+        moved = 0
+        group_prefix = self._group_key('')
+        for index in sorted(self.previous_ring.nodes()):
+            connection = self.connection(index)
+            async for key in connection.scan_iter(match=group_prefix + b'*'):
+                group = key[len(group_prefix):].decode('utf8')
+                if self.previous_shard(group) == index:
+                    await self._copy_group(group, index)
+                    await connection.delete(key)
+                    moved += 1
+        return moved
+
+    async def _move_group(self, group):
+        if self.previous_ring is None or group in self._moved_groups:
+            return
+        index = self.previous_shard(group)
+        if index is not None:
+            await self._copy_group(group, index)
+        self._moved_groups.add(group)
+
+    async def _copy_group(self, group, index):
+        key = self._group_key(group)
+        members = await self.connection(index).zrange(key, 0, -1, withscores=True)
+        if members:
+            # Не перезаписываем более свежие записи на новом шарде
+            connection = self.connection(self.consistent_hash(group))
+            await connection.zadd(key, dict(members), nx=True)
+            await connection.expire(key, self.group_expiry)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from chats import db, throttling
+from chats.models import Chat
+from chats.routing import websocket_urlpatterns
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    """
+    Measures WebSocket messages per second of one process for the sync and
+    the async ORM consumer paths.
+    """
+    help = 'Benchmarks messages/second of the sync and async ORM paths of ChatConsumer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20, help='Concurrent sockets, one chat each.')
+        parser.add_argument('--messages', type=int, default=50, help='Messages sent by every socket.')
+        parser.add_argument('--workers', type=int, default=4, help='Threads of the dedicated database executor.')
+
+    def handle(self, *args, **options):
+        # Тестовые данные удаляются вместе с пользователем
+        user = CustomUser.objects.create_user(phone_number=f'+1202555{uuid.uuid4().int % 10000:04d}', password=None)
+        try:
+            chats = []
+            for i in range(options['clients']):
+                chat = Chat.objects.create(type='group', name=f'benchmark {i}', created_by=user)
+                chat.users.add(user)
+                chats.append(chat)
+            for path in ('sync', 'async'):
+                rate = self.run_path(path, user, chats, options)
+                self.stdout.write(f'{path}: {rate:.0f} messages/s')
+        finally:
+            Chat.all_objects.filter(created_by=user).delete()
+            user.delete()
+
+    def run_path(self, path, user, chats, options):
+        with override_settings(
+            CHAT_CONSUMER_ORM=path,
+            CHAT_DB_EXECUTOR_WORKERS=options['workers'],
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            CHAT_INBOUND_USER_RATE=1e9,
+            CHAT_INBOUND_USER_BURST=1e9,
+        ):
+            db._executor = None
+            throttling._limiters = None
+            elapsed = async_to_sync(self.run_clients)(user, chats, options['messages'])
+        return len(chats) * options['messages'] / elapsed
+
+    async def run_clients(self, user, chats, messages):
+        communicators = []
+        for chat in chats:
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{chat.pk}/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            communicators.append(communicator)
+
+        async def run_client(communicator):
+            # Каждый клиент ждёт своё сообщение из группы перед следующим
+            for i in range(messages):
+                await communicator.send_json_to({'message': f'message {i}'})
+                await communicator.receive_json_from(timeout=30)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(run_client(communicator) for communicator in communicators))
+        elapsed = time.perf_counter() - started_at
+        for communicator in communicators:
+            await communicator.disconnect()
+        return elapsed
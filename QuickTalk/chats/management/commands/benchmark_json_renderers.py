@@ -0,0 +1,71 @@
+import datetime
+import timeit
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from config.renderers import FastJSONRenderer, JSONEncoder, orjson
+
+
+def build_chats_list_payload(chats, messages_per_chat):
+    """
+    Builds a payload shaped like the chats-list response.
+    """
+    now = timezone.now()
+    return [
+        {
+            'chat_name': f'group chat {chat_id}' if chat_id % 3 else '+12025550100',
+            'messages_of_chat': [
+                {
+                    'id': chat_id * messages_per_chat + i,
+                    'sequence': i + 1,
+                    'client_message_id': None,
+                    'content': f'message {i} in chat {chat_id}: привет, how are you? 👋',
+                    'timestamp': (now - datetime.timedelta(seconds=i)).isoformat().replace('+00:00', 'Z'),
+                    'sender': chat_id % 50,
+                    'sender_username': f'user_{chat_id % 50:06d}',
+                }
+                for i in range(messages_per_chat)
+            ],
+            'permission_delete_update_chat': bool(chat_id % 2),
+            'type': 'group' if chat_id % 3 else 'personal',
+            'id': chat_id,
+        }
+        for chat_id in range(chats)
+    ]
+
+
+class Command(BaseCommand):
+    """
+    Compares the stdlib JSONRenderer with FastJSONRenderer on chat payloads.
+    """
+    help = 'Benchmarks the stdlib and orjson JSON renderers on realistic chat payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=50, help='Number of chats in the payload.')
+        parser.add_argument('--messages', type=int, default=50, help='Number of messages per chat.')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of renders to time.')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed; FastJSONRenderer falls back to the stdlib renderer.')
+
+        stdlib_renderer = JSONRenderer()
+        stdlib_renderer.encoder_class = JSONEncoder
+        fast_renderer = FastJSONRenderer()
+        payloads = [
+            ('chats-list', build_chats_list_payload(options['chats'], options['messages'])),
+            ('detail-chat', {'detail': build_chats_list_payload(1, options['messages'] * 10)[0]}),
+        ]
+
+        for name, payload in payloads:
+            expected = stdlib_renderer.render(payload, 'application/json')
+            if fast_renderer.render(payload, 'application/json') != expected:
+                raise CommandError(f'{name}: renderers produced different bytes.')
+            stdlib_time = min(timeit.repeat(lambda: stdlib_renderer.render(payload, 'application/json'), number=options['repeat'], repeat=3))
+            fast_time = min(timeit.repeat(lambda: fast_renderer.render(payload, 'application/json'), number=options['repeat'], repeat=3))
+            self.stdout.write(
+                f'{name} ({len(expected) / 1024:.0f} KiB): '
+                f'stdlib {stdlib_time / options["repeat"] * 1000:.2f} ms, '
+                f'orjson {fast_time / options["repeat"] * 1000:.2f} ms, '
+                f'{stdlib_time / fast_time:.1f}x faster'
+            )
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from chats.models import Chat, Message
+from chats.services.chats_serializers_services import (
+    _get_chats_prefetched_for_serialization,
+    _get_messages_page_queryset,
+    _get_inbox_of_chats_for_user,
+    _encode_message_history_cursor,
+)
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    """
+    Prints EXPLAIN plans for the hot queries of chats.views and ChatConsumer.
+    """
+    help = 'Prints EXPLAIN plans for the hot chat queries and flags plans that sort outside an index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat', type=int, help='ID of the chat to plan queries for (default: the first chat).')
+        parser.add_argument('--user', type=int, help='ID of a chat member (default: the first member of the chat).')
+
+    def handle(self, *args, **options):
+        chat = Chat.objects.filter(pk=options['chat']).first() if options['chat'] else Chat.objects.order_by('id').first()
+        if chat is None:
+            raise CommandError('No chat to plan queries for.')
+        user = CustomUser.objects.filter(pk=options['user']).first() if options['user'] else chat.users.order_by('id').first()
+        if user is None:
+            raise CommandError('No chat member to plan queries for.')
+
+        last_message = chat.messages.order_by('-timestamp', '-id').first()
+        cursor = _encode_message_history_cursor(last_message) if last_message else None
+
+        queries = [
+            ('chats-list: chats of user', _get_chats_prefetched_for_serialization(
+                chats=Chat.objects.filter(users=user).order_by('-created_at'),
+                include_messages=True
+            )),
+            ('chats-list: prefetched messages', Message.objects.filter(chat__in=[chat.pk]).select_related('sender').order_by('timestamp', 'id')),
+            ('chats-list: inbox', _get_inbox_of_chats_for_user(
+                request_user=user,
+                preview_length=settings.CHAT_INBOX_PREVIEW_LENGTH
+            )),
+            ('detail-chat: chat', Chat.objects.filter(pk=chat.pk)),
+            ('messages-chat: newest first', _get_messages_page_queryset(obj=chat, cursor=cursor, newest_first=True)[:settings.CHAT_HISTORY_PAGE_SIZE + 1]),
+            ('messages-chat: oldest first', _get_messages_page_queryset(obj=chat, cursor=None, newest_first=False)[:settings.CHAT_HISTORY_PAGE_SIZE + 1]),
+            ('read-chat: last message id', chat.messages.order_by('-id').values_list('id', flat=True)[:1]),
+            ('ChatConsumer: membership on connect', Chat.objects.filter(id=chat.pk, users=user)[:1]),
+            ('ChatConsumer: replay since', chat.messages.filter(id__gt=0).select_related('sender').order_by('id')[:settings.CHAT_REPLAY_BATCH_SIZE]),
+            ('ChatConsumer: client message id lookup', Message.objects.filter(chat=chat, sender=user, client_message_id='x')[:1]),
+        ]
+
+        for title, queryset in queries:
+            plan = queryset.explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(plan)
+            if 'TEMP B-TREE' in plan or 'SCAN ' in plan.replace('SCAN CONSTANT', ''):
+                self.stdout.write(self.style.WARNING('  -> plan scans a table or sorts outside an index'))
+            self.stdout.write('')
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from chats.importer import IMPORT_FORMATS, ChatHistoryImporter, ImportArchiveError, detect_import_format, iter_import_rows, open_import_archive
+from chats.models import Chat
+
+
+class Command(BaseCommand):
+    """
+    Imports historical messages into a chat from an NDJSON or CSV archive.
+    """
+    help = 'Streams an NDJSON or CSV archive (optionally .gz) of messages into a chat and reports rows per second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive with phone_number, content, timestamp and optional id columns.')
+        parser.add_argument('--chat', type=int, required=True, help='ID of the chat to import into.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Archive format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_IMPORT_BATCH_SIZE, help='Messages per transaction.')
+
+    def handle(self, *args, **options):
+        chat = Chat.objects.filter(pk=options['chat']).first()
+        if chat is None:
+            raise CommandError(f'Chat {options["chat"]} does not exist.')
+
+        path = options['path']
+        import_format = options['format'] or detect_import_format(path)
+        importer = ChatHistoryImporter(chat=chat, batch_size=options['batch_size'], progress=self.report)
+        try:
+            with open(path, 'rb') as archive:
+                stats = importer.run(iter_import_rows(open_import_archive(archive, path), import_format))
+        except ImportArchiveError as exc:
+            raise CommandError(f'{exc}. {exc.imported} messages were imported before it.')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats["imported"]} messages, skipped {stats["skipped"]} rows '
+            f'in {stats["seconds"]} s ({stats["rows_per_second"]} rows/s).'
+        ))
+
+    def report(self, stats):
+        self.stdout.write(f'{stats["imported"]} imported, {stats["skipped"]} skipped, {stats["rows_per_second"]} rows/s')
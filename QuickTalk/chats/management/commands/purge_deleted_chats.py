@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from chats.deletion import purge_chat
+from chats.models import ChatDeletionJob
+
+
+class Command(BaseCommand):
+    """
+    Finishes chat deletion jobs interrupted by a restart or a failure.
+    """
+    help = 'Purges the data of deleted chats whose background deletion has not finished.'
+
+    def handle(self, *args, **options):
+        jobs = ChatDeletionJob.objects.exclude(status='done').order_by('id')
+        for job_id in jobs.values_list('id', flat=True):
+            job = purge_chat(job_id)
+            self.stdout.write(
+                f'chat {job.chat_id}: {job.deleted_messages}/{job.total_messages} messages deleted, {job.status}'
+            )
@@ -0,0 +1,27 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Finishes moving channel layer groups after a Redis shard was added.
+    """
+    help = 'Moves channel layer groups left on their previous Redis shard to their current one.'
+
+    def handle(self, *args, **options):
+        layer = get_channel_layer()
+        layer = getattr(layer, 'inner', layer)
+        if not hasattr(layer, 'rebalance'):
+            raise CommandError(f'{layer} is not a sharded channel layer.')
+        if layer.previous_ring is None:
+            raise CommandError('Set REDIS_PREVIOUS_SHARDS to the shards before resharding.')
+
+        async def rebalance():
+            try:
+                return await layer.rebalance()
+            finally:
+                await layer.close_pools()
+
+        moved = async_to_sync(rebalance)()
+        self.stdout.write(f'{moved} groups moved to {layer.ring_size} shards.')
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_message_sequences(apps, schema_editor):
+    """
+    Numbers existing messages of every chat in (timestamp, id) order.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    Message = apps.get_model('chats', 'Message')
+    for chat in Chat.objects.all().iterator():
+        messages = list(Message.objects.filter(chat=chat).order_by('timestamp', 'id').only('id'))
+        for sequence, message in enumerate(messages, start=1):
+            message.sequence = sequence
+        Message.objects.bulk_update(messages, ['sequence'], batch_size=1000)
+        chat.last_message_sequence = len(messages)
+        chat.save(update_fields=['last_message_sequence'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_chatreadstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_sequence',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Last message sequence'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='client_message_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Client message ID'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='sequence',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Sequence'),
+        ),
+        migrations.RunPython(assign_message_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat', 'sequence'), name='unique_message_sequence_per_chat'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_message_id__isnull', False)), fields=('chat', 'sender', 'client_message_id'), name='unique_client_message_id_per_sender'),
+        ),
+    ]
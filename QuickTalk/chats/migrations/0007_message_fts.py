@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE chats_message_fts USING fts5("
+    "content, chat_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO chats_message_fts (rowid, content, chat_id) SELECT id, content, chat_id FROM chats_message",
+    "CREATE TRIGGER chats_message_fts_insert AFTER INSERT ON chats_message BEGIN "
+    "INSERT INTO chats_message_fts (rowid, content, chat_id) VALUES (new.id, new.content, new.chat_id); END",
+    "CREATE TRIGGER chats_message_fts_delete AFTER DELETE ON chats_message BEGIN "
+    "DELETE FROM chats_message_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER chats_message_fts_update AFTER UPDATE OF content, chat_id ON chats_message BEGIN "
+    "UPDATE chats_message_fts SET content = new.content, chat_id = new.chat_id WHERE rowid = old.id; END",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS chats_message_fts_update",
+    "DROP TRIGGER IF EXISTS chats_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chats_message_fts_insert",
+    "DROP TABLE IF EXISTS chats_message_fts",
+]
+
+
+def create_message_fts(apps, schema_editor):
+    """
+    Creates the FTS5 index of message content on SQLite; other database
+    backends provide their own search backend.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_message_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_message_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_message_fts, drop_message_fts),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_group_chat_names(apps, schema_editor):
+    """
+    Builds the name n-grams of existing group chats.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    ChatNameNgram = apps.get_model('chats', 'ChatNameNgram')
+    ngrams = []
+    for chat in Chat.objects.filter(type='group', name__isnull=False).iterator():
+        name = chat.name.lower()
+        chat_ngrams = {name[i:i + size] for size in (1, 2, 3) for i in range(len(name) - size + 1)}
+        ngrams.extend(ChatNameNgram(chat=chat, ngram=ngram) for ngram in chat_ngrams)
+    ChatNameNgram.objects.bulk_create(ngrams, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0007_message_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatNameNgram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ngram', models.CharField(max_length=3, verbose_name='N-gram')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_ngrams', to='chats.chat', verbose_name='Chat')),
+            ],
+            options={
+                'verbose_name': 'Chat name n-gram',
+                'verbose_name_plural': 'Chat name n-grams',
+                'constraints': [models.UniqueConstraint(fields=('ngram', 'chat'), name='unique_chat_name_ngram')],
+            },
+        ),
+        migrations.RunPython(index_group_chat_names, migrations.RunPython.noop),
+    ]
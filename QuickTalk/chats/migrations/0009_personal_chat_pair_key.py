@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_personal_chat_pair_keys(apps, schema_editor):
+    """
+    Stores the pair key of existing personal chats. When a pair already
+    has several chats, only the oldest one gets the key.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    seen_pairs = set()
+    chats = []
+    for chat in Chat.objects.filter(type='personal').order_by('created_at', 'id').prefetch_related('users'):
+        user_ids = sorted(user.id for user in chat.users.all())
+        if len(user_ids) != 2 or tuple(user_ids) in seen_pairs:
+            continue
+        seen_pairs.add(tuple(user_ids))
+        chat.personal_low_user_id, chat.personal_high_user_id = user_ids
+        chats.append(chat)
+    Chat.objects.bulk_update(chats, ['personal_low_user_id', 'personal_high_user_id'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0008_chatnamengram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='personal_high_user_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Personal chat higher user ID'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='personal_low_user_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Personal chat lower user ID'),
+        ),
+        migrations.RunPython(set_personal_chat_pair_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(condition=models.Q(('type', 'personal')), fields=('personal_low_user_id', 'personal_high_user_id'), name='unique_personal_chat_pair'),
+        ),
+    ]
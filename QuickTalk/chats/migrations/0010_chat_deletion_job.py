@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0009_personal_chat_pair_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Deleted at'),
+        ),
+        migrations.CreateModel(
+            name='ChatDeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.PositiveBigIntegerField(verbose_name='Chat ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('total_messages', models.PositiveBigIntegerField(default=0, verbose_name='Total messages')),
+                ('deleted_messages', models.PositiveBigIntegerField(default=0, verbose_name='Deleted messages')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_deletion_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Requested by')),
+            ],
+            options={
+                'verbose_name': 'Chat deletion job',
+                'verbose_name_plural': 'Chat deletion jobs',
+            },
+        ),
+    ]
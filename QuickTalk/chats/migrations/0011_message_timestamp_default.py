@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0010_chat_deletion_job'),
+    ]
+
+    # The column is unchanged; altering it on SQLite would rebuild the table
+    # and drop the full-text search triggers from 0007.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='timestamp',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Timestamp'),
+                ),
+            ],
+        ),
+    ]
@@ -1,10 +1,23 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
 from users.models import CustomUser
+from config.response_cache import bump_response_version
+from .db import database_executor_sync_to_async
 from django.core.validators import MinLengthValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
+class ChatManager(models.Manager):
+    """
+    Default chat manager; hides chats that are being deleted in the background.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Chat(models.Model):
     """
     Represents a chat in the system.
@@ -43,10 +56,172 @@ class Chat(models.Model):
         verbose_name=_('Created at'),
         auto_now_add=True, 
     )
+    last_message_sequence = models.PositiveBigIntegerField(
+        verbose_name=_('Last message sequence'),
+        default=0,
+    )
+    personal_low_user_id = models.PositiveBigIntegerField(
+        verbose_name=_('Personal chat lower user ID'),
+        null=True,
+        blank=True,
+    )
+    personal_high_user_id = models.PositiveBigIntegerField(
+        verbose_name=_('Personal chat higher user ID'),
+        null=True,
+        blank=True,
+    )
+    deleted_at = models.DateTimeField(
+        verbose_name=_('Deleted at'),
+        null=True,
+        blank=True,
+    )
+
+    objects = ChatManager()
+    all_objects = models.Manager()
 
     class Meta:
         verbose_name = _('Chat')
         verbose_name_plural = _('Chats')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['personal_low_user_id', 'personal_high_user_id'],
+                condition=Q(type='personal'),
+                name='unique_personal_chat_pair',
+            ),
+        ]
+
+    def allocate_message_sequences(self, count):
+        """
+        Reserves `count` consecutive message sequence numbers in this chat and
+        returns the first one. Must be called inside a transaction.
+        Raises Chat.DoesNotExist if the chat has been deleted.
+        """
+        updated = (
+            Chat.all_objects
+            .filter(pk=self.pk, deleted_at__isnull=True)
+            .update(last_message_sequence=F('last_message_sequence') + count)
+        )
+        if not updated:
+            raise Chat.DoesNotExist('Chat has been deleted.')
+        last_sequence = Chat.all_objects.filter(pk=self.pk).values_list('last_message_sequence', flat=True).get()
+        return last_sequence - count + 1
+
+
+class MessageManager(models.Manager):
+    """
+    Manager that assigns per-chat sequence numbers and deduplicates
+    messages by their client-supplied ID.
+    """
+    def create_in_chat(self, chat, sender, content, client_message_id=None):
+        """
+        Creates a message with the next sequence number of the chat.
+        A retry with an already used client message ID returns the existing message.
+        """
+        if client_message_id:
+            existing = self._filter_by_client_message_id(chat, sender, client_message_id).first()
+            if existing:
+                return existing
+        return self._create_new_in_chat(chat, sender, content, client_message_id)
+
+    async def acreate_in_chat(self, chat, sender, content, client_message_id=None):
+        """
+        Async version of create_in_chat. The retry lookup uses the async ORM;
+        the insert needs a transaction, which the async ORM does not support,
+        and runs on the dedicated database executor.
+        """
+        if client_message_id:
+            existing = await self._filter_by_client_message_id(chat, sender, client_message_id).afirst()
+            if existing:
+                return existing
+        return await database_executor_sync_to_async(self._create_new_in_chat)(
+            chat, sender, content, client_message_id
+        )
+
+    def _filter_by_client_message_id(self, chat, sender, client_message_id):
+        return self.select_related('sender').filter(
+            chat=chat,
+            sender=sender,
+            client_message_id=client_message_id
+        )
+
+    def _create_new_in_chat(self, chat, sender, content, client_message_id):
+        try:
+            with transaction.atomic():
+                return self.create(
+                    chat=chat,
+                    sender=sender,
+                    content=content,
+                    client_message_id=client_message_id or None,
+                )
+        except IntegrityError:
+            if not client_message_id:
+                raise
+            return self._filter_by_client_message_id(chat, sender, client_message_id).get()
+
+    def bulk_create_in_chats(self, messages):
+        """
+        Saves unsaved messages of any chats with bulk_create, assigning sequence
+        numbers in list order. Returns a list aligned with `messages` in which
+        retried client message IDs resolve to the already saved message and
+        messages of deleted chats are None.
+        """
+        with transaction.atomic():
+            existing = self._get_existing_by_client_message_id(messages)
+            result = []
+            new_messages = []
+            for message in messages:
+                key = (message.chat_id, message.sender_id, message.client_message_id)
+                if message.client_message_id and key in existing:
+                    result.append(existing[key])
+                    continue
+                if message.client_message_id:
+                    existing[key] = message
+                new_messages.append(message)
+                result.append(message)
+
+            messages_by_chat = {}
+            for message in new_messages:
+                messages_by_chat.setdefault(message.chat_id, []).append(message)
+            deleted_chat_ids = set()
+            for chat_id, chat_messages in messages_by_chat.items():
+                try:
+                    first_sequence = chat_messages[0].chat.allocate_message_sequences(len(chat_messages))
+                except Chat.DoesNotExist:
+                    # Сообщения удалённого чата не сохраняем, остальные чаты пачки не страдают
+                    deleted_chat_ids.add(chat_id)
+                    continue
+                for offset, message in enumerate(chat_messages):
+                    message.sequence = first_sequence + offset
+
+            if deleted_chat_ids:
+                new_messages = [message for message in new_messages if message.chat_id not in deleted_chat_ids]
+                result = [
+                    None if message.pk is None and message.chat_id in deleted_chat_ids else message
+                    for message in result
+                ]
+                for chat_id in deleted_chat_ids:
+                    del messages_by_chat[chat_id]
+            self.bulk_create(new_messages)
+            # bulk_create не отправляет post_save
+            for chat_id in messages_by_chat:
+                bump_response_version('chat', chat_id)
+        return result
+
+    def _get_existing_by_client_message_id(self, messages):
+        keyed = [message for message in messages if message.client_message_id]
+        if not keyed:
+            return {}
+        query = Q()
+        for message in keyed:
+            query |= Q(
+                chat_id=message.chat_id,
+                sender_id=message.sender_id,
+                client_message_id=message.client_message_id
+            )
+        return {
+            (message.chat_id, message.sender_id, message.client_message_id): message
+            for message in self.select_related('sender').filter(query)
+        }
 
 
 class Message(models.Model):
@@ -68,11 +243,150 @@ class Message(models.Model):
         verbose_name=_('Content')
     )  
     timestamp = models.DateTimeField(
-        auto_now_add=True, 
+        default=timezone.now,
+        editable=False,
         verbose_name=_('Timestamp')
     )
+    sequence = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_('Sequence')
+    )
+    client_message_id = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name=_('Client message ID')
+    )
+
+    objects = MessageManager()
 
     class Meta:
-        ordering = ['timestamp']
         verbose_name = _('Message')
         verbose_name_plural = _('Messages')
+        indexes = [
+            models.Index(fields=['chat', 'timestamp', 'id'], name='message_chat_timestamp_idx'),
+            models.Index(fields=['sender', 'timestamp'], name='message_sender_timestamp_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'sequence'], name='unique_message_sequence_per_chat'),
+            models.UniqueConstraint(
+                fields=['chat', 'sender', 'client_message_id'],
+                condition=Q(client_message_id__isnull=False),
+                name='unique_client_message_id_per_sender',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Assigns the next sequence number of the chat to a new message.
+        """
+        if self._state.adding and not self.sequence:
+            with transaction.atomic():
+                self.sequence = self.chat.allocate_message_sequences(1)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+
+class ChatReadState(models.Model):
+    """
+    Tracks the last message a user has read in a chat.
+    """
+    chat = models.ForeignKey(
+        Chat,
+        on_delete=models.CASCADE,
+        related_name='read_states',
+        verbose_name=_('Chat')
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='chat_read_states',
+        verbose_name=_('User')
+    )
+    last_read_message_id = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_('Last read message ID')
+    )
+
+    class Meta:
+        verbose_name = _('Chat read state')
+        verbose_name_plural = _('Chat read states')
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='unique_chat_read_state'),
+        ]
+
+
+class ChatNameNgram(models.Model):
+    """
+    Lowercased 1- to 3-character n-gram of a group chat name,
+    used to search chats by name prefix or substring.
+    """
+    chat = models.ForeignKey(
+        Chat,
+        on_delete=models.CASCADE,
+        related_name='name_ngrams',
+        verbose_name=_('Chat')
+    )
+    ngram = models.CharField(
+        max_length=3,
+        verbose_name=_('N-gram')
+    )
+
+    class Meta:
+        verbose_name = _('Chat name n-gram')
+        verbose_name_plural = _('Chat name n-grams')
+        constraints = [
+            models.UniqueConstraint(fields=['ngram', 'chat'], name='unique_chat_name_ngram'),
+        ]
+
+
+class ChatDeletionJob(models.Model):
+    """
+    Background deletion of a hidden chat, purging its messages in batches.
+    """
+    STATUSES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('done', _('Done')),
+        ('failed', _('Failed')),
+    ]
+
+    chat_id = models.PositiveBigIntegerField(
+        verbose_name=_('Chat ID'),
+    )
+    requested_by = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='chat_deletion_jobs',
+        verbose_name=_('Requested by')
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default='pending',
+        verbose_name=_('Status')
+    )
+    total_messages = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_('Total messages')
+    )
+    deleted_messages = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_('Deleted messages')
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Created at')
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Finished at')
+    )
+
+    class Meta:
+        verbose_name = _('Chat deletion job')
+        verbose_name_plural = _('Chat deletion jobs')
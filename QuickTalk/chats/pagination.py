@@ -0,0 +1,11 @@
+from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+
+
+class ChatsInboxPagination(PageNumberPagination):
+    """
+    Page-number pagination for the chats inbox.
+    """
+    page_size = settings.CHAT_INBOX_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.CHAT_INBOX_MAX_PAGE_SIZE
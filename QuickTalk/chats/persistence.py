@@ -0,0 +1,100 @@
+import asyncio
+import atexit
+from django.conf import settings
+from .db import database_executor_sync_to_async
+from .models import Chat, Message
+
+
+class MessageWriteBehindBuffer:
+    """
+    Buffers messages received over WebSocket within one process and saves
+    them with bulk_create once the batch size or the maximum delay is reached.
+    Batches are flushed one at a time in arrival order, so message ids follow
+    the order in which messages were received.
+    """
+
+    def __init__(self, batch_size, max_delay):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending = []
+        self._flush_handle = None
+        self._flush_tasks = set()
+        self._lock = asyncio.Lock()
+
+    async def add(self, message):
+        """
+        Queues an unsaved message and returns a future resolved with the saved
+        message, or with the earlier one if its client message ID was already used.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+        if len(self._pending) >= self.batch_size:
+            self._cancel_timer()
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._start_flush)
+        return future
+
+    async def flush(self):
+        """
+        Saves every buffered message in a single transaction.
+        """
+        async with self._lock:
+            self._cancel_timer()
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                created = await database_executor_sync_to_async(self._bulk_create)([message for message, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+            for (_, future), message in zip(batch, created):
+                if future.done():
+                    continue
+                if message is None:
+                    future.set_exception(Chat.DoesNotExist('Chat has been deleted.'))
+                else:
+                    future.set_result(message)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _cancel_timer(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def _bulk_create(self, messages):
+        return Message.objects.bulk_create_in_chats(messages)
+
+    def _flush_on_exit(self):
+        """
+        Saves messages still buffered when the process shuts down.
+        """
+        batch, self._pending = self._pending, []
+        if batch:
+            self._bulk_create([message for message, _ in batch])
+
+
+_message_buffer = None
+
+
+def get_message_buffer():
+    """
+    Returns the per-process write-behind buffer, creating it on first use.
+    """
+    global _message_buffer
+    if _message_buffer is None:
+        _message_buffer = MessageWriteBehindBuffer(
+            batch_size=settings.CHAT_MESSAGE_WRITE_BEHIND_BATCH_SIZE,
+            max_delay=settings.CHAT_MESSAGE_WRITE_BEHIND_MAX_DELAY,
+        )
+        atexit.register(_message_buffer._flush_on_exit)
+    return _message_buffer
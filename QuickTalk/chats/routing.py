@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/chat/<str:chat_id>/', consumers.ChatConsumer.as_asgi()),  # маршрут для каждого чата
+    path('ws/chats/', consumers.UserChatsConsumer.as_asgi()),  # одно соединение на пользователя для всех чатов
 ]
@@ -0,0 +1,112 @@
+import re
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils.module_loading import import_string
+from .models import ChatNameNgram
+
+
+class BaseMessageSearchBackend:
+    """
+    Interface of message full-text search backends.
+    A backend keeps its own index in sync with the Message table and
+    returns ranked message IDs from the chats a user belongs to.
+    """
+
+    def search(self, user, query, offset, limit):
+        """
+        Returns IDs of matching messages ordered by relevance.
+        """
+        raise NotImplementedError
+
+
+class SQLiteFTS5MessageSearchBackend(BaseMessageSearchBackend):
+    """
+    Searches the `chats_message_fts` FTS5 table, which database triggers
+    keep in sync with inserted, updated and deleted messages.
+    """
+    table_name = 'chats_message_fts'
+
+    def search(self, user, query, offset, limit):
+        match = build_fts5_match_expression(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table_name} '
+                f'WHERE {self.table_name} MATCH %s '
+                'AND chat_id IN (SELECT chat_id FROM chats_chat_users WHERE customuser_id = %s) '
+                'ORDER BY rank LIMIT %s OFFSET %s',
+                [match, user.pk, limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def build_fts5_match_expression(query):
+    """
+    Turns user input into an FTS5 expression: every word is quoted as a
+    literal term and the last one is matched as a prefix.
+    """
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in query.split()]
+    if not terms:
+        return ''
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+_backend = None
+
+
+def get_message_search_backend():
+    """
+    Returns the configured message search backend instance.
+    """
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.CHAT_MESSAGE_SEARCH_BACKEND)()
+    return _backend
+
+
+def build_chat_name_ngrams(name):
+    """
+    Returns the set of lowercased 1- to 3-character n-grams of a chat name.
+    """
+    name = name.lower()
+    return {name[i:i + size] for size in (1, 2, 3) for i in range(len(name) - size + 1)}
+
+
+def reindex_chat_name(chat, created=False):
+    """
+    Rebuilds the name n-grams of a group chat.
+    """
+    with transaction.atomic():
+        if not created:
+            ChatNameNgram.objects.filter(chat=chat).delete()
+        if chat.type == 'group' and chat.name:
+            ChatNameNgram.objects.bulk_create(
+                ChatNameNgram(chat=chat, ngram=ngram) for ngram in build_chat_name_ngrams(chat.name)
+            )
+
+
+def filter_group_chats_by_name(chats, query):
+    """
+    Narrows group chats to those whose name contains the query, using the
+    n-gram index: queries of up to three characters are looked up directly,
+    longer ones take the chats that have every trigram of the query and
+    then check that the name really contains it, since the trigrams may
+    occur in another order or apart.
+    """
+    query = query.lower()
+    if len(query) <= 3:
+        return chats.filter(name_ngrams__ngram=query)
+    ngrams = {query[i:i + 3] for i in range(len(query) - 2)}
+    candidate_ids = (
+        ChatNameNgram.objects
+        .filter(ngram__in=ngrams)
+        .values('chat')
+        .annotate(matched=Count('ngram'))
+        .filter(matched=len(ngrams))
+        .values('chat')
+    )
+    # iregex, в отличие от icontains в SQLite, не зависит от регистра и для кириллицы
+    return chats.filter(pk__in=candidate_ids, name__iregex=re.escape(query))
@@ -3,16 +3,29 @@ from .services.chats_serializers_services import (
     _create_group_chat_and_add_requesting_user_as_participant,
     _update_name_of_existing_group_chat,
     _validate_personal_chat_between_requesting_user_and_chosen_user,
-    _create_personal_chat_between_requesting_user_and_chosen_user,
+    _get_or_create_personal_chat_between_requesting_user_and_chosen_user,
     _get_username_of_user_who_sent_message,
     _get_chat_name_or_phone_number_for_personal_chat,
     _get_all_messages_from_chat,
+    _get_page_of_messages_from_chat,
+    _get_inbox_chat_name_or_phone_number_for_personal_chat,
+    _search_messages_in_chats_of_user,
+    _search_group_chats_by_name,
     _permission_delete_update_chat,
     _delete_chat,
-    _validate_process_user_join_to_group_chat
+    _validate_process_user_join_to_group_chat,
+    _validate_users_exist,
+    _add_users_to_group_chat,
+    _remove_users_from_group_chat,
+    _stream_chat_messages_as_ndjson,
+    _astream_chat_messages_as_ndjson,
 )
-from .models import Chat, Message
+from .models import Chat, Message, ChatDeletionJob
+from .importer import IMPORT_FORMATS, ChatHistoryImporter, ImportArchiveError, detect_import_format, iter_import_rows, open_import_archive
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext_lazy as _
+import hashlib
 
 
 class CreateGroupChatSerializer(serializers.ModelSerializer):
@@ -52,7 +65,7 @@ class CreatePersonalChatSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Chat
-        fields = ['name', 'type', 'created_by', 'created_at', 'chosen_user_to_prsnl_cht_id']
+        fields = ['id', 'name', 'type', 'created_by', 'created_at', 'chosen_user_to_prsnl_cht_id']
 
     def validate(self, data):
         return _validate_personal_chat_between_requesting_user_and_chosen_user(
@@ -62,10 +75,11 @@ class CreatePersonalChatSerializer(serializers.ModelSerializer):
         )
 
     def create(self, validated_data):
-        return _create_personal_chat_between_requesting_user_and_chosen_user(
+        chat, self.created = _get_or_create_personal_chat_between_requesting_user_and_chosen_user(
             request_user=self.context['request'].user,
             other_user_id=validated_data.pop('chosen_user_to_prsnl_cht_id')
         )
+        return chat
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -76,12 +90,21 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'content', 'timestamp', 'sender', 'sender_username']
+        fields = ['id', 'sequence', 'client_message_id', 'content', 'timestamp', 'sender', 'sender_username']
 
     def get_sender_username(self, obj):
         return _get_username_of_user_who_sent_message(obj=obj)
 
 
+class MessageSearchResultSerializer(MessageSerializer):
+    """
+    Serializes a message found by search, including its chat.
+    """
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['chat']
+
+
 class ChatsListSerializer(serializers.ModelSerializer):
     """
     Lists chats with details, messages, and permissions.
@@ -94,6 +117,11 @@ class ChatsListSerializer(serializers.ModelSerializer):
         model = Chat
         fields = ['chat_name', 'messages_of_chat', 'permission_delete_update_chat', 'type', 'id']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('include_messages', True):
+            self.fields.pop('messages_of_chat')
+
     def get_chat_name(self, obj):
         user = self.context['request'].user
         return _get_chat_name_or_phone_number_for_personal_chat(
@@ -110,6 +138,137 @@ class ChatsListSerializer(serializers.ModelSerializer):
         return _permission_delete_update_chat(obj=obj, request_user=user)
 
 
+class ChatsInboxSerializer(serializers.ModelSerializer):
+    """
+    Lists chats as an inbox with last message preview and unread count.
+    """
+    chat_name = serializers.SerializerMethodField()
+    last_message_preview = serializers.CharField(read_only=True)
+    last_message_sender = serializers.IntegerField(read_only=True)
+    last_activity = serializers.DateTimeField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = [
+            'chat_name', 'type', 'id', 'last_message_preview',
+            'last_message_sender', 'last_activity', 'unread_count'
+        ]
+
+    def get_chat_name(self, obj):
+        return _get_inbox_chat_name_or_phone_number_for_personal_chat(obj=obj)
+
+
+class MessageHistorySerializer(serializers.Serializer):
+    """
+    Validates query parameters for a page of chat message history.
+    """
+    order = serializers.ChoiceField(choices=['newest', 'oldest'], default='newest')
+    cursor = serializers.CharField(required=False, allow_blank=True)
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.CHAT_HISTORY_MAX_PAGE_SIZE,
+        default=settings.CHAT_HISTORY_PAGE_SIZE
+    )
+
+    def get_page(self, chat):
+        messages, next_cursor = _get_page_of_messages_from_chat(
+            obj=chat,
+            cursor=self.validated_data.get('cursor'),
+            page_size=self.validated_data['page_size'],
+            newest_first=self.validated_data['order'] == 'newest'
+        )
+        return {
+            'results': MessageSerializer(messages, many=True).data,
+            'next_cursor': next_cursor,
+        }
+
+
+class ChatExportSerializer(serializers.Serializer):
+    """
+    Validates query parameters of a chat export and streams it as NDJSON.
+    """
+    after = serializers.IntegerField(min_value=0, default=0)
+    compress = serializers.ChoiceField(choices=['gzip'], required=False)
+
+    def stream(self, chat):
+        return _stream_chat_messages_as_ndjson(
+            chat=chat,
+            after=self.validated_data['after'],
+            chunk_size=settings.CHAT_EXPORT_CHUNK_SIZE,
+            compress=self.validated_data.get('compress') == 'gzip'
+        )
+
+    def astream(self, chat):
+        return _astream_chat_messages_as_ndjson(
+            chat=chat,
+            after=self.validated_data['after'],
+            chunk_size=settings.CHAT_EXPORT_CHUNK_SIZE,
+            compress=self.validated_data.get('compress') == 'gzip'
+        )
+
+
+class MessageSearchSerializer(serializers.Serializer):
+    """
+    Validates a message search query and returns a page of ranked results.
+    """
+    query = serializers.CharField(max_length=100)
+    page = serializers.IntegerField(min_value=1, default=1)
+
+    def get_page(self, request_user):
+        messages, has_next = _search_messages_in_chats_of_user(
+            request_user=request_user,
+            query=self.validated_data['query'],
+            page=self.validated_data['page'],
+            page_size=settings.CHAT_MESSAGE_SEARCH_PAGE_SIZE
+        )
+        return {
+            'results': MessageSearchResultSerializer(messages, many=True).data,
+            'next_page': self.validated_data['page'] + 1 if has_next else None,
+        }
+
+
+class GroupChatSearchResultSerializer(serializers.ModelSerializer):
+    """
+    Slim representation of a group chat found by name.
+    """
+    member_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'name', 'member_count']
+
+
+class GroupChatSearchSerializer(serializers.Serializer):
+    """
+    Validates a group chat search query and returns a cached page of results.
+    """
+    query = serializers.CharField(max_length=30)
+    page = serializers.IntegerField(min_value=1, default=1)
+
+    def get_page(self):
+        query = self.validated_data['query'].strip()
+        page_number = self.validated_data['page']
+        cache_key = 'group-chat-search:{}:{}'.format(
+            hashlib.md5(query.lower().encode()).hexdigest(),
+            page_number
+        )
+        page = cache.get(cache_key)
+        if page is None:
+            chats, has_next = _search_group_chats_by_name(
+                query=query,
+                page=page_number,
+                page_size=settings.CHAT_GROUP_SEARCH_PAGE_SIZE,
+                max_results=settings.CHAT_GROUP_SEARCH_MAX_RESULTS
+            )
+            page = {
+                'results': GroupChatSearchResultSerializer(chats, many=True).data,
+                'next_page': page_number + 1 if has_next else None,
+            }
+            cache.set(cache_key, page, settings.CHAT_GROUP_SEARCH_CACHE_TTL)
+        return page
+
+
 class ChatDeleteSerializer(serializers.ModelSerializer):
     """
     Deletes a chat instance.
@@ -119,9 +278,18 @@ class ChatDeleteSerializer(serializers.ModelSerializer):
         model = Chat
         fields = []
 
-    def destroy(self, instance):
-        _delete_chat(instance=instance)
-        return
+    def destroy(self, instance, requested_by=None):
+        return _delete_chat(instance=instance, requested_by=requested_by)
+
+
+class ChatDeletionJobSerializer(serializers.ModelSerializer):
+    """
+    Serializes the progress of a background chat deletion.
+    """
+
+    class Meta:
+        model = ChatDeletionJob
+        fields = ['id', 'chat_id', 'status', 'total_messages', 'deleted_messages', 'created_at', 'finished_at']
 
 
 class JoinToGroupChatSerializer(serializers.Serializer):
@@ -133,3 +301,44 @@ class JoinToGroupChatSerializer(serializers.Serializer):
 
     def validate(self, data):
         return _validate_process_user_join_to_group_chat(data=data)
+
+
+class GroupChatMembersSerializer(serializers.Serializer):
+    """
+    Validates a list of user IDs and adds them to or removes them from a group chat.
+    """
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.CHAT_MEMBERSHIP_BULK_MAX_USERS,
+    )
+
+    def validate_user_ids(self, value):
+        return _validate_users_exist(list(dict.fromkeys(value)))
+
+    def add(self, chat):
+        return _add_users_to_group_chat(chat=chat, user_ids=self.validated_data['user_ids'])
+
+    def remove(self, chat):
+        return _remove_users_from_group_chat(chat=chat, user_ids=self.validated_data['user_ids'])
+
+
+class ChatHistoryImportSerializer(serializers.Serializer):
+    """
+    Validates an uploaded NDJSON or CSV archive, optionally gzip-compressed,
+    and imports its messages into a chat.
+    """
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=IMPORT_FORMATS, required=False)
+
+    def run_import(self, chat):
+        upload = self.validated_data['file']
+        import_format = self.validated_data.get('format') or detect_import_format(upload.name)
+        lines = open_import_archive(upload.file, upload.name)
+        importer = ChatHistoryImporter(chat=chat, batch_size=settings.CHAT_IMPORT_BATCH_SIZE)
+        try:
+            return importer.run(iter_import_rows(lines, import_format))
+        except ImportArchiveError as exc:
+            raise serializers.ValidationError({'file': _(
+                'Line {line}: {reason}. {imported} messages were imported before it.'
+            ).format(line=exc.line, reason=exc.reason, imported=exc.imported)})
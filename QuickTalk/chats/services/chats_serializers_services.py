@@ -1,7 +1,22 @@
 from rest_framework import serializers
-from chats.models import Chat
+from chats.models import Chat, Message, ChatReadState
+from chats.search import get_message_search_backend, filter_group_chats_by_name
+from chats.events import broadcast_members_changed
+from chats.deletion import hide_chat_and_schedule_deletion
+from config.response_cache import bump_response_version, get_response_versions
 from users.models import CustomUser
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Case, Count, OuterRef, Prefetch, Subquery, Value, When
+from django.db.models.functions import Coalesce, Substr
+from django.utils.dateparse import parse_datetime
+from config.renderers import FastJSONRenderer
 from django.utils.translation import gettext_lazy as _
+import base64
+import itertools
+import zlib
+import hashlib
+import binascii
 
 
 def _create_group_chat_and_add_requesting_user_as_participant(created_by, name):
@@ -22,35 +37,51 @@ def _update_name_of_existing_group_chat(instance, name):
     Updates the name of a group chat.
     """
     instance.name = name
-    instance.save()
+    # Полное сохранение откатило бы счётчик последовательности сообщений
+    instance.save(update_fields=['name'])
     return instance
 
 
 def _validate_personal_chat_between_requesting_user_and_chosen_user(data, request_user, pk):
     """
-    Validates that a personal chat does not already exist.
+    Validates that the chosen user exists and is not the requesting user.
     """
-    other_user = CustomUser.objects.get(pk=pk)
-
-    if Chat.objects.filter(
-        type='personal',
-        users=request_user
-    ).filter(users=other_user).exists():
-        raise serializers.ValidationError(_("A personal chat between these users already exists."))
+    if pk == request_user.pk:
+        raise serializers.ValidationError(_("You cannot create a personal chat with yourself."))
+    if not CustomUser.objects.filter(pk=pk).exists():
+        raise serializers.ValidationError(_("User not found."))
     return data
 
 
-def _create_personal_chat_between_requesting_user_and_chosen_user(request_user, other_user_id):
+def _get_personal_chat_pair_key(first_user_id, second_user_id):
     """
-    Creates a personal chat between two users.
+    Returns the canonical (lower, higher) user ID pair of a personal chat.
     """
-    other_user = CustomUser.objects.get(pk=other_user_id)
-    chat = Chat.objects.create(
-        type='personal',
-        created_by=request_user,
-    )
-    chat.users.add(request_user, other_user)
-    return chat
+    return min(first_user_id, second_user_id), max(first_user_id, second_user_id)
+
+
+def _get_or_create_personal_chat_between_requesting_user_and_chosen_user(request_user, other_user_id):
+    """
+    Returns the personal chat between two users, creating it if needed.
+    The pair key is unique, so a concurrent request that creates the
+    same chat first makes this one return the existing chat.
+    """
+    low_user_id, high_user_id = _get_personal_chat_pair_key(request_user.pk, other_user_id)
+    lookup = {
+        'type': 'personal',
+        'personal_low_user_id': low_user_id,
+        'personal_high_user_id': high_user_id,
+    }
+    chat = Chat.objects.filter(**lookup).first()
+    if chat is not None:
+        return chat, False
+    try:
+        with transaction.atomic():
+            chat = Chat.objects.create(created_by=request_user, **lookup)
+            chat.users.add(request_user.pk, other_user_id)
+    except IntegrityError:
+        return Chat.objects.get(**lookup), False
+    return chat, True
 
 
 def _get_username_of_user_who_sent_message(obj):
@@ -60,40 +91,222 @@ def _get_username_of_user_who_sent_message(obj):
     return obj.sender.username
 
 
+def _get_chats_prefetched_for_serialization(chats, include_messages):
+    """
+    Prefetches participants and, if requested, messages with their senders
+    so that serializing the chats takes a fixed number of queries.
+    """
+    chats = chats.prefetch_related('users')
+    if include_messages:
+        chats = chats.prefetch_related(Prefetch(
+            'messages',
+            queryset=Message.objects.select_related('sender').order_by('timestamp', 'id')
+        ))
+    return chats
+
+
 def _get_chat_name_or_phone_number_for_personal_chat(obj, current_user):
     """
     Retrieves the name or phone number for a personal chat.
     """
     if obj.type == 'personal':
-        other_user = obj.users.exclude(id=current_user.id).first()
-        if other_user:
-            return str(other_user.phone_number)
+        for user in obj.users.all():
+            if user.id != current_user.id:
+                return str(user.phone_number)
     return obj.name
 
 
 def _get_all_messages_from_chat(obj):
     """
-    Returns all messages from a chat ordered by timestamp.
+    Returns all messages from a chat ordered by timestamp, relying on the
+    ordered prefetch from _get_chats_prefetched_for_serialization.
+    """
+    return obj.messages.all()
+
+
+def _encode_message_history_cursor(message):
+    """
+    Encodes the (timestamp, id) position of a message as an opaque cursor.
+    """
+    raw = f'{message.timestamp.isoformat()}|{message.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_message_history_cursor(cursor):
+    """
+    Decodes a history cursor back into its (timestamp, id) position.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, message_id = raw.rsplit('|', 1)
+        timestamp = parse_datetime(timestamp)
+        message_id = int(message_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise serializers.ValidationError({'cursor': _('Invalid cursor.')})
+    if timestamp is None:
+        raise serializers.ValidationError({'cursor': _('Invalid cursor.')})
+    return timestamp, message_id
+
+
+def _get_messages_page_queryset(obj, cursor, newest_first):
+    """
+    Builds the keyset-ordered queryset of chat messages following the cursor.
+    """
+    messages = obj.messages.select_related('sender')
+    if newest_first:
+        messages = messages.order_by('-timestamp', '-id')
+    else:
+        messages = messages.order_by('timestamp', 'id')
+
+    if cursor:
+        timestamp, message_id = _decode_message_history_cursor(cursor)
+        if newest_first:
+            messages = messages.filter(
+                Q(timestamp__lte=timestamp),
+                Q(timestamp__lt=timestamp) | Q(id__lt=message_id)
+            )
+        else:
+            messages = messages.filter(
+                Q(timestamp__gte=timestamp),
+                Q(timestamp__gt=timestamp) | Q(id__gt=message_id)
+            )
+    return messages
+
+
+def _get_page_of_messages_from_chat(obj, cursor, page_size, newest_first):
+    """
+    Returns one keyset page of chat messages and the cursor of the next page.
+    """
+    messages = _get_messages_page_queryset(obj=obj, cursor=cursor, newest_first=newest_first)
+    page = list(messages[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = _encode_message_history_cursor(page[-1])
+    return page, next_cursor
+
+
+def _search_messages_in_chats_of_user(request_user, query, page, page_size):
+    """
+    Returns one page of messages matching the query, ranked by relevance,
+    from chats the user belongs to, and whether another page follows.
+    """
+    message_ids = get_message_search_backend().search(
+        user=request_user,
+        query=query,
+        offset=(page - 1) * page_size,
+        limit=page_size + 1
+    )
+    has_next = len(message_ids) > page_size
+    message_ids = message_ids[:page_size]
+    messages = Message.objects.select_related('sender').in_bulk(message_ids)
+    return [messages[message_id] for message_id in message_ids if message_id in messages], has_next
+
+
+def _search_group_chats_by_name(query, page, page_size, max_results):
+    """
+    Returns one page of group chats whose name contains the query, with
+    member counts, prefix matches first, and whether another page follows.
+    Results never go past `max_results`.
+    """
+    offset = (page - 1) * page_size
+    limit = min(page_size, max_results - offset)
+    if limit <= 0:
+        return [], False
+    chats = (
+        filter_group_chats_by_name(Chat.objects.filter(type='group'), query)
+        .annotate(
+            member_count=Count('users', distinct=True),
+            prefix_match=Case(When(name__istartswith=query, then=Value(0)), default=Value(1)),
+        )
+        .order_by('prefix_match', 'name', 'id')
+    )
+    page_of_chats = list(chats[offset:offset + limit + 1])
+    has_next = len(page_of_chats) > limit and offset + limit < max_results
+    return page_of_chats[:limit], has_next
+
+
+def _get_inbox_of_chats_for_user(request_user, preview_length):
+    """
+    Returns the user's chats annotated with last message preview, last activity
+    and unread count, ordered by last activity, in a single query.
+    """
+    last_message = Message.objects.filter(chat=OuterRef('pk')).order_by('-timestamp', '-id')
+    last_read_message_id = ChatReadState.objects.filter(
+        chat=OuterRef('chat'),
+        user=request_user
+    ).values('last_read_message_id')
+    unread_messages = (
+        Message.objects
+        .filter(chat=OuterRef('pk'), id__gt=Coalesce(Subquery(last_read_message_id), Value(0)))
+        .exclude(sender=request_user)
+        .order_by()
+        .values('chat')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    other_user_phone_number = (
+        CustomUser.objects
+        .filter(chats=OuterRef('pk'))
+        .exclude(pk=request_user.pk)
+        .values('phone_number')[:1]
+    )
+    return (
+        Chat.objects
+        .filter(users=request_user)
+        .annotate(
+            last_message_preview=Subquery(last_message.annotate(
+                preview=Substr('content', 1, preview_length)
+            ).values('preview')[:1]),
+            last_message_sender=Subquery(last_message.values('sender')[:1]),
+            last_activity=Coalesce(Subquery(last_message.values('timestamp')[:1]), 'created_at'),
+            unread_count=Coalesce(Subquery(unread_messages), Value(0)),
+            other_user_phone_number=Subquery(other_user_phone_number),
+        )
+        .order_by('-last_activity', '-id')
+    )
+
+
+def _get_inbox_chat_name_or_phone_number_for_personal_chat(obj):
+    """
+    Retrieves the name or annotated phone number for an inbox chat.
     """
-    return obj.messages.all().order_by('timestamp')
+    if obj.type == 'personal' and obj.other_user_phone_number:
+        return str(obj.other_user_phone_number)
+    return obj.name
+
+
+def _mark_chat_as_read_by_user(chat, request_user):
+    """
+    Moves the user's read marker in a chat up to its latest message.
+    """
+    last_message_id = chat.messages.order_by('-id').values_list('id', flat=True).first() or 0
+    ChatReadState.objects.bulk_create(
+        [ChatReadState(chat=chat, user=request_user, last_read_message_id=last_message_id)],
+        update_conflicts=True,
+        unique_fields=['chat', 'user'],
+        update_fields=['last_read_message_id']
+    )
+    return last_message_id
 
 
 def _permission_delete_update_chat(obj, request_user):
     """
     Checks if a user has permission to delete or update a chat.
     """
-    if obj.type == 'group' and obj.created_by == request_user:
+    if obj.type == 'group' and obj.created_by_id == request_user.id:
         return True
-    if obj.type == 'personal' and request_user in obj.users.all():
+    if obj.type == 'personal' and any(user.id == request_user.id for user in obj.users.all()):
         return True
     return False
 
 
-def _delete_chat(instance):
+def _delete_chat(instance, requested_by=None):
     """
-    Deletes a chat instance.
+    Hides a chat and schedules the background deletion of its data.
+    Returns the deletion job.
     """
-    instance.delete()
+    return hide_chat_and_schedule_deletion(chat=instance, requested_by=requested_by)
 
 
 def _validate_process_user_join_to_group_chat(data):
@@ -106,3 +319,168 @@ def _validate_process_user_join_to_group_chat(data):
         raise serializers.ValidationError(_('The user has already joined this group chat.'))
     chat.users.add(user)
     return data
+
+
+def _validate_users_exist(user_ids):
+    """
+    Validates with a single query that every user ID exists.
+    """
+    existing_ids = set(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    missing_ids = sorted(set(user_ids) - existing_ids)
+    if missing_ids:
+        raise serializers.ValidationError(
+            {'user_ids': _('Users not found: %(ids)s.') % {'ids': ', '.join(map(str, missing_ids))}}
+        )
+    return user_ids
+
+
+def _add_users_to_group_chat(chat, user_ids):
+    """
+    Adds the users who are not members yet to a group chat with a single
+    insert and returns the IDs of the users actually added.
+    """
+    ChatUser = Chat.users.through
+    with transaction.atomic():
+        member_ids = set(
+            ChatUser.objects
+            .filter(chat_id=chat.pk, customuser_id__in=user_ids)
+            .values_list('customuser_id', flat=True)
+        )
+        added_ids = [user_id for user_id in user_ids if user_id not in member_ids]
+        ChatUser.objects.bulk_create(
+            [ChatUser(chat_id=chat.pk, customuser_id=user_id) for user_id in added_ids],
+            ignore_conflicts=True,
+        )
+        if added_ids:
+            transaction.on_commit(lambda: broadcast_members_changed(chat.pk, added=added_ids), robust=True)
+            bump_response_version('chat', chat.pk)
+    return added_ids
+
+
+def _remove_users_from_group_chat(chat, user_ids):
+    """
+    Removes members from a group chat with a single delete and returns
+    the IDs of the users actually removed.
+    The chat creator cannot be removed.
+    """
+    if chat.created_by_id in user_ids:
+        raise serializers.ValidationError({'user_ids': _('The chat creator cannot be removed.')})
+    ChatUser = Chat.users.through
+    with transaction.atomic():
+        memberships = ChatUser.objects.filter(chat_id=chat.pk, customuser_id__in=user_ids)
+        removed_ids = list(memberships.values_list('customuser_id', flat=True))
+        memberships.delete()
+        if removed_ids:
+            transaction.on_commit(lambda: broadcast_members_changed(chat.pk, removed=removed_ids), robust=True)
+            bump_response_version('chat', chat.pk)
+            for user_id in removed_ids:
+                bump_response_version('user-chats', user_id)
+    return removed_ids
+
+
+def _make_etag(*parts):
+    """
+    Returns a quoted strong ETag built from the given parts.
+    """
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def _get_chats_list_validators(request_user, include_messages):
+    """
+    Returns the ETag and Last-Modified time of the chats list of a user
+    from the IDs of the user's chats, their response versions and the
+    version of the user's memberships, which moves when the user leaves
+    a chat, without loading or serializing the chats.
+    """
+    chat_ids = sorted(Chat.objects.filter(users=request_user).values_list('id', flat=True))
+    versions = get_response_versions('chat', chat_ids)
+    membership_version, membership_modified_at = get_response_versions('user-chats', [request_user.id])[request_user.id]
+    etag = _make_etag(
+        'chats-list', request_user.id, include_messages, membership_version,
+        [(pk, versions[pk][0]) for pk in chat_ids]
+    )
+    # HTTP dates have a resolution of one second
+    last_modified = int(max([membership_modified_at, *(modified_at for _, modified_at in versions.values())]))
+    return etag, last_modified
+
+
+def _get_chat_detail_validators(pk, request_user, include_messages):
+    """
+    Returns the version, ETag and Last-Modified time of a chat detail
+    response, or three Nones while the chat has no version counter yet.
+    """
+    version, modified_at = get_response_versions('chat', [pk], seed=False)[pk]
+    if version is None:
+        return None, None, None
+    return version, _make_etag('chat-detail', pk, version, request_user.id, include_messages), int(modified_at)
+
+
+def _get_chat_export_rows(chat, after):
+    """
+    Returns the exported fields of the chat's messages with an ID greater
+    than `after`, in ID order.
+    """
+    return (
+        Message.objects
+        .filter(chat_id=chat.pk, id__gt=after)
+        .order_by('id')
+        .values_list('id', 'sequence', 'client_message_id', 'content', 'timestamp', 'sender_id', 'sender__username')
+    )
+
+
+def _render_chat_export_rows(renderer, rows):
+    """
+    Renders export rows as NDJSON lines joined into one chunk.
+    """
+    return b''.join(
+        renderer.render({
+            'id': message_id,
+            'sequence': sequence,
+            'client_message_id': client_message_id,
+            'content': content,
+            'timestamp': timestamp,
+            'sender': sender_id,
+            'sender_username': sender_username,
+        }) + b'\n'
+        for message_id, sequence, client_message_id, content, timestamp, sender_id, sender_username in rows
+    )
+
+
+def _stream_chat_messages_as_ndjson(chat, after, chunk_size, compress):
+    """
+    Yields the messages of a chat with an ID greater than `after` as
+    NDJSON, one message per line in ID order, optionally gzip-compressed.
+    Rows are read with iterator(chunk_size=...), so memory use does not
+    depend on the size of the chat; an interrupted export is resumed by
+    passing the ID of the last exported message as `after`.
+    """
+    renderer = FastJSONRenderer()
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    rows = _get_chat_export_rows(chat, after).iterator(chunk_size=chunk_size)
+    while chunk_rows := list(itertools.islice(rows, chunk_size)):
+        chunk = _render_chat_export_rows(renderer, chunk_rows)
+        yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+
+async def _astream_chat_messages_as_ndjson(chat, after, chunk_size, compress):
+    """
+    Async version of _stream_chat_messages_as_ndjson for ASGI, where
+    StreamingHttpResponse would collect a sync iterator into a list before
+    sending it. Each chunk is fetched with its own keyset query through
+    sync_to_async and sent before the next one is read.
+    """
+    renderer = FastJSONRenderer()
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    while True:
+        chunk_rows = await sync_to_async(list)(_get_chat_export_rows(chat, after)[:chunk_size])
+        if not chunk_rows:
+            break
+        after = chunk_rows[-1][0]
+        chunk = _render_chat_export_rows(renderer, chunk_rows)
+        yield compressor.compress(chunk) if compressor else chunk
+        if len(chunk_rows) < chunk_size:
+            break
+    if compressor:
+        yield compressor.flush()
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from config.response_cache import bump_response_version
+from users.models import CustomUser
+from .models import Chat, Message
+from .search import reindex_chat_name
+
+
+@receiver(post_save, sender=Chat)
+def index_group_chat_name(instance, created, **kwargs):
+    # Перестраиваем n-граммы названия группового чата для поиска
+    if created and instance.type != 'group':
+        return
+    reindex_chat_name(instance, created=created)
+
+
+@receiver(post_save, sender=Chat)
+@receiver(post_delete, sender=Chat)
+def bump_chat_version(instance, **kwargs):
+    bump_response_version('chat', instance.pk)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def bump_chat_version_on_message(instance, **kwargs):
+    bump_response_version('chat', instance.chat_id)
+
+
+@receiver(m2m_changed, sender=Chat.users.through)
+def bump_chat_version_on_members(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_response_version('chat', instance.pk)
+        if action != 'post_add':
+            # Чат пропал из списков удалённых участников
+            user_ids = pk_set if action == 'post_remove' else instance.users.values_list('pk', flat=True)
+            for user_id in user_ids:
+                bump_response_version('user-chats', user_id)
+        return
+    # Участники изменены со стороны пользователя: user.chats.add(...)
+    chat_ids = pk_set if action != 'pre_clear' else instance.chats.values_list('pk', flat=True)
+    for chat_id in chat_ids:
+        bump_response_version('chat', chat_id)
+    if action != 'post_add':
+        bump_response_version('user-chats', instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_chat_versions_on_user(instance, created, update_fields, **kwargs):
+    # Номер телефона и имя участника входят в ответ чата; вход в систему их не меняет
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    for chat_id in instance.chats.values_list('pk', flat=True):
+        bump_response_version('chat', chat_id)
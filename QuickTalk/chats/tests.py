@@ -1,3 +1,1320 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.utils import timezone
+from rest_framework.test import APIClient
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels.layers import InMemoryChannelLayer
+from channels.db import database_sync_to_async
+from users.models import CustomUser
+from .models import Chat, ChatDeletionJob, Message
+from .routing import websocket_urlpatterns
+from .services.chats_serializers_services import _remove_users_from_group_chat, _update_name_of_existing_group_chat
+from . import coalescing, deletion, persistence, throttling
+from .deletion import hide_chat_and_schedule_deletion, purge_chat
+from .importer import ChatHistoryImporter
+from .coalescing import GroupEventCoalescer
+from .consumers import ChatConsumer
+from .throttling import TokenBucketRateLimiter, websocket_counters
+from .layers import ConsistentHashRing, LocalFanoutChannelLayer, ShardedRedisChannelLayer
+from config.response_cache import _modified_key, get_response_version, response_cache
+import atexit
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+import asyncio
+import msgpack
 
-# Create your tests here.
+
+class ChatsQueryBudgetTests(TestCase):
+    """
+    Pins the number of queries for every endpoint in chats.urls,
+    independently of how many chats, members and messages exist.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.others = [
+            CustomUser.objects.create_user(phone_number=f'+1202555011{i}', password='pass12345')
+            for i in range(5)
+        ]
+        cls.group_chats = []
+        for i in range(5):
+            chat = Chat.objects.create(type='group', name=f'group {i}', created_by=cls.user)
+            chat.users.add(cls.user, *cls.others)
+            cls.group_chats.append(chat)
+        cls.personal_chats = []
+        for other in cls.others[:3]:
+            chat = Chat.objects.create(type='personal', created_by=cls.user)
+            chat.users.add(cls.user, other)
+            cls.personal_chats.append(chat)
+        for chat in cls.group_chats + cls.personal_chats:
+            for i in range(5):
+                Message.objects.create(chat=chat, sender=cls.others[i % 3], content=f'message {i}')
+        cls.stranger = CustomUser.objects.create_user(phone_number='+12025550199', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_group_chat(self):
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('api-create-group-chat'), {'name': 'new group'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_update_group_chat(self):
+        url = reverse('api-update-group-chat', kwargs={'pk': self.group_chats[0].pk})
+        with self.assertNumQueries(6):
+            response = self.client.put(url, {'name': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_chats_list(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('api-chats-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 8)
+
+    def test_chats_list_not_modified(self):
+        response = self.client.get(reverse('api-chats-list'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api-chats-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('api-chats-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(chat=self.group_chats[0], sender=self.user, content='new')
+        response = self.client.get(reverse('api-chats-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_chats_list_modified_after_leaving_chat(self):
+        member = self.others[0]
+        self.client.force_authenticate(member)
+        chat_ids = list(member.chats.values_list('pk', flat=True))
+        # Последние изменения в прошлом, чтобы удаление попало в следующую секунду
+        cache.set_many({
+            **{_modified_key('chat', pk): time.time() - 10 for pk in chat_ids},
+            _modified_key('user-chats', member.pk): time.time() - 10,
+        })
+        last_modified = self.client.get(reverse('api-chats-list'))['Last-Modified']
+        response = self.client.get(reverse('api-chats-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _remove_users_from_group_chat(self.group_chats[0], [member.pk])
+        response = self.client.get(reverse('api-chats-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), len(chat_ids) - 1)
+
+        cache.set(_modified_key('user-chats', member.pk), time.time() - 10)
+        last_modified = self.client.get(reverse('api-chats-list'))['Last-Modified']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group_chats[1].users.remove(member)
+        response = self.client.get(reverse('api-chats-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_chat_not_modified(self):
+        url = reverse('api-detail-chat', kwargs={'pk': self.personal_chats[0].pk})
+        # Первый ответ только заводит счётчик версии и отдаётся без валидаторов
+        self.assertNotIn('ETag', self.client.get(url))
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, {'include_messages': 'false'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_chats_list_without_messages(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api-chats-list'), {'include_messages': 'false'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_chats_list_inbox(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api-chats-list'), {'mode': 'inbox'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 8)
+
+    def test_create_personal_chat(self):
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                reverse('api-create-personal-chat'),
+                {'chosen_user_to_prsnl_cht_id': self.stranger.pk}
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_create_existing_personal_chat(self):
+        url = reverse('api-create-personal-chat')
+        created = self.client.post(url, {'chosen_user_to_prsnl_cht_id': self.stranger.pk})
+        with self.assertNumQueries(2):
+            response = self.client.post(url, {'chosen_user_to_prsnl_cht_id': self.stranger.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['chat_id']['id'], created.data['chat_id']['id'])
+
+        self.client.force_authenticate(self.stranger)
+        response = self.client.post(url, {'chosen_user_to_prsnl_cht_id': self.user.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['chat_id']['id'], created.data['chat_id']['id'])
+
+    def test_detail_chat(self):
+        url = reverse('api-detail-chat', kwargs={'pk': self.personal_chats[0].pk})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['detail']['messages_of_chat']), 5)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_detail_chat_cache_follows_changes(self):
+        chat = self.personal_chats[0]
+        url = reverse('api-detail-chat', kwargs={'pk': chat.pk})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(chat=chat, sender=self.user, content='new')
+        self.assertEqual(len(self.client.get(url).data['detail']['messages_of_chat']), 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.others[0].phone_number = '+12025550177'
+            self.others[0].save()
+        self.assertEqual(self.client.get(url).data['detail']['chat_name'], '+12025550177')
+        stats = response_cache.stats()
+        # Первый запрос идёт мимо кэша, пока у чата нет счётчика версии
+        self.assertEqual((stats['hits'], stats['misses']), (0, 2))
+
+    def test_detail_of_missing_chat_leaves_no_version(self):
+        response = self.client.get(reverse('api-detail-chat', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(get_response_version('chat', 999999, seed=False))
+
+    def test_messages_chat(self):
+        url = reverse('api-messages-chat', kwargs={'pk': self.group_chats[0].pk})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_chat(self):
+        url = reverse('api-export-chat', kwargs={'pk': self.group_chats[0].pk})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+            content = b''.join(response.streaming_content)
+        self.assertEqual(len(content.splitlines()), 5)
+
+    def test_read_chat(self):
+        url = reverse('api-read-chat', kwargs={'pk': self.group_chats[0].pk})
+        with self.assertNumQueries(4):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_group_chat(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api-search-group-chat'), {'query': 'group'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['member_count'], 6)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('api-search-group-chat'), {'query': 'group'})
+
+    def test_delete_chat(self):
+        url = reverse('api-delete-chat', kwargs={'pk': self.group_chats[0].pk})
+        with self.assertNumQueries(8):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 202)
+
+    def test_chat_deletion_status(self):
+        job = hide_chat_and_schedule_deletion(self.group_chats[0], self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api-chat-deletion-status', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_stats(self):
+        self.client.force_authenticate(CustomUser.objects.create_user(
+            phone_number='+12025550198', password='pass12345', is_staff=True
+        ))
+        for name in ('api-response-cache-stats', 'api-websocket-stats'):
+            with self.subTest(name):
+                with self.assertNumQueries(0):
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_join_to_group_chat(self):
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                reverse('api-join-to-group-chat'),
+                {'user_id_to_join': self.stranger.pk, 'chat_id_to_join': self.group_chats[0].pk}
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_add_group_chat_members(self):
+        url = reverse('api-group-chat-members', kwargs={'pk': self.group_chats[0].pk})
+        user_ids = [self.stranger.pk] + [other.pk for other in self.others]
+        with self.assertNumQueries(6):
+            response = self.client.post(url, {'user_ids': user_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], [self.stranger.pk])
+
+        response = self.client.post(url, {'user_ids': [self.stranger.pk, 0]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_remove_group_chat_members(self):
+        url = reverse('api-group-chat-members', kwargs={'pk': self.group_chats[0].pk})
+        user_ids = [self.stranger.pk] + [other.pk for other in self.others]
+        with self.assertNumQueries(6):
+            response = self.client.delete(url, {'user_ids': user_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['removed']), sorted(other.pk for other in self.others))
+        self.assertEqual(list(self.group_chats[0].users.all()), [self.user])
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'chats.tests.UnavailableChannelLayer'}})
+    def test_group_chat_members_change_when_channel_layer_fails(self):
+        url = reverse('api-group-chat-members', kwargs={'pk': self.group_chats[0].pk})
+        for method in (self.client.post, self.client.delete):
+            with self.subTest(method=method.__name__):
+                with self.assertLogs('django.test', 'ERROR'):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        response = method(url, {'user_ids': [self.stranger.pk]}, format='json')
+                self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.group_chats[0].users.filter(pk=self.stranger.pk).exists())
+
+    def test_search_messages(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api-search-messages'), {'query': 'mess'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['next_page'], 2)
+
+
+class MessageHistoryTests(TestCase):
+    """
+    Checks the keyset cursor of the message history in both orders.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.chat = Chat.objects.create(type='group', name='group', created_by=cls.user)
+        cls.chat.users.add(cls.user)
+        cls.messages = [
+            Message.objects.create(chat=cls.chat, sender=cls.user, content=f'message {i}')
+            for i in range(7)
+        ]
+        # Несколько сообщений с одинаковым временем проверяют сравнение по id
+        Message.objects.filter(pk__in=[message.pk for message in cls.messages[1:6]]).update(
+            timestamp=cls.messages[1].timestamp
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('api-messages-chat', kwargs={'pk': self.chat.pk})
+
+    def get_all_pages(self, order):
+        ids = []
+        params = {'order': order, 'page_size': 2}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(message['id'] for message in response.data['results'])
+            if response.data['next_cursor'] is None:
+                return ids
+            params['cursor'] = response.data['next_cursor']
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        ids = [message.pk for message in self.messages]
+        self.assertEqual(self.get_all_pages('oldest'), ids)
+        self.assertEqual(self.get_all_pages('newest'), ids[::-1])
+
+    def test_invalid_cursor(self):
+        for cursor in ['not base64!', 'bm90IGEgY3Vyc29y', 'MjAyNC0wMS0wMnxub3QtYW4taWQ=', 'bm90LWEtZGF0ZXwx']:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+
+class ChatsInboxTests(TestCase):
+    """
+    Checks the per-user unread counts and ordering of the chats inbox.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.bob = CustomUser.objects.create_user(phone_number='+12025550101', password='pass12345')
+        cls.quiet_chat = Chat.objects.create(type='group', name='quiet', created_by=cls.alice)
+        cls.quiet_chat.users.add(cls.alice, cls.bob)
+        cls.chat = Chat.objects.create(type='group', name='busy', created_by=cls.alice)
+        cls.chat.users.add(cls.alice, cls.bob)
+        for i in range(3):
+            Message.objects.create(chat=cls.chat, sender=cls.alice, content=f'from alice {i}')
+        for i in range(2):
+            Message.objects.create(chat=cls.chat, sender=cls.bob, content=f'from bob {i}')
+
+    def get_inbox(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(reverse('api-chats-list'), {'mode': 'inbox', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_unread_counts(self, user):
+        return {chat['id']: chat['unread_count'] for chat in self.get_inbox(user)['results']}
+
+    def read_chat(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse('api-read-chat', kwargs={'pk': self.chat.pk}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unread_counts_are_per_user(self):
+        self.assertEqual(self.get_unread_counts(self.alice), {self.chat.pk: 2, self.quiet_chat.pk: 0})
+        self.assertEqual(self.get_unread_counts(self.bob), {self.chat.pk: 3, self.quiet_chat.pk: 0})
+
+        self.read_chat(self.alice)
+        self.assertEqual(self.get_unread_counts(self.alice)[self.chat.pk], 0)
+        self.assertEqual(self.get_unread_counts(self.bob)[self.chat.pk], 3)
+
+        Message.objects.create(chat=self.chat, sender=self.bob, content='after read')
+        self.assertEqual(self.get_unread_counts(self.alice)[self.chat.pk], 1)
+        self.read_chat(self.bob)
+        self.assertEqual(self.get_unread_counts(self.bob)[self.chat.pk], 0)
+
+    def test_ordered_by_last_activity(self):
+        results = self.get_inbox(self.alice)['results']
+        self.assertEqual([chat['id'] for chat in results], [self.chat.pk, self.quiet_chat.pk])
+        self.assertEqual(results[0]['last_message_preview'], 'from bob 1')
+        self.assertEqual(results[0]['last_message_sender'], self.bob.pk)
+        Message.objects.create(chat=self.quiet_chat, sender=self.bob, content='wake up')
+        self.assertEqual(self.get_inbox(self.alice)['results'][0]['id'], self.quiet_chat.pk)
+
+    def test_query_budget_does_not_grow_with_chats(self):
+        for i in range(10):
+            chat = Chat.objects.create(type='group', name=f'group {i}', created_by=self.alice)
+            chat.users.add(self.alice, self.bob)
+            Message.objects.create(chat=chat, sender=self.bob, content='hello')
+        self.read_chat(self.alice)
+        with self.assertNumQueries(2):
+            data = self.get_inbox(self.alice, page_size=100)
+        self.assertEqual(data['count'], 12)
+
+
+class GroupChatRenameTests(TestCase):
+    """
+    Checks that renaming a group chat leaves its other columns alone.
+    """
+
+    def test_rename_keeps_message_sequence(self):
+        user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        chat = Chat.objects.create(type='group', name='group', created_by=user)
+        stale = Chat.objects.get(pk=chat.pk)
+        Message.objects.create(chat=chat, sender=user, content='first')
+        _update_name_of_existing_group_chat(stale, 'renamed')
+        message = Message.objects.create(chat=chat, sender=user, content='second')
+        chat.refresh_from_db()
+        self.assertEqual((chat.name, chat.last_message_sequence, message.sequence), ('renamed', 2, 2))
+
+
+class UnavailableChannelLayer(InMemoryChannelLayer):
+    """
+    Channel layer whose backend is down.
+    """
+
+    async def group_send(self, group, message):
+        raise ConnectionError('Channel layer is unavailable.')
+
+
+class GroupListingChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory channel layer that lists the channels of a group, as
+    ShardedRedisChannelLayer does.
+    """
+
+    async def group_channels(self, group):
+        return list(self.groups.get(group, {}))
+
+
+class RecordingExecutor:
+    """
+    Executor that records submitted jobs instead of running them.
+    """
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+
+class ChatDeletionTests(TestCase):
+    """
+    Checks that a deleted chat is hidden at once and purged in batches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.chat = Chat.objects.create(type='group', name='group', created_by=cls.user)
+        cls.chat.users.add(cls.user)
+        for i in range(5):
+            Message.objects.create(chat=cls.chat, sender=cls.user, content=f'message {i}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(CHAT_DELETION_BATCH_SIZE=2)
+    def test_chat_is_hidden_then_purged(self):
+        with self.captureOnCommitCallbacks():
+            response = self.client.delete(reverse('api-delete-chat', kwargs={'pk': self.chat.pk}))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(reverse('api-chats-list')).data, [])
+        self.assertFalse(Chat.objects.filter(pk=self.chat.pk).exists())
+
+        job = purge_chat(response.data['job']['id'])
+        self.assertEqual((job.status, job.deleted_messages, job.total_messages), ('done', 5, 5))
+        self.assertFalse(Chat.all_objects.filter(pk=self.chat.pk).exists())
+        self.assertFalse(Message.objects.filter(chat_id=self.chat.pk).exists())
+
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.data['status'], 'done')
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'chats.tests.UnavailableChannelLayer'}})
+    def test_purge_is_scheduled_when_channel_layer_fails(self):
+        executor = RecordingExecutor()
+        deletion._executor = executor
+        self.addCleanup(setattr, deletion, '_executor', None)
+        with self.assertLogs('django.test', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(reverse('api-delete-chat', kwargs={'pk': self.chat.pk}))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(executor.submitted, [(response.data['job']['id'],)])
+
+    def test_writes_to_deleted_chat_are_rejected(self):
+        other = Chat.objects.create(type='group', name='other', created_by=self.user)
+        Chat.all_objects.filter(pk=self.chat.pk).update(deleted_at=timezone.now())
+        with self.assertRaises(Chat.DoesNotExist):
+            Message.objects.create_in_chat(chat=self.chat, sender=self.user, content='late')
+        saved = Message.objects.bulk_create_in_chats([
+            Message(chat=self.chat, sender=self.user, content='late'),
+            Message(chat=other, sender=self.user, content='kept'),
+        ])
+        self.assertIsNone(saved[0])
+        self.assertEqual((saved[1].content, saved[1].sequence), ('kept', 1))
+        self.assertEqual(Message.objects.filter(chat_id=self.chat.pk).count(), 5)
+
+
+class ChatExportTests(TestCase):
+    """
+    Checks the streaming NDJSON export, its resumption and gzip compression.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.chat = Chat.objects.create(type='group', name='group', created_by=cls.user)
+        cls.chat.users.add(cls.user)
+        cls.messages = [
+            Message.objects.create(chat=cls.chat, sender=cls.user, content=f'message {i}\nпривет')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('api-export-chat', kwargs={'pk': self.chat.pk})
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        if params.get('compress') == 'gzip':
+            content = gzip.decompress(content)
+        return [json.loads(line) for line in content.splitlines()]
+
+    @override_settings(CHAT_EXPORT_CHUNK_SIZE=2)
+    def test_export(self):
+        rows = self.export()
+        self.assertEqual([row['id'] for row in rows], [message.pk for message in self.messages])
+        self.assertEqual(rows[0]['content'], 'message 0\nпривет')
+        self.assertEqual(rows[0]['sender_username'], self.user.username)
+        self.assertEqual(self.export(compress='gzip'), rows)
+        self.assertEqual(self.export(after=self.messages[2].pk), rows[3:])
+
+    @override_settings(CHAT_EXPORT_CHUNK_SIZE=2)
+    async def test_export_streams_incrementally_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url, {'compress': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = aiter(response.streaming_content)
+        first = await anext(chunks)
+        # Следующие пачки читаются из базы только после отправки первой
+        late = await Message.objects.acreate(chat=self.chat, sender=self.user, content='late')
+        content = gzip.decompress(first + b''.join([chunk async for chunk in chunks]))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [message.pk for message in self.messages] + [late.pk])
+
+    def test_export_requires_membership(self):
+        self.client.force_authenticate(CustomUser.objects.create_user(phone_number='+12025550101', password='pass12345'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class ChatHistoryImportTests(TestCase):
+    """
+    Checks the bulk history import from NDJSON and CSV archives.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345', is_staff=True)
+        cls.sender = CustomUser.objects.create_user(phone_number='+12025550101', password='pass12345')
+        cls.chat = Chat.objects.create(type='group', name='imported', created_by=cls.admin)
+        cls.chat.users.add(cls.admin)
+
+    def test_import_command_is_resumable(self):
+        rows = [
+            {'id': 'a1', 'phone_number': '+1 202-555-0101', 'content': 'first', 'timestamp': '2020-01-01T10:00:00'},
+            {'id': 'a2', 'phone_number': '+12025550101', 'content': 'second', 'timestamp': '2020-01-01T10:01:00Z'},
+            {'id': 'a3', 'phone_number': '+12025550199', 'content': 'unknown sender', 'timestamp': '2020-01-01T10:02:00Z'},
+            {'id': 'a4', 'phone_number': 'not a phone', 'content': 'invalid', 'timestamp': '2020-01-01T10:03:00Z'},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as archive:
+            archive.write('\n'.join(json.dumps(row) for row in rows))
+        self.addCleanup(os.remove, archive.name)
+
+        call_command('import_chat_history', archive.name, chat=self.chat.pk, batch_size=2, stdout=io.StringIO())
+        messages = list(self.chat.messages.order_by('sequence'))
+        self.assertEqual([message.content for message in messages], ['first', 'second'])
+        self.assertEqual(messages[0].timestamp.isoformat(), '2020-01-01T10:00:00+00:00')
+        self.assertTrue(self.chat.users.filter(pk=self.sender.pk).exists())
+
+        call_command('import_chat_history', archive.name, chat=self.chat.pk, stdout=io.StringIO())
+        self.assertEqual(self.chat.messages.count(), 2)
+
+    def test_duplicates_are_skipped_before_allocating_sequences(self):
+        Message.objects.create(chat=self.chat, sender=self.sender, content='live', client_message_id='b1')
+        rows = [
+            {'id': 'b1', 'phone_number': '+12025550101', 'content': 'already sent', 'timestamp': '2020-01-01T10:00:00Z'},
+            {'id': 'b2', 'phone_number': '+12025550101', 'content': 'first', 'timestamp': '2020-01-01T10:01:00Z'},
+            {'id': 'b2', 'phone_number': '+12025550101', 'content': 'repeated', 'timestamp': '2020-01-01T10:01:00Z'},
+            {'phone_number': '+12025550101', 'content': 'without id', 'timestamp': '2020-01-01T10:02:00Z'},
+        ]
+        stats = ChatHistoryImporter(self.chat, batch_size=10).run(rows)
+        self.assertEqual((stats['imported'], stats['skipped']), (2, 2))
+        self.assertEqual(
+            list(self.chat.messages.order_by('sequence').values_list('content', 'sequence')),
+            [('live', 1), ('first', 2), ('without id', 3)]
+        )
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.last_message_sequence, 3)
+
+    def test_unreadable_archives_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse('api-import-chat-history', kwargs={'pk': self.chat.pk})
+        row = b'{"id": "c1", "phone_number": "+12025550101", "content": "kept", "timestamp": "2020-01-01T10:00:00Z"}\n'
+        archives = [
+            ('history.ndjson', row + b'{"id": "c2", broken\n', 2),
+            ('history.ndjson', row + b'\n[1, 2]\n', 3),
+            ('history.csv', b'phone_number,content,timestamp\n+12025550101,\xff\xfe,2020-01-01T10:00:00Z\n', 2),
+            ('history.ndjson.gz', b'not gzip at all', 1),
+            ('history.ndjson.gz', gzip.compress(row * 3)[:-12], 2),
+        ]
+        for name, content, line in archives:
+            with self.subTest(name=name, line=line):
+                archive = io.BytesIO(content)
+                archive.name = name
+                response = client.post(url, {'file': archive, 'format': 'csv' if '.csv' in name else 'ndjson'}, format='multipart')
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.data['file'].startswith(f'Line {line}: '), response.data['file'])
+
+    def test_import_command_reports_bad_line(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as archive:
+            archive.write('{"id": "d1", "phone_number": "+12025550101", "content": "kept", "timestamp": "2020-01-01T10:00:00Z"}\n')
+            archive.write('"not an object"\n')
+        self.addCleanup(os.remove, archive.name)
+        with self.assertRaisesMessage(CommandError, 'Line 2: expected a JSON object. 1 messages were imported before it.'):
+            call_command('import_chat_history', archive.name, chat=self.chat.pk, batch_size=1, stdout=io.StringIO())
+        self.assertEqual(self.chat.messages.get().content, 'kept')
+
+    def test_import_api(self):
+        archive = io.BytesIO(gzip.compress(
+            b'phone_number,content,timestamp\n+12025550101,"hello, world",2020-01-01T10:00:00Z\n'
+        ))
+        archive.name = 'history.csv.gz'
+        client = APIClient()
+        client.force_authenticate(self.sender)
+        url = reverse('api-import-chat-history', kwargs={'pk': self.chat.pk})
+        self.assertEqual(client.post(url, {'file': archive}, format='multipart').status_code, 403)
+
+        archive.seek(0)
+        client.force_authenticate(self.admin)
+        response = client.post(url, {'file': archive}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['imported'], response.data['skipped']), (1, 0))
+        self.assertEqual(self.chat.messages.get().content, 'hello, world')
+
+
+class MessageSearchTests(TestCase):
+    """
+    Checks that the full-text index follows message changes and
+    only returns messages from the user's chats.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.chat = Chat.objects.create(type='group', name='group', created_by=cls.user)
+        cls.chat.users.add(cls.user)
+        cls.foreign_chat = Chat.objects.create(type='group', name='foreign')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get(reverse('api-search-messages'), {'query': query})
+        return [message['id'] for message in response.data['results']]
+
+    def test_index_follows_created_and_deleted_messages(self):
+        message = Message.objects.create(chat=self.chat, sender=self.user, content='Quarterly report is ready')
+        Message.objects.create(chat=self.foreign_chat, sender=self.user, content='Quarterly report leaked')
+        Message.objects.bulk_create_in_chats([
+            Message(chat=self.chat, sender=self.user, content='Report draft'),
+        ])
+        self.assertEqual(len(self.search('report')), 2)
+        self.assertEqual(self.search('quarterly "report'), [message.pk])
+        message.delete()
+        self.assertEqual(len(self.search('quarterly')), 0)
+
+
+class GroupChatSearchTests(TestCase):
+    """
+    Checks n-gram based group chat search by prefix and substring.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        for name in ['Marketing team', 'Team building', 'Sales', 'Dev team room']:
+            Chat.objects.create(type='group', name=name, created_by=cls.user)
+        Chat.objects.create(type='personal', created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get(reverse('api-search-group-chat'), {'query': query})
+        return [chat['name'] for chat in response.data['results']]
+
+    def test_prefix_matches_come_first(self):
+        self.assertEqual(self.search('team'), ['Team building', 'Dev team room', 'Marketing team'])
+
+    def test_trigrams_out_of_order_do_not_match(self):
+        Chat.objects.create(type='group', name='abcxbcd', created_by=self.user)
+        Chat.objects.create(type='group', name='Команда ABCD', created_by=self.user)
+        self.assertEqual(self.search('abcd'), ['Команда ABCD'])
+        self.assertEqual(self.search('КОМАНДА'), ['Команда ABCD'])
+
+    def test_short_and_renamed_queries(self):
+        self.assertEqual(self.search('in'), ['Marketing team', 'Team building'])
+        chat = Chat.objects.get(name='Sales')
+        chat.name = 'Support'
+        chat.save()
+        cache.clear()
+        self.assertEqual(self.search('sales'), [])
+        self.assertEqual(self.search('uppo'), ['Support'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(TransactionTestCase):
+    """
+    Checks connect-time authorization and message delivery in ChatConsumer.
+    """
+
+    def setUp(self):
+        throttling._limiters = None
+        self.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        self.stranger = CustomUser.objects.create_user(phone_number='+12025550199', password='pass12345')
+        self.chat = Chat.objects.create(type='group', name='group', created_by=self.user)
+        self.chat.users.add(self.user)
+
+    def get_communicator(self, user, chat_id):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f'/ws/chat/{chat_id}/'
+        )
+        communicator.scope['user'] = user
+        return communicator
+
+    async def test_member_sends_and_receives_message(self):
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'message': 'hello'})
+        event = await communicator.receive_json_from()
+        self.assertEqual(event['message'], 'hello')
+        self.assertEqual(event['user_id'], self.user.pk)
+        await communicator.disconnect()
+        self.assertTrue(await Message.objects.filter(chat=self.chat, content='hello').aexists())
+
+    async def test_retried_client_message_id_is_stored_once(self):
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        for _ in range(2):
+            await communicator.send_json_to({'message': 'hello', 'client_message_id': 'retry-1'})
+        first = await communicator.receive_json_from()
+        second = await communicator.receive_json_from()
+        await communicator.send_json_to({'message': 'next'})
+        third = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual((first['sequence'], third['sequence']), (1, 2))
+        self.assertEqual(await Message.objects.filter(chat=self.chat).acount(), 2)
+
+    async def test_non_member_is_rejected(self):
+        communicator = self.get_communicator(self.stranger, self.chat.pk)
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_anonymous_user_is_rejected(self):
+        communicator = self.get_communicator(AnonymousUser(), self.chat.pk)
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_msgpack_subprotocol_sends_compact_binary_frames(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f'/ws/chat/{self.chat.pk}/',
+            subprotocols=['quicktalk.msgpack']
+        )
+        communicator.scope['user'] = self.user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'quicktalk.msgpack')
+        await communicator.send_to(bytes_data=msgpack.packb({'message': 'hello'}))
+        event = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(event['m'], 'hello')
+        self.assertEqual(event['s'], self.user.pk)
+        self.assertIsInstance(event['ts'], int)
+        self.assertNotIn('k', event)
+        await communicator.disconnect()
+
+    @override_settings(CHAT_CONSUMER_ORM='async', CHAT_DB_EXECUTOR_WORKERS=2)
+    async def test_async_orm_path_stores_retry_once_and_replays(self):
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        for _ in range(2):
+            await communicator.send_json_to({'message': 'hello', 'client_message_id': 'retry-1'})
+        first = await communicator.receive_json_from()
+        second = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(first['id'], second['id'])
+
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        communicator.scope['query_string'] = b'since=0'
+        await communicator.connect()
+        replayed = await communicator.receive_json_from()
+        await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual((replayed['id'], replayed['username']), (first['id'], self.user.username))
+        self.assertEqual(await Message.objects.filter(chat=self.chat).acount(), 1)
+
+    async def test_deleted_chat_closes_connected_sockets(self):
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        job = await database_sync_to_async(hide_chat_and_schedule_deletion)(self.chat, self.user)
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'chat_deleted', 'chat_id': self.chat.pk}
+        )
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
+        # Ждём фоновую очистку, чтобы она не пересеклась с очисткой базы теста
+        while (await ChatDeletionJob.objects.aget(pk=job.pk)).status not in ('done', 'failed'):
+            await asyncio.sleep(0.01)
+
+    async def test_message_to_deleted_chat_is_rejected(self):
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        await Chat.all_objects.filter(pk=self.chat.pk).aupdate(deleted_at=timezone.now())
+        await communicator.send_json_to({'message': 'late'})
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'error', 'chat_id': self.chat.pk, 'error': 'Chat has been deleted.'}
+        )
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
+        self.assertFalse(await Message.objects.filter(chat_id=self.chat.pk).aexists())
+
+    @override_settings(CHAT_REPLAY_BATCH_SIZE=2, CHAT_REPLAY_MAX_MESSAGES=4)
+    async def test_reconnect_replays_missed_messages_in_batches(self):
+        messages = [
+            await Message.objects.acreate(chat=self.chat, sender=self.user, content=f'message {i}')
+            for i in range(6)
+        ]
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        communicator.scope['query_string'] = f'since={messages[0].pk}'.encode()
+        await communicator.connect()
+        replayed = [await communicator.receive_json_from() for _ in range(4)]
+        self.assertEqual([event['id'] for event in replayed], [message.pk for message in messages[1:5]])
+        done = await communicator.receive_json_from()
+        self.assertEqual(done, {
+            'type': 'replay_done', 'chat_id': self.chat.pk, 'last_id': messages[4].pk, 'truncated': True
+        })
+        await communicator.disconnect()
+
+    @override_settings(CHAT_MESSAGE_WRITE_BEHIND=True, CHAT_MESSAGE_WRITE_BEHIND_MAX_DELAY=0.01)
+    async def test_write_behind_broadcasts_then_persists(self):
+        persistence._message_buffer = None
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        await communicator.send_json_to({'message': 'first'})
+        await communicator.send_json_to({'message': 'second'})
+        events = [await communicator.receive_json_from() for _ in range(4)]
+        await communicator.disconnect()
+        broadcasts = [event for event in events if 'message' in event]
+        persisted = {event['temp_id']: event['id'] for event in events if event.get('type') == 'message_persisted'}
+        self.assertEqual([event['message'] for event in broadcasts], ['first', 'second'])
+        ids = [persisted[event['temp_id']] for event in broadcasts]
+        self.assertLess(ids[0], ids[1])
+        contents = [message.content async for message in Message.objects.filter(pk__in=ids).order_by('pk')]
+        self.assertEqual(contents, ['first', 'second'])
+
+    @override_settings(CHAT_MESSAGE_WRITE_BEHIND=True, CHAT_MESSAGE_WRITE_BEHIND_MAX_DELAY=0.01)
+    async def test_write_behind_failure_retracts_broadcast_message(self):
+        class FailingBuffer(persistence.MessageWriteBehindBuffer):
+            def _bulk_create(self, messages):
+                raise DatabaseError('database is unavailable')
+
+        persistence._message_buffer = FailingBuffer(batch_size=10, max_delay=0.01)
+        self.addCleanup(setattr, persistence, '_message_buffer', None)
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        with self.assertLogs('chats.consumers', 'ERROR') as logs:
+            await communicator.send_json_to({'message': 'lost'})
+            broadcast = await communicator.receive_json_from()
+            failed = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(failed, {'type': 'message_failed', 'chat_id': self.chat.pk, 'temp_id': broadcast['temp_id']})
+        self.assertIn('database is unavailable', logs.output[0])
+        self.assertFalse(await Message.objects.filter(chat=self.chat).aexists())
+
+    @override_settings(CHAT_COALESCE_MIN_MEMBERS=1, CHAT_COALESCE_MAX_WINDOW=0.2, CHAT_COALESCE_FULL_RATE=1)
+    async def test_large_group_events_arrive_as_array_frame(self):
+        coalescing._coalescer = None
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        for content in ('first', 'second', 'third'):
+            await communicator.send_json_to({'message': content})
+        first = await communicator.receive_json_from()
+        batch = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(first['message'], 'first')
+        self.assertEqual([event['message'] for event in batch], ['second', 'third'])
+        self.assertEqual(coalescing._coalescer.stats()['batches_sent'], 2)
+
+    @override_settings(CHAT_INBOUND_USER_BURST=2, CHAT_INBOUND_USER_RATE=0.01)
+    async def test_flooding_client_is_throttled(self):
+        throttled = websocket_counters['throttled_user']
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        for content in ('first', 'second', 'third'):
+            await communicator.send_json_to({'message': content})
+        events = [await communicator.receive_json_from() for _ in range(3)]
+        await communicator.disconnect()
+        errors = [event for event in events if event.get('type') == 'error']
+        self.assertEqual([event['message'] for event in events if 'message' in event], ['first', 'second'])
+        self.assertEqual([event['error'] for event in errors], ['Rate limit exceeded.'])
+        self.assertGreater(errors[0]['retry_after'], 0)
+        self.assertEqual(websocket_counters['throttled_user'], throttled + 1)
+        self.assertEqual(await Message.objects.filter(chat=self.chat).acount(), 2)
+
+    async def test_malformed_frames_get_error_frames(self):
+        communicator = self.get_communicator(self.user, self.chat.pk)
+        await communicator.connect()
+        for text_data in ('[]', '"x"', 'not json'):
+            await communicator.send_to(text_data=text_data)
+            self.assertEqual(
+                await communicator.receive_json_from(),
+                {'type': 'error', 'chat_id': self.chat.pk, 'error': 'Invalid frame.'}
+            )
+        for frame in ({}, {'message': ['hi']}):
+            await communicator.send_json_to(frame)
+            self.assertEqual((await communicator.receive_json_from())['error'], 'Message must be a string.')
+        await communicator.send_json_to({'message': 'still connected'})
+        self.assertEqual((await communicator.receive_json_from())['message'], 'still connected')
+        await communicator.disconnect()
+        self.assertEqual(await Message.objects.filter(chat=self.chat).acount(), 1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class UserChatsConsumerTests(TransactionTestCase):
+    """
+    Checks subscriptions and chat-tagged frames over the multiplexed socket.
+    """
+
+    def setUp(self):
+        throttling._limiters = None
+        self.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        self.chats = []
+        for i in range(2):
+            chat = Chat.objects.create(type='group', name=f'group {i}', created_by=self.user)
+            chat.users.add(self.user)
+            self.chats.append(chat)
+        self.foreign_chat = Chat.objects.create(type='group', name='foreign')
+
+    async def test_subscribe_send_and_unsubscribe(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chats/')
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        for chat in self.chats:
+            await communicator.send_json_to({'action': 'subscribe', 'chat_id': chat.pk})
+            self.assertEqual(
+                await communicator.receive_json_from(),
+                {'type': 'subscribed', 'chat_id': chat.pk}
+            )
+
+        await communicator.send_json_to({'action': 'subscribe', 'chat_id': self.foreign_chat.pk})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+
+        await communicator.send_json_to({'action': 'message', 'chat_id': self.chats[1].pk, 'message': 'hi'})
+        event = await communicator.receive_json_from()
+        self.assertEqual((event['chat_id'], event['message']), (self.chats[1].pk, 'hi'))
+
+        await communicator.send_json_to({'action': 'unsubscribe', 'chat_id': self.chats[1].pk})
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'action': 'message', 'chat_id': self.chats[1].pk, 'message': 'hi'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        await communicator.disconnect()
+
+    async def test_removed_member_is_unsubscribed(self):
+        chat = await database_sync_to_async(Chat.objects.create)(type='group', name='shared')
+        await database_sync_to_async(chat.users.add)(self.user)
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chats/')
+        communicator.scope['user'] = self.user
+        await communicator.connect()
+        await communicator.send_json_to({'action': 'subscribe', 'chat_id': chat.pk})
+        await communicator.receive_json_from()
+
+        await database_sync_to_async(_remove_users_from_group_chat)(chat, [self.user.pk])
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'members_changed', 'chat_id': chat.pk, 'added': [], 'removed': [self.user.pk]}
+        )
+        await communicator.send_json_to({'action': 'message', 'chat_id': chat.pk, 'message': 'hi'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        await communicator.disconnect()
+
+    async def test_malformed_frames_get_error_frames(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chats/')
+        communicator.scope['user'] = self.user
+        await communicator.connect()
+        await communicator.send_json_to({'action': 'subscribe', 'chat_id': self.chats[0].pk})
+        await communicator.receive_json_from()
+        await communicator.send_to(text_data='[]')
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'error', 'chat_id': None, 'error': 'Invalid frame.'}
+        )
+        await communicator.send_json_to({'action': 'message', 'chat_id': self.chats[0].pk})
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'error', 'chat_id': self.chats[0].pk, 'error': 'Message must be a string.'}
+        )
+        await communicator.disconnect()
+
+    async def test_resubscribing_does_not_use_message_budget(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chats/')
+        communicator.scope['user'] = self.user
+        await communicator.connect()
+        # Больше, чем вмещает пользовательский лимит сообщений
+        for _ in range(15):
+            for action in ('unsubscribe', 'subscribe'):
+                await communicator.send_json_to({'action': action, 'chat_id': self.chats[0].pk})
+                self.assertEqual((await communicator.receive_json_from())['type'], f'{action}d')
+        await communicator.send_json_to({'action': 'message', 'chat_id': self.chats[0].pk, 'message': 'hi'})
+        self.assertEqual((await communicator.receive_json_from())['message'], 'hi')
+        await communicator.disconnect()
+
+
+class LocalFanoutChannelLayerTests(SimpleTestCase):
+    """
+    Simulates two processes sharing one inner layer and checks that group
+    messages reach local members in memory and each remote process once.
+    """
+
+    async def test_group_send_across_processes(self):
+        inner = {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+        first = LocalFanoutChannelLayer(inner=inner)
+        second = LocalFanoutChannelLayer(inner=inner)
+        second.inner = first.inner
+        try:
+            await self.check_group_send(first, second)
+        finally:
+            await first.close()
+            await second.close()
+
+    async def test_group_send_to_listed_fanout_channels(self):
+        inner = {'BACKEND': 'chats.tests.GroupListingChannelLayer'}
+        first = LocalFanoutChannelLayer(inner=inner)
+        second = LocalFanoutChannelLayer(inner=inner)
+        second.inner = first.inner
+        try:
+            await self.check_group_send(first, second)
+        finally:
+            await first.close()
+            await second.close()
+
+    async def test_group_send_without_other_processes_stays_local(self):
+        layer = LocalFanoutChannelLayer(inner={'BACKEND': 'chats.tests.GroupListingChannelLayer'})
+        try:
+            channel = await layer.new_channel()
+            await layer.group_add('chat_1', channel)
+            await layer.group_send('chat_1', {'type': 'chat_message', 'message': 'hi'})
+            self.assertEqual((await layer.receive(channel))['message'], 'hi')
+            self.assertEqual(layer.remote_publishes, 0)
+        finally:
+            await layer.close()
+
+    @unittest.skipUnless(os.environ.get('TEST_REDIS_SHARDS'), 'TEST_REDIS_SHARDS is not set')
+    async def test_group_send_across_processes_over_redis(self):
+        inner = {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': os.environ['TEST_REDIS_SHARDS'].split(',')[:1], 'prefix': 'test-fanout'},
+        }
+        first = LocalFanoutChannelLayer(inner=inner)
+        second = LocalFanoutChannelLayer(inner=inner)
+        try:
+            await self.check_group_send(first, second)
+        finally:
+            await first.flush()
+            await second.close()
+            await second.inner.close_pools()
+
+    async def test_membership_outlives_inner_group_expiry(self):
+        inner = {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'group_expiry': 1}}
+        first = LocalFanoutChannelLayer(inner=inner, refresh_interval=0.2)
+        second = LocalFanoutChannelLayer(inner=inner, refresh_interval=0.2)
+        second.inner = first.inner
+        try:
+            channel = await second.new_channel()
+            await second.group_add('chat_1', channel)
+            await first.group_add('chat_1', await first.new_channel())
+            await asyncio.sleep(2.5)
+            await first.group_send('chat_1', {'type': 'chat_message', 'message': 'late'})
+            message = await asyncio.wait_for(second.receive(channel), timeout=1)
+            self.assertEqual(message['message'], 'late')
+        finally:
+            await first.close()
+            await second.close()
+
+    async def inner_members(self, layer, group):
+        inner = layer.inner
+        if hasattr(inner, 'groups'):
+            return len(inner.groups.get(group, {}))
+        return await inner.connection(inner.consistent_hash(group)).zcard(inner._group_key(group))
+
+    async def check_group_send(self, first, second):
+        local_channels = [await first.new_channel() for _ in range(2)]
+        remote_channels = [await second.new_channel() for _ in range(3)]
+        for channel in local_channels:
+            await first.group_add('chat_1', channel)
+        for channel in remote_channels:
+            await second.group_add('chat_1', channel)
+        self.assertEqual(await self.inner_members(first, 'chat_1'), 2)
+
+        await first.group_send('chat_1', {'type': 'chat_message', 'message': 'hi'})
+        for layer, channel in [(first, c) for c in local_channels] + [(second, c) for c in remote_channels]:
+            message = await asyncio.wait_for(layer.receive(channel), timeout=1)
+            self.assertEqual(message, {'type': 'chat_message', 'message': 'hi'})
+        self.assertEqual((first.local_deliveries, first.remote_publishes), (2, 1))
+        self.assertEqual(second.local_deliveries, 3)
+
+        for channel in remote_channels:
+            await second.group_discard('chat_1', channel)
+        self.assertEqual(await self.inner_members(first, 'chat_1'), 1)
+
+
+class ShardedRedisChannelLayerTests(SimpleTestCase):
+    """
+    Checks group placement on the hash ring and, when TEST_REDIS_SHARDS
+    lists several local redis-server instances, adding a shard live.
+    """
+    hosts = [f'redis://localhost:{port}' for port in (6380, 6381, 6382)]
+
+    def test_adding_shard_moves_only_its_groups(self):
+        groups = [f'chat_{chat_id}' for chat_id in range(10000)]
+        before = ConsistentHashRing({host: index for index, host in enumerate(self.hosts)})
+        after = ConsistentHashRing({host: index for index, host in enumerate(self.hosts + ['redis://localhost:6383'])})
+        moved = [group for group in groups if before.get(group) != after.get(group)]
+        self.assertTrue(all(after.get(group) == 3 for group in moved))
+        self.assertAlmostEqual(len(moved) / len(groups), 0.25, delta=0.1)
+        for index in range(4):
+            share = sum(after.get(group) == index for group in groups) / len(groups)
+            self.assertAlmostEqual(share, 0.25, delta=0.1)
+
+    async def test_process_channels_keep_their_shard(self):
+        layer = ShardedRedisChannelLayer(hosts=self.hosts)
+        grown = ShardedRedisChannelLayer(hosts=self.hosts + ['redis://localhost:6383'], previous_hosts=self.hosts)
+        channel = await layer.new_channel()
+        index = layer.consistent_hash(channel)
+        self.assertEqual(layer.consistent_hash(layer.non_local_name(channel)), index)
+        self.assertEqual(grown.consistent_hash(channel), index)
+
+    def test_previous_hosts_must_be_listed(self):
+        with self.assertRaises(ValueError):
+            ShardedRedisChannelLayer(hosts=self.hosts[:2], previous_hosts=self.hosts)
+
+    @unittest.skipUnless(os.environ.get('TEST_REDIS_SHARDS'), 'TEST_REDIS_SHARDS is not set')
+    async def test_add_shard_without_dropping_groups(self):
+        hosts = os.environ['TEST_REDIS_SHARDS'].split(',')
+        old = ShardedRedisChannelLayer(hosts=hosts[:-1], prefix='test-sharding')
+        new = ShardedRedisChannelLayer(hosts=hosts, previous_hosts=hosts[:-1], prefix='test-sharding')
+        try:
+            groups = [f'chat_{chat_id}' for chat_id in range(50)]
+            channel = await old.new_channel()
+            for group in groups:
+                await old.group_add(group, channel)
+            moved = [group for group in groups if new.previous_shard(group) is not None]
+            self.assertTrue(moved)
+
+            await new.group_send(moved[0], {'type': 'chat_message', 'message': 'hi'})
+            message = await asyncio.wait_for(old.receive(channel), timeout=5)
+            self.assertEqual(message, {'type': 'chat_message', 'message': 'hi'})
+
+            self.assertEqual(await new.rebalance(), len(moved))
+            for group in moved:
+                key = new._group_key(group)
+                self.assertFalse(await new.connection(new.previous_ring.get(group)).exists(key))
+                self.assertTrue(await new.connection(new.consistent_hash(group)).exists(key))
+        finally:
+            await new.flush()
+            await old.close_pools()
+
+
+class GroupEventCoalescerTests(SimpleTestCase):
+    """
+    Checks that a quiet group is sent at once and a busy one in batches.
+    """
+
+    async def test_window_follows_group_traffic(self):
+        layer = InMemoryChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add('chat_1', channel)
+        coalescer = GroupEventCoalescer(max_window=0.05, full_rate=2)
+
+        await coalescer.send(layer, 'chat_1', {'type': 'chat_message', 'id': 1})
+        self.assertEqual(await layer.receive(channel), {'type': 'chat_message', 'id': 1})
+        for event_id in range(2, 6):
+            await coalescer.send(layer, 'chat_1', {'type': 'chat_message', 'id': event_id})
+        batch = await asyncio.wait_for(layer.receive(channel), timeout=1)
+        self.assertEqual(batch['type'], 'chat_batch')
+        self.assertEqual([event['id'] for event in batch['events']], [2, 3, 4, 5])
+
+        # Через несколько периодов полураспада окно снова нулевое
+        self.assertEqual(coalescer.window('chat_1', asyncio.get_running_loop().time() + 10), 0.0)
+
+    def test_rates_of_quiet_groups_are_pruned(self):
+        coalescer = GroupEventCoalescer(max_window=0.05, full_rate=2, rate_half_life=1)
+        for group in range(100):
+            coalescer.window(f'chat_{group}', 0)
+        coalescer.window('chat_busy', 9)
+        self.assertEqual(coalescer.stats()['tracked_groups'], 101)
+        coalescer.window('chat_busy', 10)
+        self.assertEqual(coalescer.stats()['tracked_groups'], 1)
+
+
+class MessageWriteBehindBufferTests(SimpleTestCase):
+    """
+    Checks that the process buffer registers its exit flush only once.
+    """
+
+    def test_exit_flush_is_registered_once(self):
+        persistence._message_buffer = None
+        self.addCleanup(setattr, persistence, '_message_buffer', None)
+        callbacks = atexit._ncallbacks()
+        persistence.MessageWriteBehindBuffer(batch_size=10, max_delay=0.01)
+        self.assertEqual(atexit._ncallbacks(), callbacks)
+        buffer = persistence.get_message_buffer()
+        self.assertIs(persistence.get_message_buffer(), buffer)
+        self.assertEqual(atexit._ncallbacks(), callbacks + 1)
+        atexit.unregister(buffer._flush_on_exit)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    """
+    Checks the overflow policies of the per-socket outbound queue with a
+    socket that is not read until the queue has filled up.
+    """
+
+    async def fill_queue(self, delivered=0):
+        """
+        Sends `delivered` frames that reach the socket and then four more
+        frames that arrive faster than the socket is read.
+        """
+
+        consumer = ChatConsumer()
+        consumer.scope = {'subprotocols': []}
+        sent = []
+
+        async def base_send(message):
+            sent.append(message)
+
+        consumer.base_send = base_send
+        await consumer.accept_with_negotiated_format()
+        for message_id in range(1, delivered + 1):
+            await consumer.send_frame({'chat_id': 7, 'id': message_id})
+            while len(sent) <= message_id:
+                await asyncio.sleep(0)
+        for message_id in range(delivered + 1, delivered + 5):
+            await consumer.send_frame({'chat_id': 7, 'id': message_id})
+        try:
+            await asyncio.wait_for(asyncio.shield(consumer.outbound_writer), timeout=0.1)
+        except asyncio.TimeoutError:
+            consumer.outbound_writer.cancel()
+        return [json.loads(message['text']) if 'text' in message else message for message in sent[1:]]
+
+    @override_settings(CHAT_OUTBOUND_QUEUE_SIZE=2)
+    async def test_drop_oldest(self):
+        dropped = websocket_counters['dropped_frames']
+        frames = await self.fill_queue()
+        self.assertEqual([frame['id'] for frame in frames], [3, 4])
+        self.assertEqual(websocket_counters['dropped_frames'], dropped + 2)
+
+    @override_settings(CHAT_OUTBOUND_QUEUE_SIZE=2, CHAT_OUTBOUND_OVERFLOW_POLICY='disconnect')
+    async def test_disconnect_with_resume_cursor(self):
+        frames = await self.fill_queue(delivered=2)
+        self.assertEqual(frames, [
+            {'chat_id': 7, 'id': 1},
+            {'chat_id': 7, 'id': 2},
+            {'type': 'overflow', 'resume': [{'chat_id': 7, 'since': 2}]},
+            {'type': 'websocket.close', 'code': 4008},
+        ])
+
+
+class TokenBucketRateLimiterTests(SimpleTestCase):
+    """
+    Checks refilling of the token buckets that limit inbound frames.
+    """
+
+    def test_token_bucket_refills(self):
+        limiter = TokenBucketRateLimiter(rate=2, burst=2, max_keys=10)
+        self.assertEqual([limiter.acquire('user', now=0) for _ in range(2)], [0, 0])
+        self.assertEqual(limiter.acquire('user', now=0), 0.5)
+        self.assertEqual(limiter.acquire('user', now=0.5), 0)
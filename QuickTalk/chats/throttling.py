@@ -0,0 +1,96 @@
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+
+
+# Счётчики ограничений WebSocket-соединений этого процесса
+websocket_counters = Counter()
+
+
+class TokenBucketRateLimiter:
+    """
+    Per-process token buckets keyed by an arbitrary key such as a user or
+    a chat. Each bucket holds up to `burst` tokens and refills at `rate`
+    tokens per second. Buckets are kept in a bounded LRU; an evicted
+    bucket starts full again.
+    """
+
+    def __init__(self, rate, burst, max_keys):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def acquire(self, key, now=None):
+        """
+        Takes a token from the key's bucket. Returns 0 if it was available,
+        otherwise the number of seconds until it will be.
+        """
+        now = time.monotonic() if now is None else now
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+_limiters = None
+
+
+def get_inbound_rate_limiters():
+    """
+    Returns the per-process (user, chat, control) limiters of inbound
+    WebSocket frames, creating them on first use.
+    """
+    global _limiters
+    if _limiters is None:
+        _limiters = (
+            TokenBucketRateLimiter(
+                rate=settings.CHAT_INBOUND_USER_RATE,
+                burst=settings.CHAT_INBOUND_USER_BURST,
+                max_keys=settings.CHAT_INBOUND_LIMITER_MAX_KEYS,
+            ),
+            TokenBucketRateLimiter(
+                rate=settings.CHAT_INBOUND_CHAT_RATE,
+                burst=settings.CHAT_INBOUND_CHAT_BURST,
+                max_keys=settings.CHAT_INBOUND_LIMITER_MAX_KEYS,
+            ),
+            TokenBucketRateLimiter(
+                rate=settings.CHAT_INBOUND_CONTROL_RATE,
+                burst=settings.CHAT_INBOUND_CONTROL_BURST,
+                max_keys=settings.CHAT_INBOUND_LIMITER_MAX_KEYS,
+            ),
+        )
+    return _limiters
+
+
+def throttle_inbound_frame(user_id, chat_id=None, control=False):
+    """
+    Charges an inbound frame to the user's bucket and, for frames that post
+    to a chat, to the chat's bucket. Control frames such as subscribe and
+    unsubscribe are charged to the user's separate, larger control bucket
+    only, so that resubscribing to many chats after a reconnect does not
+    use up the budget for messages. Returns 0 if the frame is allowed,
+    otherwise the number of seconds the client should wait.
+    """
+    user_limiter, chat_limiter, control_limiter = get_inbound_rate_limiters()
+    if control:
+        retry_after = control_limiter.acquire(user_id)
+        if retry_after:
+            websocket_counters['throttled_control'] += 1
+        return retry_after
+    retry_after = user_limiter.acquire(user_id)
+    if retry_after:
+        websocket_counters['throttled_user'] += 1
+        return retry_after
+    if chat_id is not None:
+        retry_after = chat_limiter.acquire(chat_id)
+        if retry_after:
+            websocket_counters['throttled_chat'] += 1
+    return retry_after
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import CreateGroupChatAPIView, ChatsListAPIView, CreatePersonalChatAPIView, ChatDetailAPIView, UpdateGroupChatAPIView, GroupChatSearchAPIView, ChatDeleteAPIView, JoinToGroupChatAPIView
+from .views import CreateGroupChatAPIView, ChatsListAPIView, CreatePersonalChatAPIView, ChatDetailAPIView, UpdateGroupChatAPIView, GroupChatSearchAPIView, ChatDeleteAPIView, JoinToGroupChatAPIView, MessageHistoryAPIView, ReadChatAPIView, MessageSearchAPIView, GroupChatMembersAPIView, ChatDeletionStatusAPIView, ResponseCacheStatsAPIView, ChatExportAPIView, ChatHistoryImportAPIView, WebSocketStatsAPIView
 
 
 urlpatterns = [
@@ -8,7 +8,16 @@ urlpatterns = [
     path('chats-list/', ChatsListAPIView.as_view(), name='api-chats-list'),
     path('create-personal-chat/', CreatePersonalChatAPIView.as_view(), name='api-create-personal-chat'),
     path('detail-chat/<int:pk>/', ChatDetailAPIView.as_view(), name='api-detail-chat'),
+    path('messages-chat/<int:pk>/', MessageHistoryAPIView.as_view(), name='api-messages-chat'),
+    path('read-chat/<int:pk>/', ReadChatAPIView.as_view(), name='api-read-chat'),
+    path('export-chat/<int:pk>/', ChatExportAPIView.as_view(), name='api-export-chat'),
+    path('import-chat-history/<int:pk>/', ChatHistoryImportAPIView.as_view(), name='api-import-chat-history'),
     path('search-group-chat/', GroupChatSearchAPIView.as_view(), name='api-search-group-chat'),
+    path('search-messages/', MessageSearchAPIView.as_view(), name='api-search-messages'),
     path('delete-chat/<int:pk>/', ChatDeleteAPIView.as_view(), name='api-delete-chat'),
+    path('chat-deletion/<int:pk>/', ChatDeletionStatusAPIView.as_view(), name='api-chat-deletion-status'),
     path('join-to-group-chat/', JoinToGroupChatAPIView.as_view(), name='api-join-to-group-chat'),
+    path('group-chat-members/<int:pk>/', GroupChatMembersAPIView.as_view(), name='api-group-chat-members'),
+    path('response-cache-stats/', ResponseCacheStatsAPIView.as_view(), name='api-response-cache-stats'),
+    path('websocket-stats/', WebSocketStatsAPIView.as_view(), name='api-websocket-stats'),
 ]
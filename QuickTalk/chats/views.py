@@ -1,16 +1,69 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.parsers import MultiPartParser, FormParser
 from django.utils.translation import gettext_lazy as _
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .serializers import (
     CreateGroupChatSerializer,
     ChatsListSerializer,
     CreatePersonalChatSerializer,
     ChatDeleteSerializer,
+    ChatDeletionJobSerializer,
     JoinToGroupChatSerializer,
+    MessageHistorySerializer,
+    ChatExportSerializer,
+    ChatHistoryImportSerializer,
+    ChatsInboxSerializer,
+    MessageSearchSerializer,
+    GroupChatSearchSerializer,
+    GroupChatMembersSerializer,
 )
-from .models import Chat
+from .services.chats_serializers_services import (
+    _get_inbox_of_chats_for_user,
+    _mark_chat_as_read_by_user,
+    _get_chats_prefetched_for_serialization,
+    _get_chats_list_validators,
+    _get_chat_detail_validators,
+)
+from .pagination import ChatsInboxPagination
+from .models import Chat, ChatDeletionJob
+from django.conf import settings
+from django.urls import reverse
+from config.response_cache import get_response_version, response_cache
+from .coalescing import get_group_event_coalescer
+from .throttling import websocket_counters
+from django.utils.cache import get_conditional_response
+from django.http import StreamingHttpResponse
+from django.utils.http import http_date
+
+
+def _include_messages(request):
+    """
+    Reads the `include_messages` query flag; history is embedded unless it is turned off.
+    """
+    return request.query_params.get('include_messages', 'true').lower() not in ('0', 'false', 'no')
+
+
+def _set_validators(response, etag, last_modified):
+    """
+    Adds the ETag and Last-Modified headers to a response.
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _conditional_response(request, etag, last_modified):
+    """
+    Returns a 304 response when the client's copy matches the validators
+    (`If-None-Match` first, then `If-Modified-Since`), otherwise None.
+    """
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        _set_validators(not_modified, etag, last_modified)
+    return not_modified
 
 
 class CreateGroupChatAPIView(APIView):
@@ -47,7 +100,7 @@ class UpdateGroupChatAPIView(APIView):
             instance = Chat.objects.get(pk=pk)
             if instance.type != 'group':
                 return Response({"error": _("Method PUT not allowed for personal chat")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
-            if instance.created_by != request.user:
+            if instance.created_by_id != request.user.id:
                 return Response({"error": _("Method PUT not allowed to non-chat creator")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         except Chat.DoesNotExist:
             return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
@@ -62,6 +115,7 @@ class UpdateGroupChatAPIView(APIView):
 class CreatePersonalChatAPIView(APIView):
     """
     Enables users to create personal chats with others.
+    Returns the existing chat if the two users already have one.
     """
     permission_classes = [IsAuthenticated]
 
@@ -69,6 +123,14 @@ class CreatePersonalChatAPIView(APIView):
         serializer = CreatePersonalChatSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             chat = serializer.save()
+            if not serializer.created:
+                return Response(
+                    {
+                        'detail': _('Chat already exists.'),
+                        'chat_id': CreatePersonalChatSerializer(chat).data
+                    },
+                    status=status.HTTP_200_OK
+                )
             return Response(
                 {
                     'detail': _('Chat created successfully.'),
@@ -82,18 +144,108 @@ class CreatePersonalChatAPIView(APIView):
 class ChatsListAPIView(APIView):
     """
     Retrieves a list of chats the authenticated user is part of.
+    The list supports conditional GET with ETag and Last-Modified.
+    With `mode=inbox` returns a paginated inbox sorted by last activity.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        chats = Chat.objects.filter(users=request.user).order_by('-created_at')
-        serializer = ChatsListSerializer(chats, many=True, context={'request': request})
-        return Response(serializer.data)
+        if request.query_params.get('mode') == 'inbox':
+            return self.get_inbox(request)
+        include_messages = _include_messages(request)
+        etag, last_modified = _get_chats_list_validators(request.user, include_messages)
+        not_modified = _conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        chats = _get_chats_prefetched_for_serialization(
+            chats=Chat.objects.filter(users=request.user).order_by('-created_at'),
+            include_messages=include_messages
+        )
+        serializer = ChatsListSerializer(
+            chats,
+            many=True,
+            context={'request': request, 'include_messages': include_messages}
+        )
+        return _set_validators(Response(serializer.data), etag, last_modified)
+
+    def get_inbox(self, request):
+        chats = _get_inbox_of_chats_for_user(
+            request_user=request.user,
+            preview_length=settings.CHAT_INBOX_PREVIEW_LENGTH
+        )
+        paginator = ChatsInboxPagination()
+        page = paginator.paginate_queryset(chats, request, view=self)
+        serializer = ChatsInboxSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ReadChatAPIView(APIView):
+    """
+    Marks all messages of a chat as read by the authenticated user.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        pk = kwargs.get("pk")
+        if not pk:
+            return Response({"error": _("Method POST not allowed")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            chat = Chat.objects.get(pk=pk)
+        except Chat.DoesNotExist:
+            return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+        if not chat.users.filter(pk=request.user.pk).exists():
+            return Response({"error": _("You are not a member of this chat.")}, status=status.HTTP_403_FORBIDDEN)
+
+        last_read_message_id = _mark_chat_as_read_by_user(chat=chat, request_user=request.user)
+        return Response({'last_read_message_id': last_read_message_id})
 
 
 class ChatDetailAPIView(APIView):
     """
     Fetches details of a specific chat by its ID.
+    Responses are cached per chat version, see config.response_cache,
+    and support conditional GET with ETag and Last-Modified.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        pk = kwargs.get("pk")
+        if not pk:
+            return Response({"error": _("Method GET not allowed")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        include_messages = _include_messages(request)
+        version, etag, last_modified = _get_chat_detail_validators(pk, request.user, include_messages)
+        instance_serializer = None
+        if version is not None:
+            not_modified = _conditional_response(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+            # Ответ зависит от запрашивающего пользователя (имя личного чата, права)
+            cache_key = ('chat-detail', pk, version, request.user.id, include_messages)
+            instance_serializer = response_cache.get(cache_key)
+        if instance_serializer is None:
+            try:
+                instance = _get_chats_prefetched_for_serialization(
+                    chats=Chat.objects.all(),
+                    include_messages=include_messages
+                ).get(pk=pk)
+                instance_serializer = ChatsListSerializer(
+                    instance,
+                    context={'request': request, 'include_messages': include_messages}
+                ).data
+            except Chat.DoesNotExist:
+                return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+            if version is None:
+                # Счётчик заводим только для существующего чата; этот ответ мог
+                # быть прочитан до изменения, поэтому без кэша и валидаторов
+                get_response_version('chat', pk)
+                return Response({'detail': instance_serializer})
+            response_cache.set(cache_key, instance_serializer)
+        return _set_validators(Response({'detail': instance_serializer}), etag, last_modified)
+
+
+class MessageHistoryAPIView(APIView):
+    """
+    Returns a cursor-paginated page of a chat's message history.
     """
     permission_classes = [IsAuthenticated]
 
@@ -102,24 +254,76 @@ class ChatDetailAPIView(APIView):
         if not pk:
             return Response({"error": _("Method GET not allowed")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         try:
-            instance = Chat.objects.get(pk=pk)
-            instance_serializer = ChatsListSerializer(instance, context={'request': request}).data
+            chat = Chat.objects.get(pk=pk)
+        except Chat.DoesNotExist:
+            return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+        if not chat.users.filter(pk=request.user.pk).exists():
+            return Response({"error": _("You are not a member of this chat.")}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = MessageHistorySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.get_page(chat))
+
+
+class ChatExportAPIView(APIView):
+    """
+    Streams the full message history of a chat as NDJSON, optionally
+    gzip-compressed with `compress=gzip`. `after=<message id>` resumes
+    an interrupted export.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        pk = kwargs.get("pk")
+        if not pk:
+            return Response({"error": _("Method GET not allowed")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            chat = Chat.objects.get(pk=pk)
         except Chat.DoesNotExist:
             return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
-        return Response({'detail': instance_serializer})
+        if not chat.users.filter(pk=request.user.pk).exists():
+            return Response({"error": _("You are not a member of this chat.")}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = ChatExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filename = f'chat-{chat.pk}.ndjson'
+        content_type = 'application/x-ndjson'
+        if serializer.validated_data.get('compress') == 'gzip':
+            filename += '.gz'
+            content_type = 'application/gzip'
+        # Под ASGI синхронный генератор был бы собран в список целиком; у ASGI-запроса нет wsgi.input
+        if 'wsgi.input' not in request.META:
+            content = serializer.astream(chat)
+        else:
+            content = serializer.stream(chat)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class GroupChatSearchAPIView(APIView):
     """
-    Searches group chats by name based on a substring query.
+    Searches group chats by name based on a prefix or substring query.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        search_query = request.query_params.get('query', '')
-        group_chats = Chat.objects.filter(name__icontains=search_query, type="group") if search_query else Chat.objects.none()
-        serializer = ChatsListSerializer(group_chats, many=True, context={'request': request})
-        return Response(serializer.data)
+        serializer = GroupChatSearchSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({'results': [], 'next_page': None})
+        return Response(serializer.get_page())
+
+
+class MessageSearchAPIView(APIView):
+    """
+    Full-text search over messages of the chats the user belongs to.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = MessageSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.get_page(request.user))
 
 
 class ChatDeleteAPIView(APIView):
@@ -138,9 +342,30 @@ class ChatDeleteAPIView(APIView):
             return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = ChatDeleteSerializer()
-        serializer.destroy(chat)
+        job = serializer.destroy(chat, requested_by=request.user)
+
+        return Response(
+            {
+                "detail": _("Chat deletion started."),
+                "job": ChatDeletionJobSerializer(job).data,
+                "status_url": reverse('api-chat-deletion-status', kwargs={'pk': job.pk}),
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class ChatDeletionStatusAPIView(APIView):
+    """
+    Reports the progress of a background chat deletion to the user who requested it.
+    """
+    permission_classes = [IsAuthenticated]
 
-        return Response({"detail": _("Chat deleted successfully.")}, status=status.HTTP_204_NO_CONTENT)
+    def get(self, request, *args, **kwargs):
+        try:
+            job = ChatDeletionJob.objects.get(pk=kwargs['pk'], requested_by=request.user)
+        except ChatDeletionJob.DoesNotExist:
+            return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ChatDeletionJobSerializer(job).data)
 
 
 class JoinToGroupChatAPIView(APIView):
@@ -156,3 +381,92 @@ class JoinToGroupChatAPIView(APIView):
             {'detail': _('The user was successfully added to the chat.')},
             status=status.HTTP_201_CREATED
         )
+
+
+class GroupChatMembersAPIView(APIView):
+    """
+    Lets the creator of a group chat add (POST) or remove (DELETE)
+    many members at once by a list of user IDs.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_chat(self, request, pk):
+        try:
+            chat = Chat.objects.get(pk=pk)
+        except Chat.DoesNotExist:
+            return None, Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+        if chat.type != 'group':
+            return None, Response({"error": _("Method not allowed for personal chat")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        if chat.created_by_id != request.user.id:
+            return None, Response({"error": _("Method not allowed to non-chat creator")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        return chat, None
+
+    def post(self, request, *args, **kwargs):
+        chat, error = self.get_chat(request, kwargs['pk'])
+        if error is not None:
+            return error
+        serializer = GroupChatMembersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        added = serializer.add(chat)
+        return Response(
+            {'detail': _('The users were successfully added to the chat.'), 'added': added},
+            status=status.HTTP_200_OK
+        )
+
+    def delete(self, request, *args, **kwargs):
+        chat, error = self.get_chat(request, kwargs['pk'])
+        if error is not None:
+            return error
+        serializer = GroupChatMembersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        removed = serializer.remove(chat)
+        return Response(
+            {'detail': _('The users were successfully removed from the chat.'), 'removed': removed},
+            status=status.HTTP_200_OK
+        )
+
+
+class ResponseCacheStatsAPIView(APIView):
+    """
+    Shows the hit rate and eviction counters of this process's response cache.
+    """
+    permission_classes = [IsAdminUser]
+    renders_floats = True
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache.stats())
+
+
+class WebSocketStatsAPIView(APIView):
+    """
+    Shows the throttling, dropped frame and coalescing counters of this
+    process's WebSocket connections.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        counters = {
+            key: websocket_counters[key]
+            for key in ('throttled_user', 'throttled_chat', 'throttled_control', 'dropped_frames', 'overflow_disconnects')
+        }
+        counters.update(get_group_event_coalescer().stats())
+        return Response(counters)
+
+
+class ChatHistoryImportAPIView(APIView):
+    """
+    Lets staff import historical messages into a chat from an uploaded
+    NDJSON or CSV archive and reports the import rate.
+    """
+    permission_classes = [IsAdminUser]
+    renders_floats = True
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            chat = Chat.objects.get(pk=kwargs['pk'])
+        except Chat.DoesNotExist:
+            return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+        serializer = ChatHistoryImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.run_import(chat), status=status.HTTP_201_CREATED)
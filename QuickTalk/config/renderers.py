@@ -0,0 +1,97 @@
+import math
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """
+    DRF's JSON encoder that also writes phone numbers as strings.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, PhoneNumber):
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+
+def _is_stdlib_only_float(value):
+    # orjson пишет 1e-7 вместо 1e-07, 0.00001 вместо 1e-05 и null вместо NaN/Infinity
+    return isinstance(value, float) and (not math.isfinite(value) or 'e' in repr(value))
+
+
+def _default(obj):
+    ret = _encoder.default(obj)
+    if _is_stdlib_only_float(ret):
+        raise TypeError('Float is rendered by the stdlib encoder.')
+    return ret
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed and
+    produces the same bytes as the stdlib renderer: compact separators,
+    UTF-8 without escaping, U+2028/U+2029 escaped and datetimes in the
+    ECMA 262 form with `Z` for UTC. Types orjson does not know natively
+    (lazy translations, phone numbers, decimals) go through the DRF
+    encoder. Indented output, ASCII-only output and anything orjson
+    refuses fall back to the stdlib renderer.
+
+    Floats are where orjson differs: it writes `1e-7` and `0.00001` where
+    the stdlib writes `1e-07` and `1e-05`, and NaN or infinity as `null`
+    where the stdlib refuses them. Scanning every payload for such floats
+    costs more than orjson saves, so views whose responses carry floats
+    set `renders_floats = True` and are rendered by the stdlib encoder.
+    Decimals, which the DRF encoder turns into floats, are checked as
+    they are encoded.
+    """
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context)
+            or getattr(renderer_context.get('view'), 'renders_floats', False)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк для JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson when it is installed.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
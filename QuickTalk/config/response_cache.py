@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class VersionedResponseCache:
+    """
+    Bounded per-process LRU cache of serialized API responses.
+    Entries are keyed by the version of the object they were built from,
+    so bumping the version makes older entries unreachable; they are
+    evicted as least recently used.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def set(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Returns the counters used to tune the cache size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = VersionedResponseCache(max_size=settings.RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def _version_key(scope, pk):
+    return f'response-version:{scope}:{pk}'
+
+
+def _modified_key(scope, pk):
+    return f'response-modified:{scope}:{pk}'
+
+
+def get_response_versions(scope, pks, seed=True):
+    """
+    Returns `{pk: (version, modified_at)}` for several objects with one
+    round trip to the shared Django cache, so that every process sees a
+    bump. A missing counter starts from the current time, never from a
+    value an evicted counter may have had; `modified_at` is the Unix time
+    of the last bump and falls back to now when unknown.
+
+    Counters expire after RESPONSE_VERSION_TIMEOUT seconds. With
+    `seed=False` missing counters are not created and are returned as
+    `(None, None)`, so that lookups of objects that may not exist do not
+    fill the cache; seed them once the object has been found.
+    """
+    keys = {pk: (_version_key(scope, pk), _modified_key(scope, pk)) for pk in pks}
+    values = cache.get_many([key for pair in keys.values() for key in pair])
+    now = time.time()
+    timeout = settings.RESPONSE_VERSION_TIMEOUT
+    versions = {}
+    for pk, (version_key, modified_key) in keys.items():
+        version = values.get(version_key)
+        if version is None:
+            if not seed:
+                versions[pk] = (None, None)
+                continue
+            cache.add(version_key, time.time_ns(), timeout=timeout)
+            version = cache.get(version_key)
+        modified_at = values.get(modified_key)
+        if modified_at is None:
+            cache.add(modified_key, now, timeout=timeout)
+            modified_at = now
+        versions[pk] = (version, modified_at)
+    return versions
+
+
+def get_response_version(scope, pk, seed=True):
+    """
+    Returns the current version of one object, see get_response_versions.
+    """
+    return get_response_versions(scope, [pk], seed=seed)[pk][0]
+
+
+def bump_response_version(scope, pk):
+    """
+    Makes the cached responses built from an object stale once the
+    current transaction commits. A cache error is logged and does not
+    fail the committed write or the other commit hooks.
+    """
+    def bump():
+        version_key = _version_key(scope, pk)
+        timeout = settings.RESPONSE_VERSION_TIMEOUT
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.add(version_key, time.time_ns(), timeout=timeout)
+        cache.set(_modified_key(scope, pk), time.time(), timeout=timeout)
+
+    transaction.on_commit(bump, robust=True)
@@ -155,13 +155,155 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.CustomUser'
 
 
+# JSON is encoded and decoded with orjson when it is installed
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
 REDIS_HOST = 'redis' if os.environ.get('DOCKER') else 'localhost'
 
+# The cache must be shared by all processes: response versions bumped by
+# one worker or management command invalidate cached responses and ETags
+# in every other worker. A per-process cache such as LocMemCache leaves
+# them stale.
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL', f'redis://{REDIS_HOST}:6379/1')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+    },
+}
+
+# Tests run with a per-process cache and do not need Redis
+TEST_RUNNER = 'config.test_runner.TestRunner'
+
+# Redis shards of the channel layer, comma-separated: redis://redis-1:6379,redis://redis-2:6379
+REDIS_SHARDS = [address for address in os.environ.get('REDIS_SHARDS', '').split(',') if address] or [(REDIS_HOST, 6379)]
+
+# Shards before the last one was added, while groups move (see ShardedRedisChannelLayer)
+REDIS_PREVIOUS_SHARDS = [address for address in os.environ.get('REDIS_PREVIOUS_SHARDS', '').split(',') if address]
+
+# Group messages reach sockets of the same process in memory and other
+# processes through Redis, once per process
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'chats.layers.LocalFanoutChannelLayer',
         'CONFIG': {
-            'hosts': [(REDIS_HOST, 6379)],
+            'inner': {
+                'BACKEND': 'chats.layers.ShardedRedisChannelLayer',
+                'CONFIG': {
+                    'hosts': REDIS_SHARDS,
+                    'previous_hosts': REDIS_PREVIOUS_SHARDS,
+                },
+            },
         },
     },
 }
+
+
+CHAT_HISTORY_PAGE_SIZE = 50
+
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+
+CHAT_INBOX_PAGE_SIZE = 30
+
+CHAT_INBOX_MAX_PAGE_SIZE = 100
+
+CHAT_INBOX_PREVIEW_LENGTH = 100
+
+# Write-behind persistence of WebSocket messages with batched bulk_create
+CHAT_MESSAGE_WRITE_BEHIND = False
+
+CHAT_MESSAGE_WRITE_BEHIND_BATCH_SIZE = 100
+
+CHAT_MESSAGE_WRITE_BEHIND_MAX_DELAY = 0.05
+
+# Database access of WebSocket consumers: 'sync' wraps each helper in
+# database_sync_to_async, 'async' reads with the async ORM and writes on
+# the dedicated executor below
+CHAT_CONSUMER_ORM = 'sync'
+
+# Threads of the executor for consumer database work that must stay sync
+# (inserts in a transaction); None uses the thread shared by sync_to_async
+CHAT_DB_EXECUTOR_WORKERS = 4
+
+# Replay of missed messages when a WebSocket reconnects with `since`
+CHAT_REPLAY_BATCH_SIZE = 100
+
+CHAT_REPLAY_MAX_MESSAGES = 1000
+
+# Number of encoded group events kept per process for reuse across sockets
+CHAT_ENCODED_FRAME_CACHE_SIZE = 1024
+
+# Events of busy groups with at least this many members are batched into
+# one array frame per socket; None turns coalescing off
+CHAT_COALESCE_MIN_MEMBERS = 500
+
+# Longest batching window in seconds, reached at CHAT_COALESCE_FULL_RATE events per second
+CHAT_COALESCE_MAX_WINDOW = 0.03
+
+CHAT_COALESCE_FULL_RATE = 50
+
+# Token buckets for inbound WebSocket frames: tokens per second and burst size
+CHAT_INBOUND_USER_RATE = 5
+
+CHAT_INBOUND_USER_BURST = 20
+
+CHAT_INBOUND_CHAT_RATE = 50
+
+CHAT_INBOUND_CHAT_BURST = 200
+
+# Separate per-user bucket for subscribe/unsubscribe frames, sized for a
+# client resubscribing to all of its chats after a reconnect
+CHAT_INBOUND_CONTROL_RATE = 50
+
+CHAT_INBOUND_CONTROL_BURST = 500
+
+CHAT_INBOUND_LIMITER_MAX_KEYS = 100000
+
+# Frames waiting for a slow client before the overflow policy applies:
+# 'drop_oldest' or 'disconnect' (close with a resume cursor)
+CHAT_OUTBOUND_QUEUE_SIZE = 1000
+
+CHAT_OUTBOUND_OVERFLOW_POLICY = 'drop_oldest'
+
+# Full-text search over message content
+CHAT_MESSAGE_SEARCH_BACKEND = 'chats.search.SQLiteFTS5MessageSearchBackend'
+
+CHAT_MESSAGE_SEARCH_PAGE_SIZE = 20
+
+# Group chat search by name
+CHAT_GROUP_SEARCH_PAGE_SIZE = 20
+
+CHAT_GROUP_SEARCH_MAX_RESULTS = 100
+
+CHAT_GROUP_SEARCH_CACHE_TTL = 30
+
+# Maximum number of users in one bulk add or remove of group chat members
+CHAT_MEMBERSHIP_BULK_MAX_USERS = 5000
+
+# Messages deleted per transaction when a chat is purged in the background
+CHAT_DELETION_BATCH_SIZE = 1000
+
+# Per-process LRU cache of chat detail and user detail responses
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+
+# Seconds a response version counter lives in the shared cache; an expired
+# counter restarts from the current time
+RESPONSE_VERSION_TIMEOUT = 7 * 24 * 60 * 60
+
+# Rows fetched per database round trip by the streaming chat export
+CHAT_EXPORT_CHUNK_SIZE = 2000
+
+# Messages inserted per transaction by the chat history import
+CHAT_IMPORT_BATCH_SIZE = 5000
@@ -0,0 +1,154 @@
+import datetime
+import decimal
+import io
+import timeit
+import uuid
+import zoneinfo
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.translation import gettext_lazy as _
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework import renderers as drf_renderers, parsers as drf_parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIRequestFactory
+from chats.management.commands.benchmark_json_renderers import build_chats_list_payload
+from chats.models import Chat, Message
+from chats.serializers import ChatsListSerializer
+from chats.views import ResponseCacheStatsAPIView
+from users.models import CustomUser
+from . import renderers, response_cache, settings as project_settings
+
+
+class FastJSONRendererCompatibilityTests(TestCase):
+    """
+    Checks that FastJSONRenderer and FastJSONParser are byte-for-byte
+    interchangeable with the stdlib based DRF classes.
+    """
+
+    def assertSameRendering(self, data, accepted_media_type='application/json', renderer_context=None):
+        expected = drf_renderers.JSONRenderer()
+        expected.encoder_class = renderers.JSONEncoder
+        self.assertEqual(
+            renderers.FastJSONRenderer().render(data, accepted_media_type, renderer_context),
+            expected.render(data, accepted_media_type, renderer_context)
+        )
+
+    def test_orjson_is_used(self):
+        self.assertIsNotNone(renderers.orjson)
+
+    def test_chat_payload(self):
+        user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        other = CustomUser.objects.create_user(phone_number='+12025550101', password='pass12345')
+        chat = Chat.objects.create(type='personal', created_by=user)
+        chat.users.add(user, other)
+        for content in ['hello', 'привет 👋', 'line\u2028separator\u2029', '"quoted" \\ \t\n']:
+            Message.objects.create(chat=chat, sender=other, content=content)
+        request = APIRequestFactory().get('/')
+        request.user = user
+        data = ChatsListSerializer(Chat.objects.all(), many=True, context={'request': request}).data
+        self.assertSameRendering(data)
+        self.assertSameRendering({'detail': data[0]})
+
+    def test_native_types(self):
+        moscow = zoneinfo.ZoneInfo('Europe/Moscow')
+        london = zoneinfo.ZoneInfo('Europe/London')
+        self.assertSameRendering({
+            'utc': datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+            'zero_offset': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=london),
+            'offset': datetime.datetime(2024, 1, 2, 3, 4, 5, 7, tzinfo=moscow),
+            'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+            'date': datetime.date(2024, 1, 2),
+            'time': datetime.time(3, 4, 5, 123456),
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'phone_number': PhoneNumber.from_string('+12025550100'),
+            'lazy': _('Chat created successfully.'),
+            'decimal': decimal.Decimal('1.5'),
+            'numbers': [0, -1, 2 ** 63 - 1, 0.5, 0.1, 123.456, True, False, None],
+            'big_int': 2 ** 70,
+            1: 'non-string key',
+            'nested': [{'a': [], 'b': {}}, ()],
+        })
+
+    def test_floats(self):
+        context = {'view': ResponseCacheStatsAPIView()}
+        self.assertSameRendering({
+            'small': [1e-7, -2.5e-10, 1e-05, 0.0001],
+            'large': [1e16, 1.5e+300, 1e15, 123456789012345.6],
+            'hit_rate': 1 / 100000,
+            'keys': {1e-7: 'exponent key'},
+        }, renderer_context=context)
+        for value in [float('nan'), float('inf'), float('-inf')]:
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    renderers.FastJSONRenderer().render({'nested': [{'value': value}]}, renderer_context=context)
+
+    def test_decimal_with_exponent(self):
+        self.assertSameRendering({'decimal': decimal.Decimal('0.0000001')})
+
+    def test_faster_than_stdlib(self):
+        payload = build_chats_list_payload(chats=20, messages_per_chat=20)
+        expected = drf_renderers.JSONRenderer()
+        expected.encoder_class = renderers.JSONEncoder
+        fast = renderers.FastJSONRenderer()
+        stdlib_time = min(timeit.repeat(lambda: expected.render(payload), number=5, repeat=3))
+        fast_time = min(timeit.repeat(lambda: fast.render(payload), number=5, repeat=3))
+        self.assertLess(fast_time * 2, stdlib_time)
+
+    def test_fallbacks(self):
+        self.assertEqual(renderers.FastJSONRenderer().render(None), b'')
+        self.assertSameRendering({'a': [1, 2]}, 'application/json; indent=4')
+        original = renderers.orjson
+        renderers.orjson = None
+        try:
+            self.assertSameRendering({'a': 'б\u2028'})
+        finally:
+            renderers.orjson = original
+
+    def test_parser(self):
+        body = '{"content": "привет 👋", "ids": [1, 2.5, null, true], "nested": {"a": "\\u2028"}}'.encode()
+        self.assertEqual(
+            renderers.FastJSONParser().parse(io.BytesIO(body)),
+            drf_parsers.JSONParser().parse(io.BytesIO(body))
+        )
+        for invalid in [b'{', b'NaN', b'']:
+            with self.assertRaises(ParseError):
+                renderers.FastJSONParser().parse(io.BytesIO(invalid))
+
+
+class CacheSettingsTests(SimpleTestCase):
+    """
+    Checks that response versions are kept in a cache shared by all processes.
+    """
+
+    def test_default_cache_is_shared(self):
+        self.assertEqual(project_settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+
+
+class UnavailableCache(LocMemCache):
+    """
+    Cache whose backend is down.
+    """
+
+    def incr(self, key, delta=1, version=None):
+        raise ConnectionError('Cache is unavailable.')
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        raise ConnectionError('Cache is unavailable.')
+
+
+class ResponseVersionTests(TestCase):
+    """
+    Checks that a failing cache does not fail a committed write.
+    """
+
+    @override_settings(CACHES={'default': {'BACKEND': 'config.tests.UnavailableCache'}})
+    def test_cache_error_does_not_fail_commit_hooks(self):
+        ran = []
+        with self.assertLogs('django.test', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response_cache.bump_response_version('chat', 1)
+                transaction.on_commit(lambda: ran.append(True))
+        self.assertEqual(ran, [True])
+
@@ -2,65 +2,94 @@ document.addEventListener('DOMContentLoaded', function() {
     // Получаем контейнер для списка чатов
     const chatListContainer = document.getElementById('chatList');
 
+    // Кнопка подгрузки следующей страницы входящих
+    const loadMoreButton = document.createElement('button');
+    loadMoreButton.type = 'button';
+    loadMoreButton.textContent = 'Load more';
+    loadMoreButton.className = 'btn btn-outline-light btn-sm d-block mx-auto';
+    let nextPageUrl = null;
+
+    loadMoreButton.addEventListener('click', function() {
+        loadInboxPage(nextPageUrl);
+    });
+
+    loadInboxPage(`${window.CHAT_LIST_API_URL}?mode=inbox`);
+
     // Выполняем GET запрос к API
-    fetch(window.CHAT_LIST_API_URL)
-    .then(response => response.json())
-    .then(data => {
-        // Очищаем контейнер перед добавлением чатов
-        chatListContainer.innerHTML = '';
+    function loadInboxPage(url) {
+        fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            if (loadMoreButton.parentNode) {
+                chatListContainer.removeChild(loadMoreButton);
+            }
+            if (!data.previous) {
+                // Очищаем контейнер перед добавлением чатов
+                chatListContainer.innerHTML = '';
+            }
 
-        if (data.length === 0) {
-            // Если чатов нет, показываем сообщение
-            chatListContainer.innerHTML = '<p class="text-center text-white">No chats available.</p>';
-        } else {
-            data.forEach(chat => {
-                // Создаем элемент для каждого чата
-                const chatItem = document.createElement('a');
-                chatItem.href = window.DETAIL_CHAT; // Ссылка на конкретный чат
-                chatItem.className = 'btn btn-primary btn-lg mb-3 d-flex flex-column justify-content-center'; // Используем flex-column для вертикального выравнивания
-                chatItem.id = `chat-${chat.id}`;
-                // Задание фиксированных размеров
-                chatItem.style.width = '100%'; // Ширина 100% контейнера
-                chatItem.style.height = '70px'; // Фиксированная высота
-                chatItem.style.overflow = 'hidden'; // Скрытие переполнения текста
+            if (data.results.length === 0 && !data.previous) {
+                // Если чатов нет, показываем сообщение
+                chatListContainer.innerHTML = '<p class="text-center text-white">No chats available.</p>';
+            } else {
+                data.results.forEach(chat => {
+                    // Создаем элемент для каждого чата
+                    const chatItem = document.createElement('a');
+                    chatItem.href = window.DETAIL_CHAT; // Ссылка на конкретный чат
+                    chatItem.className = 'btn btn-primary btn-lg mb-3 d-flex flex-column justify-content-center'; // Используем flex-column для вертикального выравнивания
+                    chatItem.id = `chat-${chat.id}`;
+                    // Задание фиксированных размеров
+                    chatItem.style.width = '100%'; // Ширина 100% контейнера
+                    chatItem.style.height = '70px'; // Фиксированная высота
+                    chatItem.style.overflow = 'hidden'; // Скрытие переполнения текста
 
-                if (chat.type === 'group'){
-                    // Добавляем flexbox для масштабируемого отступа
-                    chatItem.innerHTML = `
-                        <div class="d-flex flex-column">
-                            <span class="text-truncate" style="max-width: 100%; overflow: hidden; text-overflow: ellipsis;">${chat.chat_name}</span>
-                            <small class="text-white-50" style="margin-top: auto;">
-                                <i class="fa-solid fa-people-group"></i>
-                                <span style="margin-left: 5px;">${chat.type} chat</span> <!-- Отступ между иконкой и текстом -->
-                            </small>
-                        </div>
-                    `;
-                } else if (chat.type === 'personal'){
-                    chatItem.innerHTML = `
-                        <div class="d-flex flex-column">
-                            <span class="text-truncate" style="max-width: 100%; overflow: hidden; text-overflow: ellipsis;">${chat.chat_name}</span>
-                            <small class="text-white-50" style="margin-top: auto;">
-                                <i class="fa-solid fa-user-group"></i>
-                                <span style="margin-left: 5px;">${chat.type} chat</span> <!-- Отступ между иконкой и текстом -->
-                            </small>
-                        </div>
-                    `;                    
-                }
+                    // Превью последнего сообщения и счётчик непрочитанных
+                    const lastMessage = chat.last_message_preview !== null ? chat.last_message_preview : `${chat.type} chat`;
+                    const unreadBadge = chat.unread_count > 0 ? ` <span class="badge bg-light text-dark">${chat.unread_count}</span>` : '';
 
-                // Добавляем элемент в контейнер
-                chatListContainer.appendChild(chatItem);
-                chatItem.addEventListener('click', function(event) {
-                    event.preventDefault();
-                    // Устанавливаем в sessionStorage id чата
-                    sessionStorage.setItem('selectedChatId', chat.id);
-                    // Переходим на страницу детализации чата
-                    window.location.href = window.DETAIL_CHAT;
+                    if (chat.type === 'group'){
+                        // Добавляем flexbox для масштабируемого отступа
+                        chatItem.innerHTML = `
+                            <div class="d-flex flex-column">
+                                <span class="text-truncate" style="max-width: 100%; overflow: hidden; text-overflow: ellipsis;">${chat.chat_name}${unreadBadge}</span>
+                                <small class="text-white-50 text-truncate" style="margin-top: auto;">
+                                    <i class="fa-solid fa-people-group"></i>
+                                    <span style="margin-left: 5px;">${lastMessage}</span> <!-- Отступ между иконкой и текстом -->
+                                </small>
+                            </div>
+                        `;
+                    } else if (chat.type === 'personal'){
+                        chatItem.innerHTML = `
+                            <div class="d-flex flex-column">
+                                <span class="text-truncate" style="max-width: 100%; overflow: hidden; text-overflow: ellipsis;">${chat.chat_name}${unreadBadge}</span>
+                                <small class="text-white-50 text-truncate" style="margin-top: auto;">
+                                    <i class="fa-solid fa-user-group"></i>
+                                    <span style="margin-left: 5px;">${lastMessage}</span> <!-- Отступ между иконкой и текстом -->
+                                </small>
+                            </div>
+                        `;                    
+                    }
+
+                    // Добавляем элемент в контейнер
+                    chatListContainer.appendChild(chatItem);
+                    chatItem.addEventListener('click', function(event) {
+                        event.preventDefault();
+                        // Устанавливаем в sessionStorage id чата
+                        sessionStorage.setItem('selectedChatId', chat.id);
+                        // Переходим на страницу детализации чата
+                        window.location.href = window.DETAIL_CHAT;
+                    });
                 });
-            });
-        }
-    })
-    .catch(error => {
-        console.error('Error fetching chat list:', error);
-        chatListContainer.innerHTML = '<p class="text-center text-danger">Failed to load chats. Please try again later.</p>';
-    });
+
+                nextPageUrl = data.next;
+                if (nextPageUrl) {
+                    chatListContainer.appendChild(loadMoreButton);
+                }
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching chat list:', error);
+            chatListContainer.innerHTML = '<p class="text-center text-danger">Failed to load chats. Please try again later.</p>';
+        });
+    }
 });
@@ -17,8 +17,8 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         })
         .then(response => {
-            // Проверяем, если это успешный ответ с кодом 204
-            if (response.status === 204) {
+            // Чат скрыт сразу, сообщения удаляются в фоне (202)
+            if (response.status === 202) {
                 window.location.href = window.CHATS_LIST_URL; // Нет содержимого, поэтому возвращаем null
             } else if (response.status === 400) {
                 return response.json(); // Обработка ошибок валидации
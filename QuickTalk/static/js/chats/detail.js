@@ -1,16 +1,145 @@
 document.addEventListener('DOMContentLoaded', function() {
     const chatIdForOutputDetail = sessionStorage.getItem('selectedChatId');
-    const apiUrl = `/api/chats/detail-chat/${chatIdForOutputDetail}`;
+    const apiUrl = `/api/chats/detail-chat/${chatIdForOutputDetail}/?include_messages=false`;
+    const historyApiUrl = `/api/chats/messages-chat/${chatIdForOutputDetail}/`;
+    const readApiUrl = `/api/chats/read-chat/${chatIdForOutputDetail}/`;
     const wsScheme = window.location.protocol === "https:" ? "wss" : "ws";
-    const chatSocket = new WebSocket(
-        `${wsScheme}://${window.location.host}/ws/chat/${chatIdForOutputDetail}/`
-    );
+    const socketUrl = `${wsScheme}://${window.location.host}/ws/chat/${chatIdForOutputDetail}/`;
+    let chatSocket = null;
+    let reconnectAttempts = 0;
+
+    // Последний полученный id сообщения и уже отображённые сообщения
+    let lastSeenId = null;
+    const renderedIds = new Set();
 
     const messageList = document.getElementById('messageList');
     const userInfo = document.getElementById('userInfo');
     const messageInput = document.getElementById('messageInput');
     const sendButton = document.getElementById('sendMessageBtn');
     const requestUser = document.getElementById('requestUser').value
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    // Кнопка подгрузки более ранних сообщений
+    const loadEarlierButton = document.createElement('button');
+    loadEarlierButton.type = 'button';
+    loadEarlierButton.textContent = 'Load earlier messages';
+    loadEarlierButton.classList.add('btn', 'btn-outline-light', 'btn-sm', 'd-block', 'mx-auto', 'mb-3');
+    let nextHistoryCursor = null;
+
+    function createMessageElement(senderId, senderName, content, timestampValue) {
+        const messageElement = document.createElement('div');
+        messageElement.classList.add('message-container');
+        messageElement.classList.add(senderId === parseInt(requestUser) ? 'message-sender' : 'message-receiver'); // Выравнивание
+
+        // Преобразование timestamp в объект Date
+        const timestamp = new Date(timestampValue);
+
+        // Получение часов и минут
+        const hours = String(timestamp.getHours()).padStart(2, '0'); // Форматирование: 01, 02, ..., 10, 11, 12
+        const minutes = String(timestamp.getMinutes()).padStart(2, '0');
+
+        // Форматирование времени
+        const formattedTime = `${hours}:${minutes}`;
+
+        const senderUsername = senderId === parseInt(requestUser) ? 'you' : senderName
+
+        messageElement.innerHTML = `
+            <strong>${senderUsername}:</strong> ${content} <br>
+            <small>${formattedTime}</small>
+        `;
+        return messageElement;
+    }
+
+    // Загружает страницу истории (от новых к старым) и добавляет её в начало списка
+    function loadHistoryPage(cursor) {
+        const url = cursor ? `${historyApiUrl}?cursor=${encodeURIComponent(cursor)}` : historyApiUrl;
+        fetch(url)
+        .then(response => response.json())
+        .then(page => {
+            if (loadEarlierButton.parentNode) {
+                messageList.removeChild(loadEarlierButton);
+            }
+
+            if (!cursor) {
+                // Сокет открывается после загрузки истории, чтобы не потерять сообщения между запросами
+                lastSeenId = page.results.length > 0 ? page.results[0].id : 0;
+                connectSocket();
+            }
+
+            if (!cursor && page.results.length === 0) {
+                const noMessages = document.createElement('p');
+                noMessages.textContent = 'No messages';
+                noMessages.classList.add('text-center');
+                messageList.appendChild(noMessages);
+                return;
+            }
+
+            const previousHeight = messageList.scrollHeight;
+            page.results.forEach(function(message) {
+                renderedIds.add(message.id);
+                messageList.prepend(createMessageElement(
+                    message.sender, message.sender_username, message.content, message.timestamp
+                ));
+            });
+
+            nextHistoryCursor = page.next_cursor;
+            if (nextHistoryCursor) {
+                messageList.prepend(loadEarlierButton);
+            }
+
+            if (cursor) {
+                messageList.scrollTop = messageList.scrollHeight - previousHeight;
+            } else {
+                messageList.scrollTop = messageList.scrollHeight;
+                markChatAsRead();
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching chat history:', error);
+            if (!cursor && chatSocket === null) {
+                connectSocket();
+            }
+        });
+    }
+
+    // Открывает сокет, досылая сообщения после последнего полученного id
+    function connectSocket() {
+        const url = lastSeenId !== null ? `${socketUrl}?since=${lastSeenId}` : socketUrl;
+        chatSocket = new WebSocket(url);
+        chatSocket.onopen = function() {
+            reconnectAttempts = 0;
+        };
+        chatSocket.onmessage = handleSocketMessage;
+        chatSocket.onclose = function() {
+            // Переподключение с экспоненциальной задержкой
+            const delay = Math.min(30000, 1000 * 2 ** reconnectAttempts) + Math.random() * 1000;
+            reconnectAttempts += 1;
+            console.error(`Chat socket closed, reconnecting in ${Math.round(delay)} ms`);
+            setTimeout(connectSocket, delay);
+        };
+    }
+
+    function rememberMessageId(id) {
+        renderedIds.add(id);
+        lastSeenId = lastSeenId === null ? id : Math.max(lastSeenId, id);
+    }
+
+    // Отмечаем сообщения чата прочитанными
+    function markChatAsRead() {
+        fetch(readApiUrl, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrfToken
+            }
+        })
+        .catch(error => {
+            console.error('Error marking chat as read:', error);
+        });
+    }
+
+    loadEarlierButton.addEventListener('click', function() {
+        loadHistoryPage(nextHistoryCursor);
+    });
 
 
     // Запрос для получения прошлых сообщений чата
@@ -47,92 +176,98 @@ document.addEventListener('DOMContentLoaded', function() {
 
         userInfo.prepend(chatName);
 
-        const messages = data.detail.messages_of_chat;
-
-        if (messages.length === 0) {
-            const noMessages = document.createElement('p');
-            noMessages.textContent = 'No messages';
-            noMessages.classList.add('text-center');
-            messageList.appendChild(noMessages);
-        } else {
-            // Добавляем каждое сообщение в список
-            messages.forEach(function(message) {
-                const messageElement = document.createElement('div');
-                messageElement.classList.add('message-container');
-                messageElement.classList.add(message.sender === parseInt(requestUser) ? 'message-sender' : 'message-receiver'); // Выравнивание
-            
-                // Преобразование timestamp в объект Date
-                const timestamp = new Date(message.timestamp);
-                
-                // Получение часов и минут
-                const hours = String(timestamp.getHours()).padStart(2, '0'); // Форматирование: 01, 02, ..., 10, 11, 12
-                const minutes = String(timestamp.getMinutes()).padStart(2, '0');
-            
-                // Форматирование времени
-                const formattedTime = `${hours}:${minutes}`;
-
-                const  senderUsername = message.sender === parseInt(requestUser) ? 'you' : message.sender_username
-                
-                messageElement.innerHTML = `
-                    <strong>${senderUsername}:</strong> ${message.content} <br>
-                    <small>${formattedTime}</small>
-                `;
-                messageList.appendChild(messageElement);
-            });
-        }
+        loadHistoryPage(null);
     })
     .catch(error => {
         console.error('Error fetching chat details:', error);
     });
 
     // Обрабатываем входящие сообщения через WebSocket
-    chatSocket.onmessage = function(e) {
+    function handleSocketMessage(e) {
         const data = JSON.parse(e.data);
 
-        const noMessagesElement = messageList.querySelector('p.text-center');
-        if (noMessagesElement) {
-            messageList.removeChild(noMessagesElement);
+        // События больших групп приходят пачкой в одном кадре
+        if (Array.isArray(data)) {
+            data.forEach(handleSocketFrame);
+        } else {
+            handleSocketFrame(data);
         }
-        
-        const messageElement = document.createElement('div');
-        messageElement.classList.add('message-container');
-        messageElement.classList.add(data.user_id === parseInt(requestUser) ? 'message-sender' : 'message-receiver'); // Выравнивание
+    }
 
-        const timestamp = new Date(data.timestamp);
+    function handleSocketFrame(data) {
 
-        const hours = String(timestamp.getHours()).padStart(2, '0'); // Форматирование: 01, 02, ..., 10, 11, 12
-        const minutes = String(timestamp.getMinutes()).padStart(2, '0');
+        // Подтверждение сохранения сообщения из буфера не отображается
+        if (data.type === 'message_persisted') {
+            rememberMessageId(data.id);
+            return;
+        }
 
-        const formattedTime = `${hours}:${minutes}`;
+        // Сообщение из буфера не сохранилось: убираем уже показанное
+        if (data.type === 'message_failed') {
+            const failedElement = messageList.querySelector(`[data-temp-id="${data.temp_id}"]`);
+            if (failedElement) {
+                messageList.removeChild(failedElement);
+            }
+            return;
+        }
 
-        const senderUsername = data.user_id === parseInt(requestUser) ? 'you' : data.username
+        // Чат удалён: больше не переподключаемся
+        if (data.type === 'chat_deleted') {
+            chatSocket.onclose = null;
+            window.location.href = window.CHATS_LIST_URL;
+            return;
+        }
 
-        messageElement.innerHTML = `
-            <strong>${senderUsername}:</strong> ${data.message} <br>
-            <small>${formattedTime}</small>
-        `;
-        messageList.appendChild(messageElement);
-    };
-
-    chatSocket.onclose = function(e) {
-        console.error('Chat socket closed unexpectedly');
-    };
-
-    chatSocket.onopen = e => {
-        // Обработка отправки сообщений
-        const form = document.getElementById('sendMessageForm');
-        form.addEventListener('submit', function(e) {
-            e.preventDefault();
-            const message = messageInput.value;
-
-            if (message.trim() !== '') {
-                chatSocket.send(JSON.stringify({
-                    'message': message
-                }));
-                messageInput.value = ''; // Очищаем поле ввода после отправки
+        // Превышен лимит или клиент не успевал читать: после переподключения
+        // сокет досылает пропущенное с lastSeenId
+        if (data.type === 'error' || data.type === 'overflow') {
+            console.error('Chat socket:', data.error || data.type);
+            return;
+        }
+
+        if (data.type === 'replay_done') {
+            if (data.truncated) {
+                // Пропущено слишком много сообщений, загружаем чат заново
+                window.location.reload();
             }
-        });
-    };
+            return;
+        }
+
+        if (data.id !== null) {
+            if (renderedIds.has(data.id)) {
+                return;
+            }
+            rememberMessageId(data.id);
+        }
+
+        const noMessagesElement = messageList.querySelector('p.text-center');
+        if (noMessagesElement) {
+            messageList.removeChild(noMessagesElement);
+        }
+        
+        const messageElement = createMessageElement(data.user_id, data.username, data.message, data.timestamp);
+        if (data.temp_id) {
+            messageElement.dataset.tempId = data.temp_id;
+        }
+        messageList.appendChild(messageElement);
+        markChatAsRead();
+    }
+
+    // Обработка отправки сообщений
+    const form = document.getElementById('sendMessageForm');
+    form.addEventListener('submit', function(e) {
+        e.preventDefault();
+        const message = messageInput.value;
+
+        if (message.trim() !== '' && chatSocket !== null && chatSocket.readyState === WebSocket.OPEN) {
+            chatSocket.send(JSON.stringify({
+                'message': message,
+                'client_message_id': crypto.randomUUID()
+            }));
+            messageInput.value = ''; // Очищаем поле ввода после отправки
+            toggleSendButton();
+        }
+    });
 
     // Функция для активации/деактивации кнопки отправки сообщения
     function toggleSendButton() {
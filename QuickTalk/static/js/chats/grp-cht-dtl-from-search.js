@@ -9,7 +9,7 @@ document.addEventListener('DOMContentLoaded', function () {
         return;
     }
 
-    const apiUrl = `/api/chats/detail-chat/${chatId}/`;
+    const apiUrl = `/api/chats/detail-chat/${chatId}/?include_messages=false`;
 
     fetch(apiUrl)
     .then(response => {
@@ -13,8 +13,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Очищаем предыдущие результаты
                 searchResults.innerHTML = '';
                 
-                if (data.length > 0) {
-                    data.forEach(chat => {
+                if (data.results.length > 0) {
+                    data.results.forEach(chat => {
                         const chatItem = document.createElement('a');
                         chatItem.href = window.DETAIL_CHAT;  // путь к чату
                         chatItem.className = 'btn btn-primary btn-lg mb-3 d-flex flex-column justify-content-center';
@@ -25,10 +25,10 @@ document.addEventListener('DOMContentLoaded', function() {
                         chatItem.innerHTML = `
                             <div class="d-flex align-items-center">
                                 <div class="d-flex flex-column">
-                                    <span class="text-truncate" style="max-width: 100%; overflow: hidden; text-overflow: ellipsis;">${chat.chat_name}</span>
+                                    <span class="text-truncate" style="max-width: 100%; overflow: hidden; text-overflow: ellipsis;">${chat.name}</span>
                                     <small class="text-white-50" style="margin-top: auto;">
                                         <i class="fa-solid fa-people-group"></i>
-                                        ${chat.type}
+                                        ${chat.member_count} members
                                     </small>
                                 </div>
                             </div>
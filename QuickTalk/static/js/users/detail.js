@@ -65,11 +65,8 @@ document.addEventListener('DOMContentLoaded', function () {
                     body: JSON.stringify(data)
                 })
                 .then(response => {
-                    if (response.status === 400) {
-                        alert("Chat already exists. Redirecting...");
-                        // Логика для перенаправления на уже существующий чат
-                        window.location.href = window.LIST_API_CHATS;
-                    } else if (!response.ok) {
+                    // 200 - чат уже существует, 201 - создан новый
+                    if (!response.ok) {
                         throw new Error('Failed to create chat');
                     }
                     return response.json();
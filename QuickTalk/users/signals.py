@@ -1,5 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from config.response_cache import bump_response_version
 from .models import CustomUser
 import random
 import string
@@ -17,3 +18,9 @@ def add_avatar_and_username(instance, created, **kwargs):
         return
     instance.username = generate_username()
     instance.save(update_fields=['username'])
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def bump_user_version(instance, **kwargs):
+    bump_response_version('user', instance.pk)
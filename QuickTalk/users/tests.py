@@ -1,3 +1,72 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from .models import CustomUser
+from config.response_cache import response_cache
 
-# Create your tests here.
+
+class UsersQueryBudgetTests(TestCase):
+    """
+    Pins the number of queries for every endpoint in users.urls.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='+12025550100', password='pass12345')
+        cls.other = CustomUser.objects.create_user(phone_number='+12025550101', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.client = APIClient()
+
+    def test_register(self):
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                reverse('api-register'),
+                {'phone_number': '+12025550102', 'password': 'pass12345', 'password2': 'pass12345'}
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse('api-login'),
+                {'phone_number': '+12025550100', 'password': 'pass12345'}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('api-logout'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_user(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('api-update-user', kwargs={'pk': self.user.pk})
+        with self.assertNumQueries(3):
+            response = self.client.put(url, {'username': 'renamed'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_user(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api-search-user'), {'query': '+12025550101'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_user(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('api-detail-user', kwargs={'pk': self.other.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Первый ответ заводит счётчик версии, второй попадает в кэш
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.username = 'renamed'
+            self.other.save()
+        self.assertEqual(self.client.get(url).data['detail']['username'], 'renamed')
@@ -14,6 +14,7 @@ from .serializers import (
 from django.contrib.auth import login, logout
 from .permissions import IsOwner
 from .models import CustomUser
+from config.response_cache import response_cache, get_response_version
 from phonenumber_field.serializerfields import PhoneNumberField
 
 
@@ -104,6 +105,7 @@ class CustomUserUpdateAPIView(APIView):
 class CustomUserDetailAPIView(APIView):
     """
     Retrieves user details by ID.
+    Responses are cached per user version, see config.response_cache.
     """
     permission_classes = [IsAuthenticated]
 
@@ -111,11 +113,20 @@ class CustomUserDetailAPIView(APIView):
         pk = kwargs.get("pk")
         if not pk:
             return Response({"error": _("Method GET not allowed")}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
-        try:
-            instance = CustomUser.objects.get(pk=pk)
-            serializer = CustomUserSerializer(instance).data
-        except CustomUser.DoesNotExist:
-            return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
-        if not serializer['avatar']:
-            serializer['avatar'] = '/static/default_avatar/quicktalk_base-avatar.jpg'
+        version = get_response_version('user', pk, seed=False)
+        cache_key = ('user-detail', pk, version)
+        serializer = response_cache.get(cache_key) if version is not None else None
+        if serializer is None:
+            try:
+                instance = CustomUser.objects.get(pk=pk)
+                serializer = CustomUserSerializer(instance).data
+            except CustomUser.DoesNotExist:
+                return Response({"error": _("Object does not exist.")}, status=status.HTTP_404_NOT_FOUND)
+            if not serializer['avatar']:
+                serializer['avatar'] = '/static/default_avatar/quicktalk_base-avatar.jpg'
+            if version is None:
+                # Счётчик заводим только для существующего пользователя, ответ не кэшируем
+                get_response_version('user', pk)
+                return Response({'detail': serializer})
+            response_cache.set(cache_key, serializer)
         return Response({'detail': serializer})